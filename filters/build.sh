@@ -5,33 +5,42 @@ filters_prefix=./filters
 main() {
   local filter_options=( "$@" )
   if [[ ${#filter_options} -eq 0 ]] || [[ "${filter_options[0]}" == "ALL" ]]; then
-    readarray filter_options < <("${filters_prefix}"/list.sh)
+    readarray -t filter_options < <("${filters_prefix}"/list.sh)
     echo "${#filter_options[@]}"
   fi
+  local leaguestart_options=()
+  local endgame_options=()
   for config_file in "${filter_options[@]}"; do
-    filter_dirname="$(dirname "${config_file}")"
-    filter_basename="$(basename "$filter_dirname")"
-    options_basename="$(basename "${config_file}")"
-    options_name="${options_basename%*.config.json}"
-    echo "building ${options_name}..."
-    extra_args=()
+    filter_basename="$(basename "$(dirname "${config_file}")")"
     if [[ "$filter_basename" == "leaguestart" ]]; then
-      extra_args+=( --no-insights )
-      preset="default"
+      leaguestart_options+=( "${config_file}" )
     else
-      preset="endgame"
+      endgame_options+=( "${config_file}" )
     fi
-    wraeblast render_filter \
+  done
+  # Each batch loads economy data once for all of its filters
+  local status=0
+  if [[ ${#leaguestart_options[@]} -gt 0 ]]; then
+    wraeblast render_batch \
+      --league "${league}" \
+      --preset default \
+      --keep-intermediate \
+      --no-insights \
+      --output-directory output \
+      --jobs 0 \
+      "${leaguestart_options[@]}" || status=$?
+  fi
+  if [[ ${#endgame_options[@]} -gt 0 ]]; then
+    wraeblast render_batch \
       --league "${league}" \
-      --preset "$preset" \
+      --preset endgame \
       --keep-intermediate \
       --store-path s3://wraeblast-data/${league}.h5 \
-      --output-directory output/"${filter_basename}" \
-      --options-file "$config_file" \
-      --output "WB-{league_short}-${options_name}.filter" \
-      "${extra_args[@]}" \
-      "${filters_prefix}"/"${filter_basename}"/"${filter_basename}.yaml.j2"
-  done
+      --output-directory output \
+      --jobs 0 \
+      "${endgame_options[@]}" || status=$?
+  fi
+  return $status
 }
 
 main "$@"
@@ -0,0 +1,314 @@
+import json
+import pathlib
+import random
+from typing import Any
+
+import pytest
+
+from wraeblast import insights, replay
+
+
+RECORDED_LEAGUE = "Replay"
+
+currency_names = [
+    "Chaos Orb",
+    "Exalted Orb",
+    "Divine Orb",
+    "Mirror of Kalandra",
+    "Orb of Alteration",
+    "Orb of Annulment",
+    "Orb of Binding",
+    "Orb of Horizons",
+    "Orb of Transmutation",
+    "Harbinger's Orb",
+    "Engineer's Orb",
+    "Ancient Orb",
+    "Regal Orb",
+    "Chromatic Orb",
+]
+fragment_names = [
+    "Sacrifice at Dawn",
+    "Mortal Grief",
+    "Fragment of the Hydra",
+    "Chayula's Breachstone",
+    "Splinter of Xoph",
+    "Simulacrum Splinter",
+]
+base_type_names = [
+    "Vaal Regalia",
+    "Hubris Circlet",
+    "Two-Toned Boots",
+    "Crystal Belt",
+    "Stygian Vise",
+    "Opal Ring",
+]
+cluster_jewel_passives = [
+    ("12% increased Fire Damage", "Large Cluster Jewel", 8),
+    ("12% increased Fire Damage", "Large Cluster Jewel", 12),
+    ("Minions deal 10% increased Damage", "Medium Cluster Jewel", 4),
+    ("6% increased maximum Life", "Small Cluster Jewel", 2),
+]
+skill_gem_names = [
+    "Arc",
+    "Anomalous Arc",
+    "Divergent Arc",
+    "Phantasmal Cyclone",
+    "Empower Support",
+    "Enlighten Support",
+]
+influences = ["", "shaper", "elder", "crusader", "hunter-warlord"]
+map_tiers = [("Tower", 14), ("Strand", 3), ("Dunes", 9), ("Burial", 16)]
+
+
+def _currency_line(rng: random.Random, index: int, name: str) -> dict:
+    chaos_equivalent = {
+        "Chaos Orb": 1.0,
+        "Exalted Orb": 150.0,
+        "Mirror of Kalandra": 30_000.0,
+    }.get(name, round(rng.uniform(0.05, 200), 2))
+    return {
+        "currencyTypeName": name,
+        "pay": {
+            "id": float(index),
+            "league_id": 1.0,
+            "pay_currency_id": float(index + 1),
+            "get_currency_id": 1.0,
+            "sample_time_utc": "2022-02-06T00:00:00Z",
+            "count": float(rng.randint(1, 100)),
+            "value": 1 / chaos_equivalent,
+            "data_point_count": 1,
+            "includes_secondary": True,
+            "listing_count": rng.randint(1, 500),
+        },
+        "receive": {
+            "id": index,
+            "get_currency_id": index + 1,
+            "value": chaos_equivalent,
+        },
+        "paySparkLine": {"data": [0.0], "totalChange": 0.0},
+        "receiveSparkLine": {"data": [0.0], "totalChange": 0.0},
+        "chaosEquivalent": chaos_equivalent,
+        "detailsId": name.lower().replace(" ", "-").replace("'", ""),
+    }
+
+
+def _item_line(
+    rng: random.Random,
+    index: int,
+    name: str,
+    **extra: Any,
+) -> dict:
+    chaos_value = round(rng.lognormvariate(1.5, 2), 2)
+    line = {
+        "id": index,
+        "name": name,
+        "icon": "https://web.poecdn.com/image/icon.png",
+        "itemClass": 5,
+        "sparkline": {
+            "data": [] if index % 17 == 16 else [0.0, 1.5],
+            "totalChange": 1.5,
+        },
+        "lowConfidenceSparkline": {"data": [0.0], "totalChange": 0.0},
+        "implicitModifiers": [],
+        "explicitModifiers": [],
+        "flavourText": "",
+        "chaosValue": chaos_value,
+        "exaltedValue": chaos_value / 150,
+        "count": rng.randint(1, 200),
+        "detailsId": name.lower().replace(" ", "-").replace("'", ""),
+        "tradeInfo": [],
+        "listingCount": rng.randint(1, 200),
+    }
+    line.update(extra)
+    return line
+
+
+def _overview_lines(
+    rng: random.Random,
+    type_: insights.InsightsType,
+) -> list[dict]:
+    if type_ is insights.CurrencyType.CURRENCY:
+        return [
+            _currency_line(rng, i, name)
+            for i, name in enumerate(currency_names)
+        ]
+    elif type_ is insights.CurrencyType.FRAGMENT:
+        return [
+            _currency_line(rng, i, name)
+            for i, name in enumerate(fragment_names)
+        ]
+    elif type_ is insights.ItemType.BASE_TYPE:
+        lines = []
+        for name in base_type_names:
+            for ilvl in (82, 86):
+                for influence in influences:
+                    details_id = "-".join(
+                        filter(None, (name.lower(), str(ilvl), influence))
+                    )
+                    lines.append(
+                        _item_line(
+                            rng,
+                            len(lines),
+                            name,
+                            baseType=name,
+                            levelRequired=68,
+                            itemLevel=ilvl,
+                            variant=(
+                                influence.replace("-", "/").title()
+                                if influence
+                                else None
+                            ),
+                            detailsId=details_id.replace(" ", "-"),
+                        )
+                    )
+        return lines
+    elif type_ is insights.ItemType.CLUSTER_JEWEL:
+        return [
+            _item_line(
+                rng,
+                i,
+                name,
+                baseType=base_type,
+                levelRequired=54,
+                itemLevel=84,
+                variant=f"{passives} passives",
+                tradeInfo=[
+                    {
+                        "mod": "enchant.stat_3086156145",
+                        "min": passives,
+                        "max": passives,
+                    },
+                ],
+            )
+            for i, (name, base_type, passives) in enumerate(
+                cluster_jewel_passives
+            )
+        ]
+    elif type_ is insights.ItemType.SKILL_GEM:
+        return [
+            _item_line(
+                rng,
+                i,
+                name,
+                gemLevel=float(level),
+                gemQuality=20.0,
+                variant=f"{level}/20",
+            )
+            for i, (name, level) in enumerate(
+                (name, level) for name in skill_gem_names for level in (1, 20)
+            )
+        ]
+    elif type_ is insights.ItemType.MAP:
+        return [
+            _item_line(rng, i, f"{name} Map", mapTier=float(tier))
+            for i, (name, tier) in enumerate(map_tiers)
+        ]
+    elif type_ is insights.ItemType.BLIGHTED_MAP:
+        return [
+            _item_line(
+                rng,
+                i,
+                f"{'Blight-ravaged' if i % 2 else 'Blighted'} {name} Map",
+                mapTier=float(tier),
+            )
+            for i, (name, tier) in enumerate(map_tiers)
+        ]
+    elif type_ is insights.ItemType.UNIQUE_MAP:
+        return [
+            _item_line(
+                rng,
+                i,
+                f"{type_.value} {i}",
+                baseType=f"{name} Map",
+                mapTier=float(tier),
+            )
+            for i, (name, tier) in enumerate(map_tiers)
+        ]
+    elif type_.value.startswith("Unique"):
+        return [
+            _item_line(
+                rng,
+                i,
+                f"{'Scourged ' if i % 3 == 2 else ''}{type_.value} {i}",
+                baseType="Leather Belt",
+                levelRequired=8.0,
+                links=6.0 if i % 4 == 0 else None,
+            )
+            for i in range(12)
+        ]
+    return [
+        _item_line(rng, i, f"{type_.value} {i}", stackSize=10.0)
+        for i in range(24)
+    ]
+
+
+def _history_points(
+    rng: random.Random,
+    chaos_equivalent: float,
+    days: int,
+) -> dict:
+    values = [chaos_equivalent * rng.uniform(0.8, 1.2) for _ in range(days)]
+    return {
+        "payCurrencyGraphData": [
+            {"count": rng.randint(1, 100), "value": 1 / v, "daysAgo": i}
+            for i, v in enumerate(values)
+            if i % 5 != 3
+        ],
+        "receiveCurrencyGraphData": [
+            {"count": rng.randint(1, 100), "value": v, "daysAgo": i}
+            for i, v in enumerate(values)
+        ],
+    }
+
+
+def write_recordings(
+    path: pathlib.Path,
+    league: str,
+    seed: int = 0,
+    history_days: int = 30,
+) -> None:
+    """Write synthetic poe.ninja responses in the replay layout."""
+    rng = random.Random(seed)
+    for type_ in insights.get_all_insights_types():
+        lines = _overview_lines(rng, type_)
+        dest = replay.get_recording_path(path, league, type_)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.write_text(json.dumps({"lines": lines}))
+        if type_ not in insights.CurrencyType:
+            continue
+        for line in lines:
+            dest = replay.get_recording_path(
+                path,
+                league,
+                type_,
+                currency_id=int(line["pay"]["pay_currency_id"]),
+            )
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            dest.write_text(
+                json.dumps(
+                    _history_points(
+                        rng,
+                        line["chaosEquivalent"],
+                        history_days,
+                    )
+                )
+            )
+
+
+@pytest.fixture(scope="session")
+def ninja_recordings(tmp_path_factory) -> pathlib.Path:
+    path = tmp_path_factory.mktemp("recordings")
+    write_recordings(path, RECORDED_LEAGUE)
+    return path
+
+
+@pytest.fixture(scope="session")
+def recorded_league() -> str:
+    return RECORDED_LEAGUE
+
+
+@pytest.fixture(autouse=True)
+def template_cache(tmp_path_factory, monkeypatch) -> pathlib.Path:
+    path = tmp_path_factory.getbasetemp() / "templates"
+    monkeypatch.setenv("WRAEBLAST_TEMPLATE_CACHE", str(path))
+    return path
@@ -1,13 +1,17 @@
 import asyncio
+import io
 import json
+import os
+import pathlib
+import shutil
 
 import pytest
 
-from wraeblast import insights
+from wraeblast import batch, insights, replay
 from wraeblast.filtering import elements
 from wraeblast.filtering.parsers import extended, standard
-from wraeblast.filtering.parsers.extended import config
-from wraeblast.filtering.serializers.standard import dumps
+from wraeblast.filtering.parsers.extended import config, env, sections, stream
+from wraeblast.filtering.serializers.standard import dump, dumps
 
 
 @pytest.fixture
@@ -17,11 +21,36 @@ def current_league() -> str:
 
 
 @pytest.fixture
-def filter_context(current_league: str) -> insights.ItemFilterContext:
+def filter_context(
+    current_league: str,
+    ninja_recordings: pathlib.Path,
+    recorded_league: str,
+    tmp_path: pathlib.Path,
+) -> insights.ItemFilterContext:
+    """Filter context synced from recorded responses.
+
+    Set ``WRAEBLAST_RECORDINGS`` to a directory recorded with
+    ``wraeblast record_insights`` to replay real data for the current
+    league, rather than the synthetic recordings.
+
+    """
+
+    async def sync() -> insights.ItemFilterContext:
+        async with replay.NinjaReplayServer(recordings) as server:
+            async with insights.NinjaSession(server.base_url) as session:
+                return await insights.initialize_filter_context(
+                    league=league,
+                    store=store,
+                    session=session,
+                )
+
+    recordings = os.getenv("WRAEBLAST_RECORDINGS")
+    league = current_league
+    if recordings is None:
+        recordings, league = str(ninja_recordings), recorded_league
+    store = insights._create_store(str(tmp_path / "insights.h5"))
     loop = asyncio.get_event_loop()
-    return loop.run_until_complete(
-        insights.initialize_filter_context(league=current_league),
-    )
+    return loop.run_until_complete(sync())
 
 
 @pytest.fixture
@@ -92,3 +121,265 @@ def test_loads_extended_filter(extended_filter: elements.ItemFilter):
 def test_dumps_extended_filter(extended_filter):
     s = dumps(extended_filter)
     ...
+
+
+@pytest.mark.parametrize(
+    "workers,streaming", [(1, False), (2, False), (1, True)]
+)
+def test_render_batch(
+    filter_context, extended_filter, tmp_path, workers, streaming
+):
+    broken = tmp_path / "trade" / "trade-broken.config.json"
+    broken.parent.mkdir()
+    broken.write_text("{")
+    jobs = batch.create_jobs(
+        batch.expand_config_paths(
+            [
+                "./filters/trade/trade-QU4-agGrnYl_r.config.json",
+                str(tmp_path / "*" / "*.config.json"),
+                "./filters/trade/trade-missing.config.json",
+            ]
+        ),
+        output_directory=tmp_path / "output",
+        template="./filters/trade/trade.yaml.j2",
+        keep_intermediate=True,
+        league_short="Rep",
+    )
+    assert [job.name for job in jobs] == [
+        "trade-QU4-agGrnYl_r",
+        "trade-broken",
+        "trade-missing",
+    ]
+    results = list(
+        batch.render_batch(
+            jobs,
+            ctx=filter_context,
+            workers=workers,
+            streaming=streaming,
+        )
+    )
+    assert [r.ok for r in results] == [True, False, False]
+    assert results[1].error.startswith("JSONDecodeError")
+    output = tmp_path / "output/trade/WB-Rep-trade-QU4-agGrnYl_r.filter"
+    assert results[0].job.output == output
+    assert output.read_text() == dumps(extended_filter)
+    assert output.with_suffix(".yaml").exists()
+    assert not list(output.parent.glob(".*"))
+
+
+def test_section_cache(filter_context, filter_options, tmp_path):
+    def render(ctx, options, section_cache=None) -> str:
+        return extended.render(
+            template,
+            ctx=ctx,
+            options=options,
+            section_cache=section_cache,
+        )
+
+    with open("./filters/trade/trade.yaml.j2") as f:
+        template = f.read()
+    cache = sections.SectionCache(tmp_path / "sections")
+    expected = render(filter_context, filter_options)
+    assert render(filter_context, filter_options, cache) == expected
+    count = cache.stats["miss"]
+
+    # Sections are shared through the cache directory
+    cache = sections.SectionCache(tmp_path / "sections")
+    assert render(filter_context, filter_options, cache) == expected
+    assert cache.stats == {"hit": count}
+
+    # Only sections reading changed data or options render again
+    filter_context.load_all()
+    data = dict(filter_context.data)
+    data["maps"] = data["maps"].assign(
+        chaos_value=data["maps"]["chaos_value"] * 2,
+    )
+    ctx = insights.ItemFilterContext(data=data, validated=True)
+    options = filter_options.copy(deep=True)
+    options.colormaps["oils"] = options.colormaps["essences"]
+    cache.stats.clear()
+    assert render(ctx, options, cache) == render(ctx, options)
+    assert cache.stats == {"hit": count - 2, "miss": 2}
+
+    # Reads are recorded from context snapshots too
+    filter_context.save_snapshot(tmp_path / "before.pickle")
+    ctx.save_snapshot(tmp_path / "after.pickle")
+    cache = sections.SectionCache()
+    render(
+        insights.ItemFilterContext.load_snapshot(tmp_path / "before.pickle"),
+        filter_options,
+        cache,
+    )
+    ctx = insights.ItemFilterContext.load_snapshot(tmp_path / "after.pickle")
+    cache.stats.clear()
+    assert render(ctx, filter_options, cache) == render(ctx, filter_options)
+    assert cache.stats == {"hit": count - 1, "miss": 1}
+
+    # Sections are keyed by their template
+    source = '{% call section("a") %}{{ options.thresholds | length }}'
+    assert extended.render(source + "{% endcall %}", section_cache=cache) != (
+        extended.render(source + "!{% endcall %}", section_cache=cache)
+    )
+
+
+def test_section_cache_replays_tts(tmp_path, monkeypatch):
+    def tts_pyttsx3(s: str, dest: pathlib.Path, **kwargs) -> None:
+        dest.write_text(s)
+
+    monkeypatch.delenv("AWS_ACCESS_KEY_ID", raising=False)
+    monkeypatch.delenv("CI", raising=False)
+    monkeypatch.setattr(env, "tts_pyttsx3", tts_pyttsx3)
+    output = tmp_path / "output"
+    template = (
+        '{% call section("alerts") %}'
+        '{{ tts("quest item", output_path=output) }}'
+        "{% endcall %}"
+    )
+    for hits in (0, 1):
+        shutil.rmtree(output, ignore_errors=True)
+        # Sound files are written again when cached sections are used
+        cache = sections.SectionCache(tmp_path / "sections")
+        path = extended.render(
+            template,
+            globals={"output": str(output)},
+            section_cache=cache,
+        )
+        assert cache.stats["hit"] == hits
+        assert path.endswith(".mp3")
+        assert (output / path).read_text() == "quest item"
+
+
+def test_cached_tags_record_reads(filter_context):
+    thresholds = config.QuantileThresholdOptions(quantile="QU4")
+    tags = thresholds.get_tags(5.0, ctx=filter_context, ctx_key="maps")
+    with filter_context.record_dependencies() as keys:
+        assert (
+            thresholds.get_tags(5.0, ctx=filter_context, ctx_key="maps")
+            == tags
+        )
+    assert keys == {"maps"}
+
+
+def test_compile_template_bytecode_cache(tmp_path, monkeypatch):
+    source = "{{ (e * 10) | int }} {{ options.colormaps | length > 0 }}"
+    environment = extended.create_environment(
+        bytecode_cache_dir=tmp_path,
+    )
+    code = extended.compile_template(source, environment, name="t.j2")
+    assert len(list(tmp_path.iterdir())) == 1
+    assert extended.render(code, environment=environment) == "27 True"
+
+    # A new environment (e.g. in another process) loads the bytecode
+    extended.compile_template.cache_clear()
+    environment = extended.create_environment(
+        bytecode_cache_dir=tmp_path,
+    )
+    compile = environment.compile
+    monkeypatch.setattr(environment, "compile", None)
+    code = extended.compile_template(source, environment, name="t.j2")
+    assert extended.render(code, environment=environment) == "27 True"
+    # ...and recompiles it if the template changed
+    monkeypatch.setattr(environment, "compile", compile)
+    code = extended.compile_template(
+        source.replace("10", "20"),
+        environment,
+        name="t.j2",
+    )
+    assert extended.render(code, environment=environment) == "54 True"
+    assert extended.get_environment("filters") is extended.get_environment(
+        "./filters/"
+    )
+
+
+def test_jsonl_intermediate_matches_yaml(tmp_path):
+    yaml_template = """
+presets:
+  default:
+    tags:
+      hidden: [garbage]
+styles:
+  big:
+    actions:
+      SetFontSize: 45
+rules:
+  - name: Mirror
+    conditions:
+      BaseType: Mirror of Kalandra
+      StackSize: {'>=': 2}
+    style: big
+    tags: [currencies, QU4]
+  - name: Garbage
+    conditions:
+      BaseType: ["Scroll of Wisdom", "Portal Scroll"]
+    tags: [garbage]
+"""
+    jsonl_template = """{%- import "include/jsonl.j2" as jsonl -%}
+{{ jsonl.header() }}
+{{ jsonl.presets(default={"tags": {"hidden": ["garbage"]}}) }}
+{{ jsonl.styles(big={"actions": {"SetFontSize": 45}}) }}
+{{ jsonl.rule(
+    name="Mirror",
+    conditions={"BaseType": "Mirror of Kalandra", "StackSize": {">=": 2}},
+    style="big",
+    tags=["currencies", "QU4"],
+) }}
+{%- for base_types in [["Scroll of Wisdom", "Portal Scroll"]] %}
+{{ jsonl.rule(
+    name="Garbage",
+    conditions={"BaseType": base_types},
+    tags=["garbage"],
+) }}
+{%- endfor %}
+"""
+    rendered = extended.render(jsonl_template)
+    assert extended.get_intermediate_format(rendered) == "jsonl"
+    assert len(rendered.splitlines()) == 5
+    assert dumps(extended.loads(jsonl_template)) == dumps(
+        extended.loads(yaml_template)
+    )
+    assert dumps(extended.loads(rendered, pre_rendered=True)) == dumps(
+        extended.loads(yaml_template)
+    )
+    for template in (yaml_template, jsonl_template):
+        f = io.StringIO()
+        dump(stream.iter_rules(template), f)
+        assert f.getvalue() == dumps(extended.loads(yaml_template))
+    # Batches keep intermediates of *.jsonl.j2 templates as .jsonl
+    intermediate = batch.create_jobs(
+        [tmp_path / "jsonl" / "jsonl-Test.config.json"],
+        template=tmp_path / "jsonl" / "jsonl.jsonl.j2",
+        keep_intermediate=True,
+        league_short="Rep",
+    )[0].intermediate
+    assert intermediate.suffix == ".jsonl"
+
+
+@pytest.mark.parametrize("preset", ["default", "endgame"])
+def test_iter_rules_matches_loads(filter_context, filter_options, preset):
+    with open("./filters/trade/trade.yaml.j2") as f:
+        template = f.read()
+    item_filter = extended.loads(
+        template,
+        ctx=filter_context,
+        options=filter_options,
+    )
+    if preset != "default":
+        item_filter.apply_preset(preset_name=preset)
+    intermediate = io.StringIO()
+    output = io.StringIO()
+    dump(
+        stream.iter_rules(
+            template,
+            ctx=filter_context,
+            options=filter_options,
+            preset=preset,
+            intermediate=intermediate,
+        ),
+        output,
+    )
+    assert output.getvalue() == dumps(item_filter)
+    assert intermediate.getvalue() == extended.render(
+        template,
+        ctx=filter_context,
+        options=filter_options,
+    )
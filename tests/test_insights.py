@@ -0,0 +1,360 @@
+import asyncio
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from wraeblast import errors, insights, replay, storage
+from wraeblast.filtering.parsers.extended import config, env
+
+
+@pytest.mark.parametrize(
+    "type_",
+    insights.get_all_insights_types(),
+    ids=lambda t: t.value,
+)
+def test_decode_overview_matches_json_normalize(
+    ninja_recordings, recorded_league, type_
+):
+    body = replay.get_recording_path(
+        ninja_recordings,
+        recorded_league,
+        type_,
+    ).read_bytes()
+    decoded = insights.decode_overview(body)
+    normalized = insights.json_normalize(json.loads(body)["lines"])
+    assert set(decoded.columns) <= set(normalized.columns)
+    pd.testing.assert_frame_equal(
+        insights.transform_ninja_df(decoded),
+        insights.transform_ninja_df(normalized),
+    )
+
+
+def _read_overview(path, league, type_) -> pd.DataFrame:
+    return insights.decode_overview(
+        replay.get_recording_path(path, league, type_).read_bytes()
+    )
+
+
+def test_get_influences_matches_row_wise():
+    df = pd.DataFrame(
+        {
+            "name": [
+                "Vaal Regalia",
+                "Vaal Regalia",
+                "Two-Toned Boots",
+                "Two-Toned Boots",
+                "Opal Ring",
+                "Opal Ring",
+                "Opal Ring",
+            ],
+            "details_id": [
+                "vaal-regalia-86",
+                "vaal-regalia-86-shaper",
+                "two-toned-boots-82-hunter-warlord",
+                "two-toned-boots",
+                "opal-ring-86-unknown",
+                "opal-ring-eighty-shaper",
+                "opal-ring-84-elder-crusader-redeemer",
+            ],
+        },
+        index=[3, 5, 8, 13, 21, 34, 55],
+    )
+    expected = pd.Series(
+        [
+            "/".join(
+                i.value
+                for i in insights._parse_name_and_details_id(name, details_id)[
+                    1
+                ]
+            )
+            for name, details_id in zip(df["name"], df["details_id"])
+        ],
+        index=df.index,
+    )
+    pd.testing.assert_series_equal(
+        insights._get_influences(df["name"], df["details_id"]),
+        expected,
+    )
+
+
+@pytest.mark.parametrize(
+    "type_",
+    insights.get_all_insights_types(),
+    ids=lambda t: t.value,
+)
+def test_transform_ninja_df_matches_row_wise(
+    ninja_recordings, recorded_league, type_
+):
+    df = _read_overview(ninja_recordings, recorded_league, type_)
+    if "name" not in df.columns:
+        pytest.skip("not an item overview")
+    output = insights.transform_ninja_df(df.copy())
+    df = df.fillna(0).loc[output.index]
+    names = df["name"].map(
+        lambda s: s[s.find(" ") + 1 :]
+        if s.startswith(("Anomalous", "Divergent", "Phantasmal"))
+        else s
+    )
+    assert output["item_name"].tolist() == names.tolist()
+    assert output["alt_quality"].tolist() == [
+        s[: s.find(" ")] if s != n else "" for s, n in zip(df["name"], names)
+    ]
+    assert output["scourged"].tolist() == [
+        s.startswith("Scourged") for s in df["name"]
+    ]
+    assert output["influences"].tolist() == [
+        "/".join(
+            i.value
+            for i in insights._parse_name_and_details_id(name, details_id)[1]
+        )
+        for name, details_id in zip(df["name"], df["details_id"])
+    ]
+    if "map_tier" in df.columns:
+        assert output["uber_blight"].tolist() == [
+            s.startswith("Blight-ravaged") for s in df["name"]
+        ]
+    if "cluster_jewel_passives" in output.columns:
+        assert output["cluster_jewel_passives_max"].tolist() == [
+            [
+                ti
+                for ti in trade_info
+                if ti["mod"] == "enchant.stat_3086156145"
+            ][0]["max"]
+            for trade_info in df["trade_info"]
+        ]
+
+
+def test_overview_validated_by_schema_fingerprint(tmp_path):
+    store = insights._create_store(str(tmp_path / "insights.h5"))
+    key = insights._get_cache_key("Replay", insights.ItemType.MAP)
+    store.put(key, pd.DataFrame({"chaos_value": [1.0]}))
+    assert not insights.is_overview_validated(store, key)
+    for fingerprint, validated in (
+        (insights.overview_schema_fingerprint, True),
+        ("stale", False),
+    ):
+        insights.set_overview_metadata(
+            store,
+            key,
+            insights.OverviewMetadata(schema_fingerprint=fingerprint),
+        )
+        assert insights.is_overview_validated(store, key) is validated
+    store.close()
+
+
+@pytest.mark.parametrize("round_down_by", [0, 1, 5])
+@pytest.mark.parametrize("precision", [0, 2])
+def test_get_display_values_matches_get_display_value(
+    round_down_by, precision
+):
+    chaos_values = pd.Series(
+        [0.0, 0.4, 1.0, 3.5, 7.25, 149.99, 150.0, 151.0, 1234.5, 30000.0],
+        index=range(10, 20),
+    )
+    expected = pd.Series(
+        [
+            insights.get_display_value(
+                chaos_value=v,
+                exalted_exchange_value=150,
+                round_down_by=round_down_by,
+                precision=precision,
+            )
+            for v in chaos_values
+        ],
+        index=chaos_values.index,
+        dtype=object,
+    )
+    pd.testing.assert_series_equal(
+        insights.get_display_values(
+            chaos_values,
+            exalted_exchange_value=150,
+            round_down_by=round_down_by,
+            precision=precision,
+        ),
+        expected,
+    )
+
+
+def test_quantile_index_matches_linear_scan(ninja_recordings, recorded_league):
+    df = insights.transform_ninja_df(
+        _read_overview(
+            ninja_recordings,
+            recorded_league,
+            insights.ItemType.BASE_TYPE,
+        )
+    )
+    thresholds = insights.get_quantile_thresholds(df)
+    records = (
+        df.groupby(list(insights.quantiles.keys()), as_index=False)
+        .agg({"chaos_value": "min"})
+        .to_dict("records")
+    )
+    index = insights.QuantileIndex.from_dataframe(df)
+    min_chaos_values = [0.0, *df["chaos_value"].sample(20, random_state=0)]
+    min_chaos_values += [v + 0.001 for v in min_chaos_values]
+    min_chaos_values.append(df["chaos_value"].max() + 1)
+    for v in min_chaos_values:
+        expected_threshold = next(
+            (r for r in records if r["chaos_value"] >= v),
+            records[-1],
+        )
+        assert thresholds.get(v, clip=True) == expected_threshold
+        rows = df[df["chaos_value"] >= v]
+        expected_row = (
+            rows[rows["chaos_value"] == rows["chaos_value"].min()].iloc[0]
+            if len(rows)
+            else None
+        )
+        row = index.get(v)
+        if expected_row is None:
+            assert row is None
+        else:
+            assert row == {
+                **{q: expected_row[q] for q in insights.quantiles},
+                "chaos_value": expected_row["chaos_value"],
+            }
+    batch = thresholds.get_many(pd.Series(min_chaos_values), clip=True)
+    assert batch.to_dict("records") == [
+        thresholds.get(v, clip=True) for v in min_chaos_values
+    ]
+
+
+def test_quantile_index_keeps_integer_quantiles():
+    df = pd.DataFrame(
+        {"chaos_value": [0.5, 1.0, 5.0, 10.0]}
+        | {q: [0, 1, 2, 3] for q in insights.quantiles},
+    )
+    df.loc[0, "quartile"] = np.nan
+    index = insights.QuantileIndex.from_dataframe(df)
+    record = index.get(0.1)
+    assert record is not None
+    assert record["quartile"] == -1
+    assert all(type(record[q]) is int for q in insights.quantiles)
+    assert index.get(100) is None
+    batch = index.get_many(pd.Series([0.1, 7.0, 100.0]))
+    assert all(batch[q].dtype == "Int64" for q in insights.quantiles)
+    assert batch["quartile"].tolist() == [-1, 3, pd.NA]
+    assert np.isnan(batch.at[2, "chaos_value"])
+    assert str(batch.at[1, "decile"]) == "3"
+
+
+@pytest.mark.parametrize("n", [2, 3, 7, 99, 100, 101, 1234])
+def test_get_quantiles_matches_qcut(n):
+    chaos_values = pd.Series(
+        np.random.default_rng(n).lognormal(1.5, 2, n).round(1),
+        index=range(n, 2 * n),
+    )
+    ranks = chaos_values.rank(method="first", numeric_only=True)
+    expected = pd.DataFrame(
+        {
+            name: pd.qcut(
+                ranks,
+                q=scheme.bins,
+                labels=False,
+                precision=0,
+                duplicates="drop",
+            )
+            for name, scheme in insights.quantiles.items()
+        }
+    )
+    pd.testing.assert_frame_equal(
+        insights.get_quantiles(chaos_values),
+        expected,
+    )
+
+
+def test_register_quantile_scheme(monkeypatch):
+    monkeypatch.setattr(insights, "quantiles", dict(insights.quantiles))
+    insights.register_quantile_scheme("vigintile", "V", 20)
+    insights.register_quantile_scheme("log_bucket", "LB", 8, by="log")
+    with pytest.raises(ValueError):
+        insights.register_quantile_scheme("other", "V", 3)
+    assert insights.get_quantile_tuple("V19") == ("vigintile", 19)
+    assert insights.get_quantile_tuple("LB2") == ("log_bucket", 2)
+    assert insights.get_quantile_tuple("QU4") == ("quintile", 4)
+    assert env.get_quantile_threshold_tags("V18") == ["V18", "V19"]
+    df = insights.get_quantiles(pd.Series([1.0, 2.0, 4.0, 8.0, 256.0]))
+    assert df["log_bucket"].tolist() == [0, 0, 1, 2, 7]
+    assert df["vigintile"].max() == 19
+
+
+def test_log_quantiles_span_chaos_values():
+    scheme = insights.QuantileScheme(
+        name="log_bucket",
+        prefix="LB",
+        bins=4,
+        by="log",
+    )
+    chaos_values = pd.Series([10.0, 20.0, 40.0, np.nan, 0.0, 80.0, 160.0])
+    with np.errstate(divide="ignore"):
+        log_values = np.log(chaos_values.to_numpy())
+    bins = scheme.get_bins(chaos_values.rank().to_numpy(), log_values)
+    expected = [0, 0, 1, -1, -1, 2, 3]
+    np.testing.assert_array_equal(bins, expected)
+    assert bins.dtype == np.int64
+    assert not len(scheme.get_bins(np.array([]), np.array([])))
+    assert scheme.get_bins(np.array([np.nan]), np.array([np.nan])) == [-1]
+
+
+def test_log_quantile_tags_match_threshold_tags(monkeypatch):
+    monkeypatch.setattr(insights, "quantiles", dict(insights.quantiles))
+    insights.register_quantile_scheme("logbin", "L", 5, by="log")
+    chaos_values = pd.Series([0.0, 1.0, 2.0, 5.0, 10.0, 100.0])
+    with np.errstate(divide="ignore"):
+        df = insights.get_quantiles(chaos_values)
+    assert (df.dtypes == np.int64).all()
+    df["chaos_value"] = chaos_values
+    df["item_name"] = [f"Item {i}" for i in range(len(df))]
+    options = config.QuantileThresholdOptions(quantile="L2")
+    log_tags = []
+    for _, row in df.iterrows():
+        tags = options.get_tags(row)
+        for tag in tags:
+            assert env.get_quantile_threshold_tags(tag)[0] == tag
+        log_tags.append(next((t for t in tags if t.startswith("L")), None))
+    assert log_tags == [None, "L0", "L0", "L1", "L2", "L4"]
+
+
+def test_legacy_cache_layout_requires_resync():
+    store = storage.open_store("memory://")
+    store.put("i_Currency", pd.DataFrame({"chaos_value": [1.0]}))
+    loop = asyncio.get_event_loop()
+    with pytest.raises(errors.InsightsError, match="older version"):
+        loop.run_until_complete(
+            insights.initialize_insights_cache(
+                league="Standard",
+                store=store,
+                no_sync=True,
+                types=[insights.CurrencyType.CURRENCY],
+            )
+        )
+    with pytest.raises(errors.WraeblastError, match="incomplete"):
+        loop.run_until_complete(
+            insights.initialize_insights_cache(
+                league="Standard",
+                store=store,
+                no_sync=True,
+                types=[insights.ItemType.MAP],
+            )
+        )
+
+
+def test_compact_overview_roundtrips(ninja_recordings, recorded_league):
+    body = replay.get_recording_path(
+        ninja_recordings,
+        recorded_league,
+        insights.ItemType.SKILL_GEM,
+    ).read_bytes()
+    df = insights.ExtendedNinjaOverviewSchema.validate(
+        insights.transform_ninja_df(insights.decode_overview(body))
+    )
+    compacted = insights.compact_overview(df)
+    assert compacted["alt_quality"].dtype == "category"
+    assert compacted["percentile"].dtype == np.int8
+    assert compacted["gem_level"].dtype == np.float32
+    assert insights.get_memory_usage(compacted) < insights.get_memory_usage(df)
+    restored = compacted.astype(df.dtypes.to_dict())
+    pd.testing.assert_frame_equal(restored, df)
+    insights.ExtendedNinjaOverviewSchema.validate(restored)
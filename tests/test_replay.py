@@ -0,0 +1,303 @@
+import asyncio
+import collections
+import datetime
+import email.utils
+import pathlib
+
+import aiohttp
+import pandas as pd
+import pytest
+from conftest import write_recordings
+
+from wraeblast import insights, refresh, replay
+
+
+def test_replay_filter_context(ninja_recordings, recorded_league, tmp_path):
+    async def sync() -> insights.ItemFilterContext:
+        async with replay.NinjaReplayServer(ninja_recordings) as server:
+            async with insights.NinjaSession(server.base_url) as session:
+                return await insights.initialize_filter_context(
+                    league=recorded_league,
+                    store=store,
+                    session=session,
+                )
+
+    store = insights._create_store(str(tmp_path / "insights.h5"))
+    loop = asyncio.get_event_loop()
+    ctx = loop.run_until_complete(sync())
+    index = insights.get_cache_index(store, league=recorded_league)
+    assert all(
+        insights.is_overview_validated(store, key) for key in index["key"]
+    )
+    assert len(index) == len(insights.get_all_insights_types())
+    assert set(ctx.data) == {
+        t.pluralized_underscored_value
+        for t in insights.get_all_insights_types()
+    }
+    assert ctx.data.loaded == []
+    assert not ctx.data["base_types"].empty
+    # Post-processing base types needs the exalted value from currencies
+    assert ctx.data.loaded == ["currencies", "base_types"]
+    assert ctx.get_quantiles_for_value("maps", 0.0) is not None
+    assert "maps" in ctx.data.loaded
+    compacted = loop.run_until_complete(
+        insights.initialize_filter_context(
+            league=recorded_league,
+            store=store,
+            no_sync=True,
+            compact=True,
+        )
+    )
+    assert compacted.data["maps"]["influences"].dtype == "category"
+    pd.testing.assert_frame_equal(
+        compacted.data["maps"].astype(ctx.data["maps"].dtypes.to_dict()),
+        ctx.data["maps"],
+    )
+    memory_usage = compacted.get_memory_usage()
+    assert list(memory_usage.index) == compacted.data.loaded
+    assert (memory_usage["after"] < memory_usage["before"]).all()
+    store.close()
+
+
+def test_replay_conditional_refresh(
+    ninja_recordings, recorded_league, tmp_path
+):
+    async def sync(**kwargs) -> None:
+        async with insights.NinjaSession(server.base_url) as session:
+            await insights.initialize_insights_cache(
+                league=recorded_league,
+                store=store,
+                session=session,
+                types=[insights.ItemType.MAP],
+                **kwargs,
+            )
+
+    server = replay.NinjaReplayServer(ninja_recordings)
+    store = insights._create_store(str(tmp_path / "insights.h5"))
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(server.start())
+    try:
+        loop.run_until_complete(sync())
+        loop.run_until_complete(
+            sync(
+                refresh=True,
+                ttls={insights.ItemType.MAP: datetime.timedelta(0)},
+            )
+        )
+    finally:
+        loop.run_until_complete(server.stop())
+    index = insights.get_cache_index(store)
+    store.close()
+    assert server.stats[("ItemOverview", 200)] == 1
+    assert server.stats[("ItemOverview", 304)] == 1
+    assert index.iloc[0]["rows"] == len(
+        pd.read_json(
+            replay.get_recording_path(
+                ninja_recordings,
+                recorded_league,
+                insights.ItemType.MAP,
+            )
+        )
+    )
+
+
+def test_replay_if_modified_since(ninja_recordings, recorded_league):
+    async def get_statuses(*dates: str) -> list[int]:
+        async with replay.NinjaReplayServer(ninja_recordings) as server:
+            async with aiohttp.ClientSession() as session:
+                statuses = []
+                for date in dates:
+                    async with session.get(
+                        f"{server.base_url}ItemOverview",
+                        params={"league": recorded_league, "type": "Map"},
+                        headers={"If-Modified-Since": date},
+                    ) as response:
+                        statuses.append(response.status)
+                return statuses
+
+    mtime = (
+        replay.get_recording_path(
+            ninja_recordings,
+            recorded_league,
+            insights.ItemType.MAP,
+        )
+        .stat()
+        .st_mtime
+    )
+    loop = asyncio.get_event_loop()
+    assert loop.run_until_complete(
+        get_statuses(
+            email.utils.formatdate(mtime, usegmt=True),
+            email.utils.formatdate(mtime - 60, usegmt=True),
+            "not a date",
+        )
+    ) == [304, 200, 200]
+
+
+def test_replay_simulated_errors(ninja_recordings, recorded_league):
+    async def get_statuses() -> list[int]:
+        async with replay.NinjaReplayServer(
+            ninja_recordings,
+            error_rate=1.0,
+            ratelimits={"ItemOverview": (1, 150)},
+        ) as server:
+            async with aiohttp.ClientSession() as session:
+                statuses = []
+                for _ in range(2):
+                    async with session.get(
+                        f"{server.base_url}ItemOverview",
+                        params={"league": recorded_league, "type": "Map"},
+                    ) as response:
+                        statuses.append(response.status)
+                return statuses
+
+    loop = asyncio.get_event_loop()
+    assert loop.run_until_complete(get_statuses()) == [503, 429]
+
+
+def test_replay_context_snapshot(ninja_recordings, recorded_league, tmp_path):
+    async def sync(**kwargs) -> insights.ItemFilterContext:
+        async with replay.NinjaReplayServer(ninja_recordings) as server:
+            async with insights.NinjaSession(server.base_url) as session:
+                return await insights.initialize_filter_context(
+                    league=recorded_league,
+                    store=store,
+                    session=session,
+                    snapshot_dir=tmp_path / "snapshots",
+                    **kwargs,
+                )
+
+    store = insights._create_store(str(tmp_path / "insights.h5"))
+    loop = asyncio.get_event_loop()
+    ctx = loop.run_until_complete(sync())
+    snapshots = list((tmp_path / "snapshots").iterdir())
+    assert [p.name for p in snapshots] == [
+        insights.get_context_snapshot_path(
+            tmp_path,
+            recorded_league,
+            insights.get_data_version(store, recorded_league),
+        ).name
+    ]
+    # Contexts loaded with other columns keep snapshots of their own
+    loop.run_until_complete(sync(columns=["base_type"]))
+    assert len(list((tmp_path / "snapshots").iterdir())) == 2
+    loaded = loop.run_until_complete(sync())
+    assert (tmp_path / "snapshots" / snapshots[0].name).exists()
+    store.close()
+    assert loaded._exalted_value == ctx._exalted_value
+    assert loaded._quantile_thresholds == ctx._quantile_thresholds
+    for key, df in ctx.data.items():
+        pd.testing.assert_frame_equal(loaded.data[key], df)
+    assert loaded.get_display_value(300.0) == ctx.get_display_value(300.0)
+
+
+def test_replay_incremental_currency_history(
+    ninja_recordings, recorded_league, tmp_path
+):
+    async def sync(now: datetime.datetime) -> None:
+        # A new server per sync, as history requests are heavily rate
+        # limited per host
+        async with replay.NinjaReplayServer(ninja_recordings) as server:
+            async with insights.NinjaSession(server.base_url) as session:
+                await insights.sync_currency_history(
+                    league=recorded_league,
+                    store=store,
+                    types=[insights.CurrencyType.CURRENCY],
+                    item_names={"Exalted Orb", "Divine Orb"},
+                    session=session,
+                    now=now,
+                )
+
+    store = insights._create_store(str(tmp_path / "insights.h5"))
+    key = insights._get_history_key(
+        recorded_league,
+        insights.CurrencyType.CURRENCY,
+    )
+    now = datetime.datetime(2022, 2, 6, 12, tzinfo=datetime.timezone.utc)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(sync(now))
+    history = insights.load_currency_history(store, recorded_league)
+    assert set(history["item_name"]) == {"Exalted Orb", "Divine Orb"}
+    assert len(history) == 2 * 29
+    assert history["date"].max() == pd.Timestamp("2022-02-05")
+
+    # Up to date, so nothing is requested or appended
+    loop.run_until_complete(sync(now + datetime.timedelta(hours=6)))
+    assert len(store.get(key)) == 2 * 29
+
+    # Only the newly completed days are appended
+    loop.run_until_complete(sync(now + datetime.timedelta(days=2)))
+    history = insights.load_currency_history(store, recorded_league)
+    assert len(history) == 2 * 31
+    assert not history.duplicated(["date", "currency_id"]).any()
+
+    aggregates = insights.get_history_aggregates(history, window=7)
+    exalted = history[history["item_name"] == "Exalted Orb"]
+    assert aggregates.at["Exalted Orb", "rolling_median"] == (
+        exalted.sort_values("date")["chaos_value"].iloc[-7:].median()
+    )
+    assert aggregates.at["Exalted Orb", "volatility"] > 0
+    assert aggregates.at["Exalted Orb", "samples"] == 7
+    store.close()
+
+
+def test_refresh_publishes_snapshots(
+    ninja_recordings, recorded_league, tmp_path
+):
+    async def create_snapshot(**kwargs) -> pathlib.Path:
+        async with replay.NinjaReplayServer(ninja_recordings) as server:
+            async with insights.NinjaSession(server.base_url) as session:
+                path = await refresh.create_snapshot(
+                    data_dir=tmp_path,
+                    leagues=[recorded_league],
+                    session=session,
+                    types=[insights.ItemType.MAP],
+                    keep=1,
+                    **kwargs,
+                )
+        stats.update(server.stats)
+        return path
+
+    stats: collections.Counter = collections.Counter()
+    loop = asyncio.get_event_loop()
+    first = loop.run_until_complete(create_snapshot())
+    assert refresh.get_current_snapshot(tmp_path) == first
+    reader = refresh.open_current_snapshot(tmp_path)
+    second = loop.run_until_complete(
+        create_snapshot(ttls={insights.ItemType.MAP: datetime.timedelta(0)})
+    )
+    assert second != first
+    assert refresh.get_current_snapshot(tmp_path) == second
+    assert sorted(tmp_path.glob("insights-*")) == [second]
+    assert stats[("ItemOverview", 200)] == 1
+    assert stats[("ItemOverview", 304)] == 1
+
+    # Readers of a pruned snapshot are unaffected
+    assert len(insights.get_cache_index(reader, league=recorded_league)) == 1
+    reader.close()
+    with refresh.open_current_snapshot(tmp_path) as store:
+        index = insights.get_cache_index(store, league=recorded_league)
+        assert index.iloc[0]["type"] == insights.ItemType.MAP.value
+
+
+def test_refresh_snapshot_size_is_stable(recorded_league, tmp_path):
+    async def create_snapshot() -> pathlib.Path:
+        async with replay.NinjaReplayServer(recordings) as server:
+            async with insights.NinjaSession(server.base_url) as session:
+                return await refresh.create_snapshot(
+                    data_dir=tmp_path / "data",
+                    leagues=[recorded_league],
+                    session=session,
+                    ttls={t: datetime.timedelta(0) for t in types},
+                    types=types,
+                )
+
+    # Every overview changes, and so is replaced, at every refresh
+    types = [insights.ItemType.MAP, insights.ItemType.SKILL_GEM]
+    recordings = tmp_path / "recordings"
+    loop = asyncio.get_event_loop()
+    sizes = []
+    for i in range(4):
+        write_recordings(recordings, recorded_league, seed=i % 2)
+        sizes.append(loop.run_until_complete(create_snapshot()).stat().st_size)
+    assert sizes[3] == pytest.approx(sizes[1], rel=0.01)
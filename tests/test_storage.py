@@ -0,0 +1,147 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from wraeblast import errors, insights, replay, storage
+
+
+def _store_url(scheme: str, tmp_path) -> str:
+    if scheme == "parquet" and not storage.PYARROW_AVAILABLE:
+        pytest.skip("pyarrow is not installed")
+    return f"{scheme}://{tmp_path / scheme}"
+
+
+@pytest.fixture(params=list(storage.backends))
+def store_url(request, tmp_path) -> str:
+    return _store_url(request.param, tmp_path)
+
+
+def test_store_roundtrip(store_url):
+    key = "l_replay/i_Map"
+    df = pd.DataFrame(
+        {
+            "item_name": ["Tower Map", None, "Dunes Map"],
+            "chaos_value": [1.5, np.nan, 3.0],
+            "count": [1, 2, 3],
+            "is_uber_blight": [True, False, False],
+        }
+    )
+    history = pd.DataFrame(
+        {
+            "date": pd.to_datetime(["2022-02-01", "2022-02-02"]),
+            "currency_id": [1, 2],
+            "chaos_value": [150.0, 200.0],
+        }
+    ).set_index("date")
+    with storage.open_store(store_url) as store:
+        store.put(key, df)
+        assert store.get_metadata(key) is None
+        store.set_metadata(key, '{"rows": 3}')
+        store.append("l_replay/h_Currency", history.iloc[:1])
+        store.append("l_replay/h_Currency", history.iloc[1:])
+        pd.testing.assert_frame_equal(store.get(key), df)
+        assert store.keys() == ["l_replay/h_Currency", "l_replay/i_Map"]
+        assert f"/{key}" in store
+        assert "l_replay/i_Fossil" not in store
+        with pytest.raises(KeyError):
+            store.get("l_replay/i_Fossil")
+        with pytest.raises(KeyError):
+            store.set_metadata("l_replay/i_Fossil", "{}")
+        pd.testing.assert_frame_equal(
+            store.select(key, columns=["chaos_value", "missing"]),
+            df[["chaos_value"]],
+        )
+        if isinstance(store, storage.MemoryInsightsStore):
+            return
+    with storage.open_store(store_url, mode="r") as store:
+        assert store.get_metadata(key) == '{"rows": 3}'
+        pd.testing.assert_frame_equal(store.get(key), df)
+        pd.testing.assert_frame_equal(
+            store.select("l_replay/h_Currency", columns=["currency_id"]),
+            history[["currency_id"]],
+        )
+        with pytest.raises(errors.StorageError):
+            store.put(key, df)
+        with pytest.raises(errors.StorageError):
+            store.append("l_replay/h_Currency", history)
+        with pytest.raises(errors.StorageError):
+            store.set_metadata(key, "{}")
+        with pytest.raises(errors.StorageError):
+            store.remove(key)
+    with storage.open_store(store_url) as store:
+        store.remove(key)
+        assert store.keys() == ["l_replay/h_Currency"]
+
+
+def test_open_store_by_url(tmp_path):
+    path = tmp_path / "insights.h5"
+    with storage.open_store(str(path)) as store:
+        assert isinstance(store, storage.HDFInsightsStore)
+        assert store.url == f"hdf5://{path}"
+    with storage.open_store(f"sqlite://{tmp_path / 'insights.db'}") as store:
+        assert isinstance(store, storage.SQLiteInsightsStore)
+    with pytest.raises(errors.StorageError):
+        storage.open_store("s3://bucket/insights.h5")
+
+
+@pytest.mark.parametrize("scheme", ["hdf5", "sqlite", "parquet"])
+def test_replay_filter_context_with_backend(
+    scheme, ninja_recordings, recorded_league, tmp_path
+):
+    async def sync() -> insights.ItemFilterContext:
+        async with replay.NinjaReplayServer(ninja_recordings) as server:
+            async with insights.NinjaSession(server.base_url) as session:
+                return await insights.initialize_filter_context(
+                    league=recorded_league,
+                    store=store,
+                    session=session,
+                )
+
+    store = storage.open_store(_store_url(scheme, tmp_path))
+    loop = asyncio.get_event_loop()
+    ctx = loop.run_until_complete(sync())
+    index = insights.get_cache_index(store, league=recorded_league)
+    assert len(index) == len(insights.get_all_insights_types())
+    assert all(
+        insights.is_overview_validated(store, key) for key in index["key"]
+    )
+    assert insights.get_data_version(store, recorded_league) is not None
+    projected = loop.run_until_complete(
+        insights.initialize_filter_context(
+            league=recorded_league,
+            store=store,
+            no_sync=True,
+            columns=["base_type"],
+        )
+    )
+    assert not ctx.data["base_types"].empty
+    for key, df in projected.data.items():
+        columns = [
+            *insights.get_context_columns(["base_type"]),
+            "exalted_value",
+            "display_value",
+        ]
+        columns = [c for c in columns if c in ctx.data[key].columns]
+        assert sorted(df.columns) == sorted(columns)
+        pd.testing.assert_frame_equal(
+            df[columns],
+            ctx.data[key][columns],
+        )
+    store.close()
+
+
+def test_benchmark_stores(tmp_path):
+    frames = {
+        "l_replay/i_Map": pd.DataFrame({"chaos_value": [1.0, 2.0]}),
+        "l_replay/i_Fossil": pd.DataFrame({"chaos_value": [3.0]}),
+    }
+    results = storage.benchmark_stores(
+        frames=frames,
+        urls=["memory://", f"sqlite://{tmp_path / 'bench.db'}"],
+        repeat=1,
+    )
+    assert list(results.columns) == ["write", "read_all", "read_one"]
+    assert len(results) == 2
+    assert (results > 0).all().all()
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import threading
+from typing import Iterator
+
+import botocore.exceptions
+import pytest
+
+from wraeblast import errors, replay, transfer
+
+
+@pytest.fixture
+def s3_server(monkeypatch) -> Iterator[replay.LocalS3Server]:
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "wraeblast")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "wraeblast")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    # boto3 blocks, so the server runs in a loop of its own
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = replay.LocalS3Server()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+    monkeypatch.setenv("WRAEBLAST_S3_URL", server.endpoint_url)
+    yield server
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+def test_download_revalidates_cached_copy(s3_server, tmp_path):
+    url = "s3://wraeblast-data/Replay.h5"
+    cache_dir = tmp_path / "cache"
+    client = transfer.create_client()
+    with pytest.raises(botocore.exceptions.ClientError):
+        transfer.download(url, cache_dir=cache_dir, client=client)
+
+    client.put_object(Bucket="wraeblast-data", Key="Replay.h5", Body=b"v1")
+    path = transfer.download(url, cache_dir=cache_dir, client=client)
+    assert path.read_bytes() == b"v1"
+    assert path.suffix == ".h5"
+    s3_server.stats.clear()
+    assert transfer.download(url, cache_dir=cache_dir, client=client) == path
+    assert s3_server.stats == {("HEAD", 200): 1}
+
+    client.put_object(Bucket="wraeblast-data", Key="Replay.h5", Body=b"v2")
+    new_path = transfer.download(url, cache_dir=cache_dir, client=client)
+    assert new_path.read_bytes() == b"v2"
+    assert path.exists()
+
+
+def test_download_keeps_versions_in_use(s3_server, tmp_path, monkeypatch):
+    url = "s3://wraeblast-data/Replay.h5"
+    cache_dir = tmp_path / "cache"
+    client = transfer.create_client()
+    monkeypatch.setattr(transfer, "cache_grace_period", 60)
+
+    # A render downloads v1, and reads it while another downloads v2
+    client.put_object(Bucket="wraeblast-data", Key="Replay.h5", Body=b"v1")
+    path = transfer.download(url, cache_dir=cache_dir, client=client)
+    with open(path, "rb") as f:
+        client.put_object(
+            Bucket="wraeblast-data",
+            Key="Replay.h5",
+            Body=b"v2",
+        )
+        new_path = transfer.download(url, cache_dir=cache_dir, client=client)
+        assert new_path.read_bytes() == b"v2"
+        assert path.read_bytes() == f.read() == b"v1"
+
+    # Versions unused for longer than the grace period are pruned
+    os.utime(path, (0, 0))
+    client.put_object(Bucket="wraeblast-data", Key="Replay.h5", Body=b"v3")
+    transfer.download(url, cache_dir=cache_dir, client=client)
+    assert not path.exists()
+    assert new_path.exists()
+
+
+def test_multipart_upload_is_cached(s3_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "multipart_threshold", 5 * 1024**2)
+    monkeypatch.setattr(transfer, "multipart_chunksize", 5 * 1024**2)
+    url = "s3://wraeblast-data/Replay.h5"
+    cache_dir = tmp_path / "cache"
+    body = bytes(range(256)) * (12 * 1024**2 // 256)
+    path = tmp_path / "Replay.h5"
+    path.write_bytes(body)
+
+    etag = transfer.upload(path, url, cache_dir=cache_dir)
+    assert etag.endswith('-3"')
+    assert s3_server.objects[("wraeblast-data", "Replay.h5")] == (body, etag)
+    s3_server.stats.clear()
+    cache_path = transfer.download(url, cache_dir=cache_dir)
+    assert s3_server.stats == {("HEAD", 200): 1}
+    assert cache_path.read_bytes() == body
+
+    # A cold cache downloads in parallel ranged parts
+    s3_server.stats.clear()
+    cache_path = transfer.download(url, cache_dir=tmp_path / "cold")
+    assert s3_server.stats[("GET", 206)] == 3
+    assert cache_path.read_bytes() == body
+
+
+def test_parse_s3_url():
+    assert transfer.parse_s3_url("s3://bucket/path/to/Replay.h5") == (
+        "bucket",
+        "path/to/Replay.h5",
+    )
+    with pytest.raises(errors.WraeblastError):
+        transfer.parse_s3_url("bucket/Replay.h5")
@@ -0,0 +1,467 @@
+"""Rendering of many item filters in one process.
+
+Every filter of a batch is rendered against the same filter context, so
+economy data is loaded and post-processed once rather than once per
+filter, and each template is compiled at most once however many option
+files it is rendered with. Filters are written as soon as they are
+rendered, and a filter failing to render does not stop the rest of the
+batch. Batches can be rendered in parallel, by processes forked from
+the one that loaded the filter context, and streamed, so that each
+worker holds a rule of its filter in memory at a time rather than the
+whole filter.
+
+"""
+import contextlib
+import datetime
+import gc
+import glob
+import json
+import multiprocessing
+import os
+import pathlib
+import tempfile
+import time
+import types
+from typing import TYPE_CHECKING, Any, Iterator, Optional, TextIO, Union
+
+import jinja2
+import pydantic
+import structlog
+
+from wraeblast.filtering.parsers.extended import (
+    compile_template,
+    config,
+    get_environment,
+    loads,
+    render,
+    sections,
+    stream,
+)
+from wraeblast.filtering.serializers.standard import dump, dumps
+
+
+if TYPE_CHECKING:
+    from wraeblast import insights
+
+
+logger = structlog.get_logger()
+
+#: Suffix of filter options files
+CONFIG_SUFFIX = ".config.json"
+
+#: Default output path of filters, formatted by :func:`create_jobs`
+default_output_format = "{template}/WB-{league_short}-{name}.filter"
+
+
+class RenderJob(pydantic.BaseModel):
+    """A filter to render, from a template and an options file."""
+
+    template: pathlib.Path
+    output: pathlib.Path
+    options_file: Optional[pathlib.Path] = None
+    preset: str = "default"
+    #: Where to keep the rendered intermediate template, if anywhere
+    intermediate: Optional[pathlib.Path] = None
+
+    @property
+    def name(self) -> str:
+        if self.options_file is None:
+            return self.template.name
+        return get_config_name(self.options_file)
+
+
+class RenderResult(pydantic.BaseModel):
+    job: RenderJob
+    #: Seconds spent rendering and writing the filter
+    duration: float
+    #: Why the filter failed to render, if it did
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def get_config_name(options_file: Union[str, pathlib.Path]) -> str:
+    """Get the name of a filter from its options file name."""
+    name = pathlib.Path(options_file).name
+    if name.endswith(CONFIG_SUFFIX):
+        return name[: -len(CONFIG_SUFFIX)]
+    return pathlib.Path(name).stem
+
+
+def get_config_template(
+    options_file: Union[str, pathlib.Path],
+) -> pathlib.Path:
+    """Get the template of an options file, named after its directory.
+
+    For example, ``filters/trade/trade-QU4-Amp.config.json`` is rendered
+    with ``filters/trade/trade.yaml.j2``.
+
+    """
+    directory = pathlib.Path(options_file).parent
+    return directory / f"{directory.name}.yaml.j2"
+
+
+def get_intermediate_suffix(template: Union[str, pathlib.Path]) -> str:
+    """Get the suffix of intermediate templates rendered from a template.
+
+    Templates rendering to JSON lines are named ``*.jsonl.j2``.
+
+    """
+    return ".jsonl" if str(template).endswith(".jsonl.j2") else ".yaml"
+
+
+def expand_config_paths(patterns: list[str]) -> list[pathlib.Path]:
+    """Expand globs of options files (e.g. ``filters/*/*.config.json``).
+
+    Patterns matching nothing are kept as is, so that missing files fail
+    to render rather than being silently skipped.
+
+    """
+    paths: dict[pathlib.Path, None] = {}
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else []
+        for path in matches or [pattern]:
+            paths[pathlib.Path(path)] = None
+    return list(paths)
+
+
+def create_jobs(
+    options_files: list[pathlib.Path],
+    output_directory: Union[str, pathlib.Path] = ".",
+    output_format: str = default_output_format,
+    template: Optional[Union[str, pathlib.Path]] = None,
+    preset: str = "default",
+    keep_intermediate: bool = False,
+    **format_kwargs: str,
+) -> list[RenderJob]:
+    """Create a job per options file.
+
+    Output paths are formatted from ``output_format`` with the filter
+    ``name``, the ``template`` directory name, the ``preset`` and any
+    ``format_kwargs``, then with :meth:`datetime.datetime.strftime`.
+
+    Options files are rendered with ``template``, or else the template
+    of their directory (see :func:`get_config_template`).
+
+    """
+    now = datetime.datetime.now()
+    jobs = []
+    for options_file in options_files:
+        template_path = pathlib.Path(
+            template or get_config_template(options_file)
+        )
+        output = pathlib.Path(output_directory) / now.strftime(
+            output_format.format(
+                name=get_config_name(options_file),
+                template=template_path.parent.name,
+                preset=preset,
+                **format_kwargs,
+            )
+        )
+        jobs.append(
+            RenderJob(
+                template=template_path,
+                output=output,
+                options_file=options_file,
+                preset=preset,
+                intermediate=(
+                    output.with_suffix(get_intermediate_suffix(template_path))
+                    if keep_intermediate
+                    else None
+                ),
+            )
+        )
+    return jobs
+
+
+def _load_job(
+    job: RenderJob,
+    ctx: Optional["insights.ItemFilterContext"],
+    environment: Optional[jinja2.Environment],
+    template: Optional[types.CodeType],
+) -> tuple[
+    Optional[config.ItemFilterPrerenderOptions],
+    jinja2.Environment,
+    types.CodeType,
+]:
+    options = None
+    if job.options_file is not None:
+        with open(job.options_file) as f:
+            options = config.ItemFilterPrerenderOptions.with_defaults(
+                ctx=ctx,
+                overrides=json.load(f),
+            )
+    if environment is None:
+        environment = get_environment()
+    if template is None:
+        template = compile_template(
+            job.template.read_text(),
+            environment,
+            name=str(job.template),
+        )
+    return options, environment, template
+
+
+def render_job(
+    job: RenderJob,
+    ctx: Optional["insights.ItemFilterContext"] = None,
+    environment: Optional[jinja2.Environment] = None,
+    template: Optional[types.CodeType] = None,
+    section_cache: Optional[sections.SectionCache] = None,
+) -> tuple[str, str]:
+    """Render the filter of a job, without writing it.
+
+    ``template`` is the job's template compiled in ``environment`` (see
+    :func:`wraeblast.filtering.parsers.extended.compile_template`), and
+    is read from ``job.template`` if not given. Sections of the template
+    are cached in ``section_cache``, if given.
+
+    Returns:
+        tuple[str, str]: Rendered intermediate template and filter.
+
+    """
+    options, environment, template = _load_job(job, ctx, environment, template)
+    rendered = render(
+        template,
+        ctx=ctx,
+        options=options,
+        environment=environment,
+        section_cache=section_cache,
+    )
+    item_filter = loads(rendered, ctx=ctx, pre_rendered=True)
+    if job.preset != "default":
+        item_filter.apply_preset(preset_name=job.preset)
+    return rendered, dumps(item_filter)
+
+
+def write_job(job: RenderJob, intermediate: str, item_filter: str) -> None:
+    """Write a filter rendered with :func:`render_job`."""
+    if job.intermediate is not None:
+        job.intermediate.parent.mkdir(parents=True, exist_ok=True)
+        job.intermediate.write_text(intermediate)
+    job.output.parent.mkdir(parents=True, exist_ok=True)
+    job.output.write_text(item_filter)
+
+
+def render_filter(
+    job: RenderJob,
+    ctx: Optional["insights.ItemFilterContext"] = None,
+    environment: Optional[jinja2.Environment] = None,
+    template: Optional[types.CodeType] = None,
+    section_cache: Optional[sections.SectionCache] = None,
+) -> None:
+    """Render and write the filter of a job (see :func:`render_job`)."""
+    write_job(job, *render_job(job, ctx, environment, template, section_cache))
+
+
+@contextlib.contextmanager
+def _open_replacing(path: pathlib.Path) -> Iterator[TextIO]:
+    """Open a temporary file replacing ``path`` once fully written."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Unique, so that jobs writing the same path never share a file
+    fd, temporary_path = tempfile.mkstemp(
+        dir=path.parent,
+        prefix=f".{path.name}.",
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            yield f
+        os.replace(temporary_path, path)
+    finally:
+        pathlib.Path(temporary_path).unlink(missing_ok=True)
+
+
+def stream_job(
+    job: RenderJob,
+    ctx: Optional["insights.ItemFilterContext"] = None,
+    environment: Optional[jinja2.Environment] = None,
+    template: Optional[types.CodeType] = None,
+    section_cache: Optional[sections.SectionCache] = None,
+) -> None:
+    """Render and write the filter of a job, one rule at a time.
+
+    Unlike :func:`render_filter`, neither the rendered template nor the
+    filter are ever held in memory whole (see
+    :mod:`wraeblast.filtering.parsers.extended.stream`). Outputs are
+    replaced only once completely written.
+
+    """
+    options, environment, template = _load_job(job, ctx, environment, template)
+    with contextlib.ExitStack() as stack:
+        intermediate = None
+        if job.intermediate is not None:
+            intermediate = stack.enter_context(
+                _open_replacing(job.intermediate)
+            )
+        output = stack.enter_context(_open_replacing(job.output))
+        dump(
+            stream.iter_rules(
+                template,
+                ctx=ctx,
+                options=options,
+                environment=environment,
+                preset=job.preset,
+                intermediate=intermediate,
+                section_cache=section_cache,
+            ),
+            output,
+        )
+
+
+def get_worker_count() -> int:
+    """Get the number of cores available to this process."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+#: Arguments of :func:`_render` in forked workers, inherited from the
+#: process forking them
+_worker_state: dict[str, Any] = {}
+
+
+def _render(
+    job: RenderJob,
+    ctx: Optional["insights.ItemFilterContext"],
+    environment: jinja2.Environment,
+    templates: dict[pathlib.Path, types.CodeType],
+    streaming: bool = False,
+    section_cache: Optional[sections.SectionCache] = None,
+) -> tuple[RenderResult, Optional[tuple[str, str]]]:
+    log = logger.bind(name=job.name, output=str(job.output))
+    start = time.perf_counter()
+    rendered = None
+    error = None
+    try:
+        if job.template not in templates:
+            log.debug("batch.compile", template=str(job.template))
+            templates[job.template] = compile_template(
+                job.template.read_text(),
+                environment,
+                name=str(job.template),
+            )
+        if streaming:
+            stream_job(
+                job,
+                ctx=ctx,
+                environment=environment,
+                template=templates[job.template],
+                section_cache=section_cache,
+            )
+        else:
+            rendered = render_job(
+                job,
+                ctx=ctx,
+                environment=environment,
+                template=templates[job.template],
+                section_cache=section_cache,
+            )
+    except Exception as e:
+        log.exception("batch.render.error")
+        error = f"{type(e).__name__}: {e}"
+    duration = time.perf_counter() - start
+    return RenderResult(job=job, duration=duration, error=error), rendered
+
+
+def _render_in_worker(
+    job: RenderJob,
+) -> tuple[RenderResult, Optional[tuple[str, str]]]:
+    return _render(job, **_worker_state)
+
+
+def _write(
+    result: RenderResult,
+    rendered: Optional[tuple[str, str]],
+) -> RenderResult:
+    log = logger.bind(name=result.job.name, output=str(result.job.output))
+    if rendered is not None:
+        start = time.perf_counter()
+        try:
+            write_job(result.job, *rendered)
+        except OSError as e:
+            log.exception("batch.write.error")
+            result.error = f"{type(e).__name__}: {e}"
+        result.duration += time.perf_counter() - start
+    log.info("batch.render", duration=result.duration, ok=result.ok)
+    return result
+
+
+def render_batch(
+    jobs: list[RenderJob],
+    ctx: Optional["insights.ItemFilterContext"] = None,
+    search_path: str = "filters/",
+    workers: int = 1,
+    streaming: bool = False,
+    section_cache: Optional[sections.SectionCache] = None,
+) -> Iterator[RenderResult]:
+    """Render the filters of jobs, yielding each result as it finishes.
+
+    Templates are compiled once for the whole batch. Jobs that fail are
+    logged and yield a result with an ``error``, and the batch goes on.
+
+    With more than one worker (``0`` for one per available core), jobs
+    are rendered in a pool of processes forked once ``ctx`` is fully
+    loaded, so workers share it copy-on-write rather than loading it
+    again. Filters are still written, and results yielded, in the order
+    of ``jobs``, whichever worker finishes first.
+
+    If ``streaming``, filters are written by whichever process renders
+    them, with :func:`stream_job`, to bound the memory of each worker.
+
+    Sections of templates are cached in ``section_cache``, if given (see
+    :mod:`wraeblast.filtering.parsers.extended.sections`). Workers share
+    the sections cached on disk, if any, but not in memory.
+
+    """
+    environment = get_environment(search_path)
+    templates: dict[pathlib.Path, types.CodeType] = {}
+    if workers == 0:
+        workers = get_worker_count()
+    workers = min(workers, len(jobs))
+    if workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+        logger.warning("batch.fork.unavailable")
+        workers = 1
+    if workers <= 1:
+        for job in jobs:
+            yield _write(
+                *_render(
+                    job,
+                    ctx,
+                    environment,
+                    templates,
+                    streaming,
+                    section_cache,
+                )
+            )
+        return
+
+    if ctx is not None:
+        ctx.load_all()
+    for template in {job.template for job in jobs}:
+        # Failures are raised again, and reported, by each job
+        with contextlib.suppress(Exception):
+            templates[template] = compile_template(
+                template.read_text(),
+                environment,
+                name=str(template),
+            )
+    _worker_state.update(
+        ctx=ctx,
+        environment=environment,
+        templates=templates,
+        streaming=streaming,
+        section_cache=section_cache,
+    )
+    # Keep the garbage collector from touching (and so copying) objects
+    # inherited from this process
+    gc.freeze()
+    logger.info("batch.fork", workers=workers)
+    try:
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            for result, rendered in pool.imap(_render_in_worker, jobs):
+                yield _write(result, rendered)
+    finally:
+        gc.unfreeze()
+        _worker_state.clear()
@@ -3,16 +3,33 @@ import datetime
 import json
 import os
 import pathlib
+import shutil
 import tempfile
+import time
+from typing import Optional
 
-import boto3
+import botocore.exceptions
 import cleo
 import pandas as pd
 import pkg_resources
 import structlog
 
-from wraeblast import errors, insights, logging_
-from wraeblast.filtering.parsers.extended import config, loads, render
+from wraeblast import (
+    batch,
+    errors,
+    insights,
+    logging_,
+    refresh,
+    replay,
+    storage,
+    transfer,
+)
+from wraeblast.filtering.parsers.extended import (
+    config,
+    loads,
+    render,
+    sections,
+)
 from wraeblast.filtering.serializers.standard import dumps
 
 
@@ -32,6 +49,36 @@ def check_league_option(league_name: str) -> str:
     return league_name
 
 
+def check_types_option(
+    types: Optional[str],
+) -> Optional[list[insights.InsightsType]]:
+    if not types:
+        return None
+    try:
+        return [
+            insights.get_insights_type_by_name(t.strip())
+            for t in types.split(",")
+        ]
+    except KeyError as e:
+        raise errors.WraeblastError(f"invalid insights type: {e}")
+
+
+def check_ttl_option(
+    ttls: list[str],
+) -> Optional[dict[insights.InsightsType, datetime.timedelta]]:
+    if not ttls:
+        return None
+    try:
+        return {
+            insights.get_insights_type_by_name(
+                type_name.strip()
+            ): datetime.timedelta(seconds=float(seconds))
+            for type_name, seconds in (ttl.split("=", 1) for ttl in ttls)
+        }
+    except (KeyError, ValueError) as e:
+        raise errors.WraeblastError(f"invalid TTL: {e}")
+
+
 class BaseCommand(cleo.Command):
     def initialize_logging(self):
         logging_.initialize_logging(
@@ -39,20 +86,322 @@ class BaseCommand(cleo.Command):
         )
 
 
+class BaseRenderCommand(BaseCommand):
+    """Base of commands rendering filters against a filter context."""
+
+    def initialize_filter_context(
+        self,
+        league: str,
+    ) -> Optional[insights.ItemFilterContext]:
+        if self.option("no-insights"):
+            self.line("<info>Insights disabled</info>")
+            return None
+        store_path = str(self.option("store-path"))
+        store_is_s3 = store_path.startswith("s3://")
+        store_is_snapshot = pathlib.Path(store_path).is_dir()
+
+        if store_is_snapshot:
+            store = refresh.open_current_snapshot(store_path)
+        elif store_is_s3:
+            self.line(f"<info>Fetching data from S3: {store_path}</info>")
+            store = storage.open_store(
+                str(transfer.download(store_path)),
+                mode="r",
+            )
+        else:
+            store = insights._create_store(store_path)
+
+        columns = None
+        if self.option("columns"):
+            columns = [
+                column.strip()
+                for column in str(self.option("columns")).split(",")
+            ]
+        loop = asyncio.get_event_loop()
+        return loop.run_until_complete(
+            insights.initialize_filter_context(
+                league=league,
+                no_sync=(
+                    bool(self.option("no-sync"))
+                    or store_is_snapshot
+                    or store_is_s3
+                ),
+                store=store,
+                snapshot_dir=self.option("context-cache") or None,
+                columns=columns,
+                compact=bool(self.option("compact")),
+            ),
+        )
+
+    def get_section_cache(self) -> Optional[sections.SectionCache]:
+        if not self.option("section-cache"):
+            return None
+        return sections.SectionCache(str(self.option("section-cache")))
+
+
 def main() -> int:
     app = cleo.Application(
         name=__package__,
         version=pkg_resources.get_distribution(__package__).version,
     )
     for command in (
+        BenchmarkStorageCommand,
+        RecordInsightsCommand,
+        RefreshInsightsCommand,
+        RenderBatchCommand,
         RenderFilterCommand,
+        ServeInsightsCommand,
         SyncInsightsCommand,
     ):
         app.add(command())
     return app.run()
 
 
-class RenderFilterCommand(BaseCommand):
+class BenchmarkStorageCommand(BaseCommand):
+    """Compare insights storage backends on cached insights
+
+    benchmark_storage
+        {--s|store-path= : Insights store to copy data from}
+        {--b|backends=hdf5,parquet,sqlite,memory : Comma-separated
+            backends to benchmark}
+        {--k|key= : Key of the overview to time single-category reads
+            with (default: the largest one)}
+        {--r|repeat=3 : Number of repetitions}
+
+    """
+
+    def handle(self) -> None:
+        self.initialize_logging()
+        source = insights._create_store(self.option("store-path") or None)
+        frames = {key: source.get(key) for key in source.keys()}
+        source.close()
+        if not frames:
+            raise errors.WraeblastError("insights store is empty")
+        with tempfile.TemporaryDirectory() as tempdir:
+            urls = []
+            for scheme in str(self.option("backends")).split(","):
+                scheme = scheme.strip()
+                if scheme not in storage.backends:
+                    raise errors.WraeblastError(f"invalid backend: {scheme}")
+                urls.append(f"{scheme}://{pathlib.Path(tempdir) / scheme}")
+            results = storage.benchmark_stores(
+                frames=frames,
+                urls=urls,
+                key=self.option("key") or None,
+                repeat=int(str(self.option("repeat"))),
+            )
+        results.index = results.index.str.split("://").str[0]
+        self.line(f"<info>{len(frames)} overviews, best of seconds:</info>")
+        self.line(results.to_string(float_format="{:.4f}".format))
+
+
+class RecordInsightsCommand(BaseCommand):
+    """Record raw poe.ninja responses for offline replay
+
+    record_insights
+        {--l|league=TEMP : Current league name}
+        {--t|types= : Comma-separated subset of insights types to record}
+        {--o|output-directory=recordings : Output directory}
+
+    """
+
+    def handle(self) -> None:
+        self.initialize_logging()
+        league = check_league_option(str(self.option("league")))
+        types = check_types_option(self.option("types"))
+        output_dir = str(self.option("output-directory"))
+        self.line(f"<info>Recording economy data to {output_dir}</info>")
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(
+            replay.record_overviews(
+                league=league,
+                path=output_dir,
+                types=types,
+            ),
+        )
+
+
+class ServeInsightsCommand(BaseCommand):
+    """Serve recorded poe.ninja responses from a local stand-in server
+
+    serve_insights
+        {path=recordings : Recorded responses directory}
+        {--H|host=127.0.0.1 : Address to listen on}
+        {--P|port=8080 : Port to listen on}
+        {--latency=0 : Response latency, in seconds}
+        {--jitter=0 : Maximum random latency added, in seconds}
+        {--error-rate=0 : Probability of responding with a 503}
+        {--ratelimit : Enforce poe.ninja rate limits}
+
+    """
+
+    def handle(self) -> None:
+        self.initialize_logging()
+        server = replay.NinjaReplayServer(
+            path=str(self.argument("path")),
+            host=str(self.option("host")),
+            port=int(str(self.option("port"))),
+            latency=float(str(self.option("latency"))),
+            jitter=float(str(self.option("jitter"))),
+            error_rate=float(str(self.option("error-rate"))),
+            ratelimits=(
+                insights.NinjaConsumer.ratelimits
+                if self.option("ratelimit")
+                else None
+            ),
+        )
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(server.start())
+        self.line(
+            f"<info>Serving recorded responses at {server.base_url}</info>"
+        )
+        self.line(f"<info>Set WRAEBLAST_NINJA_URL={server.base_url}</info>")
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.run_until_complete(server.stop())
+
+
+class RefreshInsightsCommand(BaseCommand):
+    """Continuously refresh insights into versioned snapshots
+
+    refresh_insights
+        {--d|data-dir=insights : Directory of versioned insights snapshots}
+        {--l|league=TEMP : Current league name (or comma-separated names)}
+        {--t|types= : Comma-separated subset of insights types to sync}
+        {--T|ttl=* : Override the cache TTL of an insights type, in
+            seconds (e.g. Currency=600)}
+        {--i|interval=300 : Seconds between refreshes}
+        {--k|keep=3 : Number of snapshots to keep}
+        {--history : Also incrementally sync daily currency history}
+        {--once : Refresh once and exit}
+
+    """
+
+    def handle(self) -> None:
+        self.initialize_logging()
+        leagues = [
+            check_league_option(league.strip())
+            for league in str(self.option("league")).split(",")
+        ]
+        data_dir = str(self.option("data-dir"))
+        kwargs = {
+            "types": check_types_option(self.option("types")),
+            "ttls": check_ttl_option(self.option("ttl")),
+            "history": bool(self.option("history")),
+            "keep": int(str(self.option("keep"))),
+        }
+        loop = asyncio.get_event_loop()
+        if self.option("once"):
+            path = loop.run_until_complete(
+                refresh.create_snapshot(
+                    data_dir=data_dir,
+                    leagues=leagues,
+                    **kwargs,
+                )
+            )
+            self.line(f"<info>Published snapshot {path}</info>")
+            return
+        self.line(f"<info>Refreshing insights snapshots in {data_dir}</info>")
+        try:
+            loop.run_until_complete(
+                refresh.run_refresher(
+                    data_dir=data_dir,
+                    leagues=leagues,
+                    interval=float(str(self.option("interval"))),
+                    **kwargs,
+                )
+            )
+        except KeyboardInterrupt:
+            pass
+
+
+class RenderBatchCommand(BaseRenderCommand):
+    """Render many item filters in one process, sharing economy data
+
+    render_batch
+        {configs* : Options files, or globs of them (e.g.
+            "filters/*/*.config.json")}
+        {--t|template= : Filter template file (default: the template named
+            after the directory of each options file)}
+        {--d|output-directory=. : Output directory}
+        {--o|output= : Output file of each filter, as a format string of
+            its name, template, preset, league and league_short (default:
+            per-template directories of WB-league_short-name.filter)}
+        {--i|keep-intermediate : Keep rendered intermediate templates}
+        {--l|league=TEMP : Current league name}
+        {--N|no-sync : Prevents automatic insights syncing}
+        {--no-insights : Disables all economy data fetching}
+        {--s|store-path= : Fetch insights from the given store path or URL
+            (e.g. sqlite://insights.db), or the current snapshot of a
+            refresh_insights data directory}
+        {--C|context-cache= : Directory of built filter context snapshots}
+        {--columns= : Comma-separated overview columns the templates use
+            (default: all)}
+        {--compact : Compact overviews to use less memory (templates must
+            group with observed=True)}
+        {--S|section-cache= : Directory of rendered template sections,
+            rendered again only once the data or options they read change}
+        {--p|preset=default : Preset name}
+        {--j|jobs=1 : Number of filters rendered in parallel, by forked
+            processes sharing the economy data (0: one per core)}
+        {--stream : Write filters one rule at a time, keeping a rule
+            rather than whole filters in memory}
+
+    """
+
+    def handle(self) -> int:
+        self.initialize_logging()
+        league = check_league_option(str(self.option("league")))
+        options_files = batch.expand_config_paths(
+            [str(config) for config in self.argument("configs")]
+        )
+        jobs = batch.create_jobs(
+            options_files,
+            output_directory=str(self.option("output-directory")).strip(),
+            output_format=(
+                str(self.option("output")).strip()
+                if self.option("output")
+                else batch.default_output_format
+            ),
+            template=self.option("template") or None,
+            preset=str(self.option("preset")),
+            keep_intermediate=bool(self.option("keep-intermediate")),
+            league=league,
+            league_short=league[:3],
+        )
+        self.line(f"<info>Rendering {len(jobs)} item filters</info>")
+        start = time.perf_counter()
+        filter_context = self.initialize_filter_context(league)
+        self.line(
+            "<info>Loaded economy data in "
+            f"{time.perf_counter() - start:.2f}s</info>"
+        )
+        failed = 0
+        for result in batch.render_batch(
+            jobs,
+            ctx=filter_context,
+            workers=int(str(self.option("jobs"))),
+            streaming=bool(self.option("stream")),
+            section_cache=self.get_section_cache(),
+        ):
+            if result.ok:
+                self.line(
+                    f"{result.job.output} <info>{result.duration:.2f}s</info>"
+                )
+            else:
+                failed += 1
+                self.line(f"{result.job.output} <error>{result.error}</error>")
+        self.line(
+            f"<info>Rendered {len(jobs) - failed}/{len(jobs)} item filters "
+            f"in {time.perf_counter() - start:.2f}s</info>"
+        )
+        return 1 if failed else 0
+
+
+class RenderFilterCommand(BaseRenderCommand):
     """Render an item filter template
 
     render_filter
@@ -64,7 +413,16 @@ class RenderFilterCommand(BaseCommand):
         {--l|league=TEMP : Current league name}
         {--N|no-sync : Prevents automatic insights syncing}
         {--no-insights : Disables all economy data fetching}
-        {--s|store-path= : Fetch HDF from the given path}
+        {--s|store-path= : Fetch insights from the given store path or URL
+            (e.g. sqlite://insights.db), or the current snapshot of a
+            refresh_insights data directory}
+        {--C|context-cache= : Directory of built filter context snapshots}
+        {--columns= : Comma-separated overview columns the template uses
+            (default: all)}
+        {--compact : Compact overviews to use less memory (templates must
+            group with observed=True)}
+        {--S|section-cache= : Directory of rendered template sections,
+            rendered again only once the data or options they read change}
         {--p|preset=default : Preset name}
 
     """
@@ -92,33 +450,8 @@ class RenderFilterCommand(BaseCommand):
         options_filename = str(self.option("options-file")).strip()
         tmpl_filename = str(self.argument("file")).strip()
         output_path.parent.mkdir(parents=True, exist_ok=True)
-        store_path = str(self.option("store-path"))
-        store_is_s3 = store_path.startswith("s3://")
-
-        if store_is_s3:
-            bucket, key = store_path[5:].split("/", 1)
-            key_basename = pathlib.Path(key).name
-            self.line(f"<info>Downloading data from S3: {bucket}/{key}</info>")
-            tempdir = tempfile.TemporaryDirectory()
-            key_dest = str(pathlib.Path(tempdir.name) / key_basename)
-            s3 = boto3.resource("s3")
-            s3.Bucket(bucket).download_file(key, key_dest)
-            store = insights._create_hdfstore(key_dest)
-        else:
-            store = insights._create_hdfstore(store_path)
-
-        loop = asyncio.get_event_loop()
-        filter_context = None
-        if not self.option("no-insights"):
-            filter_context = loop.run_until_complete(
-                insights.initialize_filter_context(
-                    league=league,
-                    no_sync=bool(self.option("no-sync")),
-                    store=store,
-                ),
-            )
-        else:
-            self.line("<info>Insights disabled</info>")
+        filter_context = self.initialize_filter_context(league)
+        section_cache = self.get_section_cache()
         if options_filename:
             with open(options_filename) as f:
                 options = config.ItemFilterPrerenderOptions.with_defaults(
@@ -138,7 +471,11 @@ class RenderFilterCommand(BaseCommand):
                     intermediate_filename
                 ).name
                 intermediate_filename = output_dir / intermediate_filename
-                if intermediate_filename.suffix not in (".yml", ".yaml"):
+                if intermediate_filename.suffix not in (
+                    ".jsonl",
+                    ".yml",
+                    ".yaml",
+                ):
                     intermediate_filename = intermediate_filename.with_suffix(
                         ".yaml"
                     )
@@ -148,6 +485,7 @@ class RenderFilterCommand(BaseCommand):
                         f.read(),
                         ctx=filter_context,
                         options=options,
+                        section_cache=section_cache,
                     )
                     f_.write(template)
             else:
@@ -157,6 +495,7 @@ class RenderFilterCommand(BaseCommand):
                 ctx=filter_context,
                 pre_rendered=keep_intermediate,
                 options=options,
+                section_cache=section_cache,
             )
             if self.option("preset") != "default":
                 item_filter.apply_preset(
@@ -175,33 +514,63 @@ class SyncInsightsCommand(BaseCommand):
     """Fetch Path of Exile economy insights
 
     sync_insights
-        {--s|store-path= : Store HDF at the given path}
-        {--l|league=TEMP : Current league name}
+        {--s|store-path= : Store insights at the given path or URL (e.g.
+            sqlite://insights.db)}
+        {--l|league=TEMP : Current league name (or comma-separated names)}
+        {--t|types= : Comma-separated subset of insights types to sync
+            (e.g. Currency,SkillGem or currencies,skill_gems)}
+        {--r|refresh : Conditionally re-request expired insights}
+        {--T|ttl=* : Override the cache TTL of an insights type, in
+            seconds (e.g. Currency=600)}
+        {--history : Also incrementally sync daily currency history}
 
     """
 
     def handle(self) -> None:
         self.initialize_logging()
         self.line("<info>Syncing economy data from poe.ninja</info>")
-        league = check_league_option(str(self.option("league")))
+        leagues = [
+            check_league_option(league.strip())
+            for league in str(self.option("league")).split(",")
+        ]
+        types = check_types_option(self.option("types"))
+        ttls = check_ttl_option(self.option("ttl"))
+        refresh = bool(self.option("refresh"))
         loop = asyncio.get_event_loop()
         store_path = str(self.option("store-path"))
         store_is_s3 = store_path.startswith("s3://")
         if store_is_s3:
+            _, key = transfer.parse_s3_url(store_path)
             tempdir = tempfile.TemporaryDirectory()
-            store = insights._create_hdfstore(
-                str(pathlib.Path(tempdir.name) / f"wraeblast-{league}.h5")
-            )
+            key_dest = str(pathlib.Path(tempdir.name) / pathlib.Path(key).name)
+            # Always sync into the existing store, since uploading only
+            # the synced types and leagues would drop everything else
+            self.line(f"<info>Fetching data from S3: {store_path}</info>")
+            try:
+                # The cached copy is shared, so sync into a copy of it
+                shutil.copyfile(transfer.download(store_path), key_dest)
+            except botocore.exceptions.ClientError as e:
+                if e.response["Error"]["Code"] not in ("404", "NoSuchKey"):
+                    raise
+            store = insights._create_store(key_dest)
         else:
-            store = insights._create_hdfstore(store_path)
+            store = insights._create_store(store_path)
         store = loop.run_until_complete(
-            insights.initialize_insights_cache(
-                league=league,
+            insights.sync_insights(
+                leagues=leagues,
                 store=store,
+                types=types,
+                refresh=refresh,
+                ttls=ttls,
             ),
         )
+        if self.option("history"):
+            self.line("<info>Syncing currency history from poe.ninja</info>")
+            for league in leagues:
+                loop.run_until_complete(
+                    insights.sync_currency_history(league=league, store=store)
+                )
         if store_is_s3:
-            bucket, key = store_path[5:].split("/", 1)
-            self.line(f"<info>Syncing to S3 bucket: {bucket}/{key}</info>")
-            s3 = boto3.resource("s3")
-            s3.Bucket(bucket).upload_file(store._path, key)
+            self.line(f"<info>Syncing to S3: {store_path}</info>")
+            store.close()
+            transfer.upload(key_dest, store_path)
@@ -8,3 +8,7 @@ class InsightsError(WraeblastError):
 
 class UnsuccessfulInsightsRequest(InsightsError):
     ...
+
+
+class StorageError(WraeblastError):
+    ...
@@ -327,43 +327,57 @@ class ItemFilter(pydantic.BaseModel):
         log = logger.bind(preset=preset_name)
         log.debug("preset.apply")
         for rule in self.rules:
-            # Replace tags
-            for source_tag, target_tag in preset.tags.replace.items():
-                source_tags = set(
-                    source_tag
-                    if isinstance(source_tag, list)
-                    else [source_tag]
-                )
-                if source_tags.issubset(rule.tags):
-                    target_tags = set(
-                        target_tag
-                        if isinstance(target_tag, list)
-                        else [target_tag]
-                    )
-                    rule.tags -= {t for t in source_tags if t is not None}
-                    rule.tags |= {t for t in target_tags if t is not None}
-
-            # Disable visibility for hidden tags
-            for hidden_tag in preset.tags.hidden:
-                hidden_tags = set(
-                    hidden_tag
-                    if isinstance(hidden_tag, list)
-                    else [hidden_tag]
-                )
-                if hidden_tags.issubset(rule.tags):
-                    rule.visibility = Visibility.HIDE
-
-            # Enable visibility for visible tags
-            for visible_tag in preset.tags.visible:
-                visible_tags = set(
-                    visible_tag
-                    if isinstance(visible_tag, list)
-                    else [visible_tag]
-                )
-                if visible_tags.issubset(rule.tags):
-                    rule.visibility = Visibility.SHOW
+            self._apply_preset_to_rule(preset, rule)
         self.resolve_styles()
 
+    def _apply_preset_to_rule(self, preset: Preset, rule: Rule) -> None:
+        # Replace tags
+        for source_tag, target_tag in preset.tags.replace.items():
+            source_tags = set(
+                source_tag if isinstance(source_tag, list) else [source_tag]
+            )
+            if source_tags.issubset(rule.tags):
+                target_tags = set(
+                    target_tag
+                    if isinstance(target_tag, list)
+                    else [target_tag]
+                )
+                rule.tags -= {t for t in source_tags if t is not None}
+                rule.tags |= {t for t in target_tags if t is not None}
+
+        # Disable visibility for hidden tags
+        for hidden_tag in preset.tags.hidden:
+            hidden_tags = set(
+                hidden_tag if isinstance(hidden_tag, list) else [hidden_tag]
+            )
+            if hidden_tags.issubset(rule.tags):
+                rule.visibility = Visibility.HIDE
+
+        # Enable visibility for visible tags
+        for visible_tag in preset.tags.visible:
+            visible_tags = set(
+                visible_tag if isinstance(visible_tag, list) else [visible_tag]
+            )
+            if visible_tags.issubset(rule.tags):
+                rule.visibility = Visibility.SHOW
+
+    def process_rule(self, rule: Rule, preset_name: str = "default") -> Rule:
+        """Apply presets and styles to a rule that is not in the filter.
+
+        The rule ends up as it would in the filter's ``rules``, had it
+        been created with them and then had ``preset_name`` applied.
+        Presets and styles apply to each rule independently of the
+        others, so rules can be processed one at a time.
+
+        """
+        if "default" in self.presets:
+            self._apply_preset_to_rule(self.presets["default"], rule)
+            self._resolve_rule_styles(rule)
+        if preset_name != "default":
+            self._apply_preset_to_rule(self.presets[preset_name], rule)
+            self._resolve_rule_styles(rule)
+        return rule
+
     def get_styles_for_tags(
         self,
         tags: typing.Iterable[typing.Union[list[str], str]],
@@ -386,29 +400,38 @@ class ItemFilter(pydantic.BaseModel):
     ) -> None:
         """Apply all styles to applicable rules across the filter."""
         logger.debug("styles.apply")
-        default_style = None
-        if apply_default and "default" in self.styles:
-            default_style = self.styles["default"]
         for rule in self.rules:
-            # Apply a style named "default", if it exists
-            if default_style is not None:
-                rule.apply_style(default_style, replace=True)
-            # First apply styles with matching tag names...
-            styles = self.get_styles_for_tags(rule.tags)
-            # ...then apply any explicit style names from the given rule
-            if rule.style:
-                if isinstance(rule.style, list):
-                    style_names = rule.style
-                else:
-                    style_names = [rule.style]
-                try:
-                    for style_name in style_names:
-                        styles.append(self.styles[style_name])
-                except KeyError:
-                    if not ignore_errors:
-                        raise
-            for style in styles:
-                rule.apply_style(style, replace=True)
+            self._resolve_rule_styles(
+                rule,
+                ignore_errors=ignore_errors,
+                apply_default=apply_default,
+            )
+
+    def _resolve_rule_styles(
+        self,
+        rule: Rule,
+        ignore_errors: bool = False,
+        apply_default: bool = True,
+    ) -> None:
+        # Apply a style named "default", if it exists
+        if apply_default and "default" in self.styles:
+            rule.apply_style(self.styles["default"], replace=True)
+        # First apply styles with matching tag names...
+        styles = self.get_styles_for_tags(rule.tags)
+        # ...then apply any explicit style names from the given rule
+        if rule.style:
+            if isinstance(rule.style, list):
+                style_names = rule.style
+            else:
+                style_names = [rule.style]
+            try:
+                for style_name in style_names:
+                    styles.append(self.styles[style_name])
+            except KeyError:
+                if not ignore_errors:
+                    raise
+        for style in styles:
+            rule.apply_style(style, replace=True)
 
     def remove_hidden_rules(self) -> None:
         """Remove all hidden rules."""
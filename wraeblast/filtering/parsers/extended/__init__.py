@@ -1,19 +1,29 @@
 """Extended filter parsing."""
+import functools
+import hashlib
+import json
 import math
-from typing import TYPE_CHECKING, Any, Optional, Union
+import os
+import pathlib
+import types
+from typing import TYPE_CHECKING, Any, Iterator, Optional, Union
 
 import glom
 import jinja2
 import jinja2.filters
 import jinja2.sandbox
 import ruamel.yaml
+import structlog
 
 
 if TYPE_CHECKING:
     from wraeblast import insights
 
 from wraeblast.filtering import colors, elements
-from wraeblast.filtering.parsers.extended import config, env
+from wraeblast.filtering.parsers.extended import config, env, sections
+
+
+logger = structlog.get_logger()
 
 
 @jinja2.filters.environmentfilter
@@ -41,6 +51,79 @@ def iter_stacks(
 jinja2.filters.FILTERS["q"] = glom_query
 
 
+#: First line of intermediate templates in the JSON lines format
+JSONL_MARKER = "#jsonl"
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if hasattr(value, "item"):
+        # NumPy scalars, e.g. from overview rows
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def jsonl(**fragment: Any) -> str:
+    """Serialize a fragment of a JSON lines intermediate template.
+
+    Templates use it through the macros of ``include/jsonl.j2``.
+
+    """
+    return json.dumps(fragment, separators=(",", ":"), default=_to_json)
+
+
+#: Functions and constants available to every filter template
+template_functions = {
+    "change_brightness": env.change_brightness,
+    "colormap_pick": env.colormap_pick,
+    "colormap": colors.linear_colormap_from_color_list,
+    "e": math.e,
+    "get_item_tags": env.get_item_tags,
+    "get_quantile_threshold_tags": env.get_quantile_threshold_tags,
+    "get_stack_tags": env.get_stack_tags,
+    "iter_stacks": iter_stacks,
+    "jsonl": jsonl,
+    "jsonl_marker": JSONL_MARKER,
+    "nearest_named_color": env.nearest_named_color,
+    "normalize_skill_gem_name": env.normalize_skill_gem_name,
+    "round_down": env.round_down,
+    "text_color": env.text_color,
+    "tts": sections.side_effect("tts", env.tts),
+}
+
+
+def get_render_globals(
+    ctx: Optional["insights.ItemFilterContext"] = None,
+    globals: Optional[dict[str, Any]] = None,
+    options: Optional[config.ItemFilterPrerenderOptions] = None,
+    section_cache: Optional[sections.SectionCache] = None,
+    template_version: str = "",
+) -> dict[str, Any]:
+    """Get the globals specific to a render of a filter template.
+
+    Unlike :func:`update_template_globals`, this omits
+    ``template_functions``, which environments from
+    :func:`create_environment` already provide. Sections are cached in
+    ``section_cache``, if given, by ``template_version`` (see
+    :mod:`.sections`).
+
+    """
+    if options is None:
+        options = config.ItemFilterPrerenderOptions.with_defaults(ctx=ctx)
+    return {
+        **(globals or {}),
+        "ctx": ctx,
+        "options": options,
+        "section": sections.Section(
+            ctx,
+            options,
+            section_cache,
+            template_version,
+        ),
+    }
+
+
 def update_template_globals(
     ctx: Optional["insights.ItemFilterContext"] = None,
     globals: Optional[dict[str, Any]] = None,
@@ -48,39 +131,191 @@ def update_template_globals(
 ) -> dict[str, Any]:
     if globals is None:
         globals = {}
-    if options is None:
-        options = config.ItemFilterPrerenderOptions.with_defaults(ctx=ctx)
-    globals.update(
-        {
-            "change_brightness": env.change_brightness,
-            "colormap_pick": env.colormap_pick,
-            "colormap": colors.linear_colormap_from_color_list,
-            "ctx": ctx,
-            "e": math.e,
-            "get_item_tags": env.get_item_tags,
-            "get_quantile_threshold_tags": env.get_quantile_threshold_tags,
-            "get_stack_tags": env.get_stack_tags,
-            "iter_stacks": iter_stacks,
-            "nearest_named_color": env.nearest_named_color,
-            "normalize_skill_gem_name": env.normalize_skill_gem_name,
-            "options": options,
-            "round_down": env.round_down,
-            "text_color": env.text_color,
-            "tts": env.tts,
-        },
-    )
+    globals.update(template_functions)
+    globals.update(get_render_globals(ctx=ctx, options=options))
     return globals
 
 
-def loads(
+def get_bytecode_cache_dir() -> Optional[pathlib.Path]:
+    """Get the directory compiled templates are cached in, if any.
+
+    Set ``WRAEBLAST_TEMPLATE_CACHE`` to change it, or to an empty string
+    to disable the cache.
+
+    """
+    path = os.getenv(
+        "WRAEBLAST_TEMPLATE_CACHE",
+        pathlib.Path.home() / ".cache" / "wraeblast" / "templates",
+    )
+    return pathlib.Path(path) if path else None
+
+
+class FilterEnvironment(jinja2.sandbox.SandboxedEnvironment):
+    """Sandboxed environment recording the options sections read."""
+
+    def getattr(self, obj: Any, attribute: str) -> Any:
+        value = super().getattr(obj, attribute)
+        if sections.is_recording():
+            sections.record_access(obj, attribute, value)
+        return value
+
+    def getitem(self, obj: Any, argument: Any) -> Any:
+        value = super().getitem(obj, argument)
+        if sections.is_recording():
+            sections.record_access(obj, argument, value)
+        return value
+
+
+def create_environment(
+    search_path: str = "filters/",
+    bytecode_cache_dir: Optional[Union[str, pathlib.Path]] = None,
+) -> FilterEnvironment:
+    """Create the Jinja2 environment filter templates are rendered in.
+
+    Templates imported or included by filter templates are compiled once
+    per environment (and again only if their file is modified), so
+    renders sharing one only compile them once. If
+    ``bytecode_cache_dir`` is given, compiled templates are also cached
+    there, keyed by a hash of their source, and shared across processes.
+
+    """
+    bytecode_cache = None
+    if bytecode_cache_dir is not None:
+        pathlib.Path(bytecode_cache_dir).mkdir(parents=True, exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(
+            str(bytecode_cache_dir)
+        )
+    environment = FilterEnvironment(
+        loader=jinja2.FileSystemLoader(search_path),
+        bytecode_cache=bytecode_cache,
+    )
+    environment.globals.update(template_functions)
+    return environment
+
+
+def get_environment(
+    search_path: str = "filters/",
+) -> FilterEnvironment:
+    """Get the shared environment of a search path.
+
+    Environments are created once per process and search path, caching
+    compiled templates in :func:`get_bytecode_cache_dir`.
+
+    """
+    return _get_environment(
+        os.path.abspath(search_path),
+        get_bytecode_cache_dir(),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _get_environment(
+    search_path: str,
+    bytecode_cache_dir: Optional[pathlib.Path],
+) -> FilterEnvironment:
+    return create_environment(search_path, bytecode_cache_dir)
+
+
+@functools.lru_cache(maxsize=32)
+def compile_template(
     s: Union[str, bytes],
+    environment: jinja2.Environment,
+    name: Optional[str] = None,
+) -> types.CodeType:
+    """Compile a filter template once, to :func:`render` it repeatedly.
+
+    Compiled templates are cached in memory, and in the bytecode cache
+    of ``environment`` if it has one. Templates are cached by ``name``
+    (e.g. their path) if given, or else by a hash of their source.
+
+    """
+    source = str(s)
+    bytecode_cache = environment.bytecode_cache
+    if bytecode_cache is None:
+        return environment.compile(source, name)
+    bucket = bytecode_cache.get_bucket(
+        environment,
+        name or hashlib.sha1(source.encode()).hexdigest(),
+        None,
+        source,
+    )
+    if bucket.code is None:
+        logger.debug("template.compile", name=name)
+        bucket.code = environment.compile(source, name)
+        bytecode_cache.set_bucket(bucket)
+    return bucket.code
+
+
+def load_jsonl(s: str) -> dict[str, Any]:
+    """Load a JSON lines intermediate template into a filter document.
+
+    Each line is an object whose keys are merged into the document in
+    order: lists are extended (e.g. ``{"rules": [...]}`` appends rules),
+    objects are updated, and anything else replaces the previous value.
+    Blank lines and lines starting with ``#`` are ignored.
+
+    """
+    document: dict[str, Any] = {}
+    for line in s.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        merge_jsonl_fragment(document, json.loads(line))
+    return document
+
+
+def merge_jsonl_fragment(
+    document: dict[str, Any],
+    fragment: dict[str, Any],
+) -> None:
+    """Merge a line of a JSON lines template into a document."""
+    for key, value in fragment.items():
+        if isinstance(value, list):
+            document.setdefault(key, []).extend(value)
+        elif isinstance(value, dict):
+            document.setdefault(key, {}).update(value)
+        else:
+            document[key] = value
+
+
+def get_intermediate_format(s: str) -> str:
+    """Get the format of a rendered template, ``jsonl`` or ``yaml``.
+
+    Templates select the JSON lines format by starting with
+    :data:`JSONL_MARKER`, which is a comment to YAML.
+
+    """
+    return "jsonl" if s.lstrip().startswith(JSONL_MARKER) else "yaml"
+
+
+def load_intermediate(s: str) -> dict[str, Any]:
+    """Load a rendered template into a filter document.
+
+    YAML is parsed with the C extension of ruamel.yaml when installed.
+    JSON lines parse many times faster still, for large filters.
+
+    """
+    if get_intermediate_format(s) == "jsonl":
+        return load_jsonl(s)
+    return ruamel.yaml.YAML(typ="safe", pure=False).load(s)
+
+
+def loads(
+    s: Union[str, bytes, types.CodeType],
     search_path: str = "filters",
     ctx: Optional["insights.ItemFilterContext"] = None,
     globals: Optional[dict[str, Any]] = None,
     options: Optional[config.ItemFilterPrerenderOptions] = None,
     pre_rendered: bool = False,
+    environment: Optional[jinja2.Environment] = None,
+    section_cache: Optional[sections.SectionCache] = None,
 ) -> elements.ItemFilter:
-    """Load a Jinja2 + YAML formatted extended filter from a string."""
+    """Load a Jinja2 + YAML (or JSON lines) extended filter from a string.
+
+    See :func:`load_intermediate` for the formats templates can render
+    to.
+
+    """
     if not pre_rendered:
         rendered_template = render(
             s=s,
@@ -88,30 +323,83 @@ def loads(
             ctx=ctx,
             globals=globals,
             options=options,
+            environment=environment,
+            section_cache=section_cache,
         )
     else:
-        rendered_template = s
-    yaml = ruamel.yaml.YAML(typ="safe")
-    document = yaml.load(rendered_template)
+        rendered_template = str(s)
+    document = load_intermediate(rendered_template)
     item_filter = elements.ItemFilter(**document)
     return item_filter
 
 
+def _get_template(
+    s: Union[str, bytes, types.CodeType],
+    search_path: str,
+    ctx: Optional["insights.ItemFilterContext"],
+    globals: Optional[dict[str, Any]],
+    options: Optional[config.ItemFilterPrerenderOptions],
+    environment: Optional[jinja2.Environment],
+    section_cache: Optional[sections.SectionCache],
+) -> jinja2.Template:
+    if environment is None:
+        environment = get_environment(search_path)
+    template_version = ""
+    if section_cache is not None:
+        template_version = sections.get_template_version(s, environment)
+    if not isinstance(s, types.CodeType):
+        s = compile_template(s, environment)
+    return environment.template_class.from_code(
+        environment,
+        s,
+        environment.make_globals(
+            get_render_globals(
+                ctx=ctx,
+                globals=globals,
+                options=options,
+                section_cache=section_cache,
+                template_version=template_version,
+            )
+        ),
+    )
+
+
 def render(
-    s: Union[str, bytes],
+    s: Union[str, bytes, types.CodeType],
     search_path: str = "filters/",
     ctx: Optional["insights.ItemFilterContext"] = None,
     globals: Optional[dict[str, Any]] = None,
     options: Optional[config.ItemFilterPrerenderOptions] = None,
+    environment: Optional[jinja2.Environment] = None,
+    section_cache: Optional[sections.SectionCache] = None,
 ) -> str:
-    """Render a Jinja2 + YAML filter template to YAML."""
-    globals = update_template_globals(
-        ctx=ctx,
-        globals=globals,
-        options=options,
-    )
-    jinja_env = jinja2.sandbox.SandboxedEnvironment(
-        loader=jinja2.FileSystemLoader(search_path),
-    )
-    template = jinja_env.from_string(str(s), globals=globals)
-    return template.render()
+    """Render a Jinja2 + YAML filter template to YAML.
+
+    ``s`` may be a template compiled with :func:`compile_template` in
+    ``environment``, which is the shared environment of ``search_path``
+    (see :func:`get_environment`) if not given. Sections of the template
+    are cached in ``section_cache``, if given (see :mod:`.sections`).
+
+    """
+    return _get_template(
+        s, search_path, ctx, globals, options, environment, section_cache
+    ).render()
+
+
+def generate(
+    s: Union[str, bytes, types.CodeType],
+    search_path: str = "filters/",
+    ctx: Optional["insights.ItemFilterContext"] = None,
+    globals: Optional[dict[str, Any]] = None,
+    options: Optional[config.ItemFilterPrerenderOptions] = None,
+    environment: Optional[jinja2.Environment] = None,
+    section_cache: Optional[sections.SectionCache] = None,
+) -> Iterator[str]:
+    """Render a filter template in chunks, as they are rendered.
+
+    Takes the same arguments as :func:`render`.
+
+    """
+    return _get_template(
+        s, search_path, ctx, globals, options, environment, section_cache
+    ).generate()
@@ -80,7 +80,6 @@ def _get_tags_hash(
     data: Union[pd.DataFrame, pd.Series, float],
     stack_size: int = 1,
     df: Optional[pd.DataFrame] = None,
-    # TODO: Hash entire context
     ctx: Optional["insights.ItemFilterContext"] = None,
     ctx_key: Optional[str] = None,
 ) -> tuple[Hashable, ...]:
@@ -91,6 +90,10 @@ def _get_tags_hash(
         kwargs = {"data": data, "stack_size": stack_size}
     if df is not None:
         kwargs["df"] = _hash_pd_object(df)
+    if ctx is not None and ctx_key is not None:
+        # Also records the overview as read, even if the tags are cached
+        kwargs["ctx_key"] = ctx_key
+        kwargs["ctx"] = ctx.get_fingerprint(ctx_key)
     return cachetools.keys.hashkey(**kwargs)
 
 
@@ -257,11 +260,12 @@ class QuantileThresholdOptions(ThresholdOptions, pydantic.BaseModel):
         ctx: Optional["insights.ItemFilterContext"] = None,
         ctx_key: Optional[str] = None,
     ) -> list[str]:
+        # Bins are cast since rows may hold them as floats, and unbinned
+        # items (bin -1) match no quantile threshold
         get_row_tags = lambda r: [
-            f'Q{r["quartile"]}',
-            f'QU{r["quintile"]}',
-            f'D{r["decile"]}',
-            f'P{r["percentile"]}',
+            f"{scheme.prefix}{int(r[scheme.name])}"
+            for scheme in insights.quantiles.values()
+            if r[scheme.name] >= 0
         ]
         if not isinstance(data, (pd.DataFrame, pd.Series)):
             if ctx is None or ctx_key is None:
@@ -276,19 +280,19 @@ class QuantileThresholdOptions(ThresholdOptions, pydantic.BaseModel):
             return get_row_tags(data)
         if isinstance(data, pd.DataFrame):
             quantiles = data.groupby(list(insights.quantiles.keys()))
+            prefixes = [s.prefix for s in insights.quantiles.values()]
             return [
                 p
                 for i, q in enumerate(zip(*quantiles.groups.keys()))
-                for p in {["Q", "QU", "D", "P"][i] + str(r) for r in q}
+                for p in {prefixes[i] + str(int(r)) for r in q if r >= 0}
             ]
-        chaos_value = data.chaos_value * stack_size
-        rows = ctx.data[ctx_key][
-            ctx.data[ctx_key]["chaos_value"] >= chaos_value
-        ]
-        if not len(rows):
+        row_quantiles = ctx.get_quantiles_for_value(
+            key=ctx_key,
+            min_chaos_value=data.chaos_value * stack_size,
+        )
+        if row_quantiles is None:
             return get_row_tags(data)
-        chaos_values = rows.chaos_value
-        return get_row_tags(rows[chaos_values == chaos_values.min()].iloc[0])
+        return get_row_tags(row_quantiles)
 
 
 ThresholdOptionsType = Union[
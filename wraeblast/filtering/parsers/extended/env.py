@@ -149,9 +149,9 @@ def get_quantile_threshold_tags(
         end = value
     else:
         start = value
-        end = insights.quantiles[quantile]
+        end = insights.quantiles[quantile].bins
     quantiles = range(start, end)
-    prefix = "QU" if quantile == "quintile" else quantile[0].upper()
+    prefix = insights.quantiles[quantile].prefix
     return [f"{prefix}{i}" for i in quantiles]
 
 
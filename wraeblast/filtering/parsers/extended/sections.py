@@ -0,0 +1,343 @@
+"""Incremental rendering of filter templates, section by section.
+
+Templates mark their sections with call blocks of the ``section``
+global::
+
+    {%- call section("invitations") %}
+      ...
+    {%- endcall %}
+
+Rendering a section records the overviews of the filter context it
+reads (see :meth:`~wraeblast.insights.ItemFilterContext.record_dependencies`)
+and the options it reads (e.g. ``options.colormaps.maps``). Given a
+:class:`SectionCache`, its output is cached by hashes of those inputs,
+so that once a refresh changed a few overviews, only the sections that
+read them render again, and cached output is spliced in for the rest.
+
+Sections must only depend on the filter context, the options, template
+globals and imported macros: variables set outside of a section are
+not tracked, and sections rendered within a section are not cached.
+Calls to template functions with side effects (e.g. ``tts``, which
+writes sound files) are cached with the output of sections, and made
+again whenever it is spliced in (see :func:`side_effect`).
+
+"""
+import collections
+import functools
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import types
+from typing import TYPE_CHECKING, Any, Callable, Optional, Union
+
+import jinja2
+import pydantic.json
+import structlog
+
+from wraeblast.filtering.parsers.extended import config
+
+
+if TYPE_CHECKING:
+    from wraeblast import insights
+
+
+logger = structlog.get_logger()
+
+#: Prefix of dependencies on overviews of the filter context
+DATA_PREFIX = "data."
+
+#: Prefix of dependencies on options
+OPTIONS_PREFIX = "options."
+
+
+class SectionCache:
+    """Rendered sections of filter templates, keyed by their inputs.
+
+    Sections are cached in memory, and in ``directory`` if given, so
+    that renders in other processes (e.g. after the next refresh) reuse
+    them. Neither is ever pruned; remove the directory to reset it.
+
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Union[str, pathlib.Path]] = None,
+    ) -> None:
+        self.directory = pathlib.Path(directory) if directory else None
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self._entries: dict[str, str] = {}
+        #: Number of sections spliced from the cache (``hit``) and
+        #: rendered (``miss``)
+        self.stats: collections.Counter = collections.Counter()
+
+    def _read(self, name: str) -> Optional[str]:
+        if name not in self._entries and self.directory is not None:
+            try:
+                self._entries[name] = (self.directory / name).read_text()
+            except FileNotFoundError:
+                return None
+        return self._entries.get(name)
+
+    def _write(self, name: str, s: str) -> None:
+        self._entries[name] = s
+        if self.directory is None:
+            return
+        # Sections may be written by several renders at once
+        fd, path = tempfile.mkstemp(dir=self.directory, prefix=".")
+        with os.fdopen(fd, "w") as f:
+            f.write(s)
+        os.replace(path, self.directory / name)
+
+    def get_dependencies(self, key: str) -> Optional[list[str]]:
+        """Get the inputs a section last rendered with, if it did."""
+        s = self._read(f"{key}.json")
+        return None if s is None else json.loads(s)
+
+    def set_dependencies(self, key: str, dependencies: list[str]) -> None:
+        self._write(f"{key}.json", json.dumps(dependencies))
+
+    def get(self, key: str) -> Optional[tuple[str, list[Any]]]:
+        """Get the output and side effect calls of a section, if cached."""
+        calls = self._read(f"{key}.calls.json")
+        if calls is None:
+            return None
+        output = self._read(f"{key}.txt")
+        return None if output is None else (output, json.loads(calls))
+
+    def set(self, key: str, output: str, calls: list[Any]) -> None:
+        # Calls are written first, so that outputs always have them
+        self._write(f"{key}.calls.json", json.dumps(calls))
+        self._write(f"{key}.txt", output)
+
+
+class _OptionsRecorder:
+    """Record the options read through a Jinja2 environment.
+
+    Options are recorded by their path, up to the items of their
+    mappings (e.g. ``colormaps.maps``).
+
+    """
+
+    def __init__(self, options: config.ItemFilterPrerenderOptions) -> None:
+        self._paths: dict[int, tuple[str, ...]] = {id(options): ()}
+        self.read: set[tuple[str, ...]] = set()
+
+    def record(self, obj: Any, key: Any, value: Any) -> None:
+        path = self._paths.get(id(obj))
+        if path is None:
+            return
+        path = (*path, str(key))
+        self.read.add(path)
+        if not path[:-1] and isinstance(value, dict):
+            self._paths[id(value)] = path
+
+    def get_dependencies(self) -> set[str]:
+        # Mappings are only dependencies when read as a whole
+        parents = {path[:-1] for path in self.read}
+        return {
+            OPTIONS_PREFIX + ".".join(path)
+            for path in self.read
+            if path not in parents
+        }
+
+
+#: Options recorders of the sections rendering
+_options_recorders: list[_OptionsRecorder] = []
+
+
+def record_access(obj: Any, key: Any, value: Any) -> None:
+    """Record an attribute or item read by a template, if an option."""
+    for recorder in _options_recorders:
+        recorder.record(obj, key, value)
+
+
+def is_recording() -> bool:
+    return bool(_options_recorders)
+
+
+#: Side effect calls of the sections rendering, as name, args and kwargs
+_call_recorders: list[list[Any]] = []
+
+#: Template functions with side effects, by name
+_side_effects: dict[str, Callable[..., Any]] = {}
+
+
+def side_effect(name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a template function with side effects, such as ``tts``.
+
+    Calls are recorded by the sections rendering, and made again when
+    their cached output is used. Arguments must be JSON serializable
+    for sections to be cached.
+
+    """
+    _side_effects[name] = func
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        for calls in _call_recorders:
+            calls.append([name, list(args), kwargs])
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def replay_calls(calls: list[Any]) -> None:
+    """Make side effect calls recorded by a section again."""
+    for name, args, kwargs in calls:
+        _side_effects[name](*args, **kwargs)
+
+
+def _hash(value: Any) -> str:
+    try:
+        s = json.dumps(
+            value,
+            default=pydantic.json.pydantic_encoder,
+            sort_keys=True,
+        )
+    except TypeError:
+        s = repr(value)
+    return hashlib.sha1(s.encode()).hexdigest()
+
+
+def get_option_fingerprint(
+    options: config.ItemFilterPrerenderOptions,
+    path: str,
+) -> str:
+    """Get a hash of an option, given its path (e.g. ``colormaps.maps``)."""
+    value: Any = options
+    try:
+        for key in path.split("."):
+            value = (
+                value[key] if isinstance(value, dict) else getattr(value, key)
+            )
+    except (AttributeError, KeyError):
+        return ""
+    return _hash(value)
+
+
+@functools.lru_cache(maxsize=None)
+def get_source_version(environment: jinja2.Environment) -> str:
+    """Get a hash of the sources of every template of an environment.
+
+    Cached sections are keyed by it, so that they render again once
+    any template (e.g. of imported macros) changes.
+
+    """
+    h = hashlib.sha1()
+    if environment.loader is not None:
+        for name in environment.list_templates(extensions=["j2"]):
+            source, _, _ = environment.loader.get_source(environment, name)
+            h.update(name.encode())
+            h.update(source.encode())
+    return h.hexdigest()
+
+
+def get_template_version(
+    template: Union[str, bytes, types.CodeType],
+    environment: jinja2.Environment,
+) -> str:
+    """Get a hash of a template and of the sources of its environment.
+
+    Templates compiled with
+    :func:`~wraeblast.filtering.parsers.extended.compile_template` are
+    identified by their name, and by their source if named by its path.
+
+    """
+    h = hashlib.sha1(get_source_version(environment).encode())
+    if isinstance(template, types.CodeType):
+        h.update(template.co_filename.encode())
+        path = pathlib.Path(template.co_filename)
+        if path.is_file():
+            h.update(path.read_bytes())
+    else:
+        h.update(str(template).encode())
+    return h.hexdigest()
+
+
+class Section:
+    """The ``section`` global of templates, rendering sections once.
+
+    Sections are keyed by their name and the ``version`` of their
+    template (see :func:`get_template_version`). Without a ``cache``,
+    sections are rendered as if they were not sections.
+
+    """
+
+    def __init__(
+        self,
+        ctx: Optional["insights.ItemFilterContext"],
+        options: config.ItemFilterPrerenderOptions,
+        cache: Optional[SectionCache] = None,
+        version: str = "",
+    ) -> None:
+        self.ctx = ctx
+        self.options = options
+        self.cache = cache
+        self.version = version
+        self._rendering = False
+
+    def _get_key(self, name: str) -> str:
+        return _hash([self.version, name, self.ctx is not None])
+
+    def _get_fingerprint(self, dependency: str) -> str:
+        if dependency.startswith(DATA_PREFIX):
+            if self.ctx is None:
+                return ""
+            return self.ctx.get_fingerprint(dependency[len(DATA_PREFIX) :])
+        return get_option_fingerprint(
+            self.options,
+            dependency[len(OPTIONS_PREFIX) :],
+        )
+
+    def _get_entry_key(self, key: str, dependencies: list[str]) -> str:
+        inputs = {d: self._get_fingerprint(d) for d in dependencies}
+        return _hash([key, inputs])
+
+    def __call__(self, name: str, caller: Callable[[], str]) -> str:
+        if self.cache is None or self._rendering:
+            return caller()
+        log = logger.bind(section=name)
+        key = self._get_key(name)
+        dependencies = self.cache.get_dependencies(key)
+        if dependencies is not None:
+            entry = self.cache.get(self._get_entry_key(key, dependencies))
+            if entry is not None:
+                output, calls = entry
+                log.debug("section.hit", calls=len(calls))
+                self.cache.stats["hit"] += 1
+                replay_calls(calls)
+                return output
+
+        log.debug("section.render")
+        self.cache.stats["miss"] += 1
+        recorder = _OptionsRecorder(self.options)
+        _options_recorders.append(recorder)
+        calls: list[Any] = []
+        _call_recorders.append(calls)
+        self._rendering = True
+        try:
+            if self.ctx is not None:
+                with self.ctx.record_dependencies() as keys:
+                    output = caller()
+            else:
+                keys = set()
+                output = caller()
+        finally:
+            self._rendering = False
+            _options_recorders.pop()
+            _call_recorders.pop()
+        dependencies = sorted(
+            {DATA_PREFIX + k for k in keys} | recorder.get_dependencies()
+        )
+        try:
+            self.cache.set(
+                self._get_entry_key(key, dependencies), output, calls
+            )
+        except TypeError:
+            log.warning("section.uncacheable_calls")
+            return output
+        self.cache.set_dependencies(key, dependencies)
+        return output
@@ -0,0 +1,239 @@
+"""Streaming rendering of extended filters, one rule at a time.
+
+Rendered templates are parsed as they are generated, and each rule is
+processed as soon as it is complete, so memory use is proportional to
+a rule rather than to the whole filter. This requires the filter's
+``presets`` and ``styles`` to come before its ``rules``, as they do in
+the bundled templates:
+
+* YAML templates must end with a ``rules`` block sequence. Rules may
+  use anchors defined in the header or in earlier rules.
+* JSON lines templates must emit presets and styles before any rule.
+
+"""
+import itertools
+import json
+import re
+import types
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Iterable,
+    Iterator,
+    Optional,
+    TextIO,
+    Union,
+)
+
+import jinja2
+import ruamel.yaml
+
+from wraeblast.filtering import elements
+from wraeblast.filtering.parsers.extended import (
+    JSONL_MARKER,
+    config,
+    generate,
+    merge_jsonl_fragment,
+    sections,
+)
+
+
+if TYPE_CHECKING:
+    from wraeblast import insights
+
+
+#: The key of a YAML filter document starting its rules
+_rules_key_pattern = re.compile(r"^rules:\s*(#.*)?$")
+
+
+class _SharedAnchorsComposer(ruamel.yaml.composer.Composer):
+    """Composer resolving aliases to anchors of previous documents."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.shared_anchors: dict[str, Any] = {}
+
+    def compose_document(self) -> Any:
+        # Anchors are reset once the document is composed, which leaves
+        # the shared dictionary as is
+        self.anchors = self.shared_anchors
+        return super().compose_document()
+
+
+class _YAMLLoader:
+    """Load parts of a YAML document, keeping anchors between them.
+
+    Parts without anchors or aliases are loaded with the (faster) C
+    loader, and other parts with a pure Python one sharing its anchors.
+
+    """
+
+    def __init__(self) -> None:
+        self._fast = ruamel.yaml.YAML(typ="safe", pure=False)
+        self._anchored = ruamel.yaml.YAML(typ="safe", pure=True)
+        self._anchored.Composer = _SharedAnchorsComposer
+
+    def load(self, s: str) -> Any:
+        if "&" in s or "*" in s:
+            return self._anchored.load(s)
+        return self._fast.load(s)
+
+
+def iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Split chunks of text into lines, keeping their line endings."""
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        if "\n" not in buffer:
+            continue
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line + "\n"
+    if buffer:
+        yield buffer
+
+
+def _is_blank(line: str) -> bool:
+    line = line.strip()
+    return not line or line.startswith("#")
+
+
+def _iter_yaml_intermediate(
+    lines: Iterator[str],
+) -> Iterator[tuple[str, dict[str, Any]]]:
+    yaml = _YAMLLoader()
+    header = []
+    for line in lines:
+        if _rules_key_pattern.match(line):
+            break
+        header.append(line)
+    document = yaml.load("".join(header)) or {}
+    # Rules given inline (e.g. "rules: []") are not streamed
+    rules = document.pop("rules", [])
+    yield "header", document
+    for rule in rules:
+        yield "rule", rule
+
+    item: list[str] = []
+    indent = None
+    for line in lines:
+        if _is_blank(line):
+            if item:
+                item.append(line)
+            continue
+        line_indent = len(line) - len(line.lstrip(" "))
+        is_item = line.lstrip(" ")[:2] in ("-", "- ", "-\n")
+        if indent is None:
+            if not is_item:
+                raise ValueError("streamed rules must be a block sequence")
+            indent = line_indent
+        if line_indent < indent or (line_indent == indent and not is_item):
+            raise ValueError("rules must end streamed YAML templates")
+        if line_indent == indent and item:
+            for rule in yaml.load("".join(item)):
+                yield "rule", rule
+            item = []
+        item.append(line)
+    if item:
+        for rule in yaml.load("".join(item)):
+            yield "rule", rule
+
+
+def _iter_jsonl_intermediate(
+    lines: Iterator[str],
+) -> Iterator[tuple[str, dict[str, Any]]]:
+    header: dict[str, Any] = {}
+    in_rules = False
+    for line in lines:
+        if _is_blank(line):
+            continue
+        fragment = json.loads(line)
+        rules = fragment.pop("rules", None)
+        if fragment:
+            if in_rules:
+                raise ValueError(
+                    "streamed JSON lines templates must emit presets and "
+                    "styles before rules"
+                )
+            merge_jsonl_fragment(header, fragment)
+        if rules is not None:
+            if not in_rules:
+                in_rules = True
+                yield "header", header
+            for rule in rules:
+                yield "rule", rule
+    if not in_rules:
+        yield "header", header
+
+
+def iter_intermediate(
+    chunks: Iterable[str],
+) -> Iterator[tuple[str, dict[str, Any]]]:
+    """Incrementally load a rendered template.
+
+    Yields ``("header", document)`` once, with everything but the rules
+    of the filter, then ``("rule", rule)`` for each of its rules.
+
+    """
+    lines = iter_lines(chunks)
+    leading = []
+    for line in lines:
+        leading.append(line)
+        if line.strip():
+            break
+    lines = itertools.chain(leading, lines)
+    if leading and leading[-1].strip().startswith(JSONL_MARKER):
+        return _iter_jsonl_intermediate(lines)
+    return _iter_yaml_intermediate(lines)
+
+
+def iter_rules(
+    s: Union[str, bytes, types.CodeType, Iterable[str]],
+    search_path: str = "filters/",
+    ctx: Optional["insights.ItemFilterContext"] = None,
+    globals: Optional[dict[str, Any]] = None,
+    options: Optional[config.ItemFilterPrerenderOptions] = None,
+    pre_rendered: bool = False,
+    environment: Optional[jinja2.Environment] = None,
+    preset: str = "default",
+    intermediate: Optional[TextIO] = None,
+    section_cache: Optional[sections.SectionCache] = None,
+) -> Iterator[elements.Rule]:
+    """Render a filter template, yielding each rule once processed.
+
+    Rules come out as they would be in the ``ItemFilter`` returned by
+    :func:`wraeblast.filtering.parsers.extended.loads`, once ``preset``
+    applied. If ``pre_rendered``, ``s`` is an intermediate template, or
+    chunks of one (e.g. a file). The rendered intermediate template is
+    also written to ``intermediate``, if given. Sections of the template
+    are cached in ``section_cache``, if given.
+
+    """
+    if pre_rendered:
+        chunks = [s] if isinstance(s, str) else s
+    else:
+        chunks = generate(
+            s,  # type: ignore
+            search_path=search_path,
+            ctx=ctx,
+            globals=globals,
+            options=options,
+            environment=environment,
+            section_cache=section_cache,
+        )
+    if intermediate is not None:
+        chunks = _tee(chunks, intermediate)
+    documents = iter_intermediate(chunks)  # type: ignore
+    _, header = next(documents)
+    item_filter = elements.ItemFilter(**header)
+    for _, rule in documents:
+        yield item_filter.process_rule(
+            elements.Rule(**rule),
+            preset_name=preset,
+        )
+
+
+def _tee(chunks: Iterable[str], f: TextIO) -> Iterator[str]:
+    for chunk in chunks:
+        f.write(chunk)
+        yield chunk
@@ -1,4 +1,5 @@
 import enum
+import typing
 
 from wraeblast import types
 from wraeblast.filtering import colors, elements
@@ -119,3 +120,15 @@ def dumps(
         s += serialize_rule(rule, indent=indent, soft_tabs=soft_tabs)
         s += "\n"
     return s
+
+
+def dump(
+    rules: typing.Iterable[elements.Rule],
+    f: typing.TextIO,
+    indent: int = 4,
+    soft_tabs: bool = True,
+) -> None:
+    """Write rules to a file as they come, as :func:`dumps` would."""
+    for rule in rules:
+        f.write(serialize_rule(rule, indent=indent, soft_tabs=soft_tabs))
+        f.write("\n")
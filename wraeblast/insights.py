@@ -1,11 +1,23 @@
+import asyncio
 import collections.abc
+import contextlib
+import datetime
 import enum
+import functools
+import hashlib
+import json
 import os
+import pathlib
+import pickle
+import tempfile
 from typing import (
     TYPE_CHECKING,
     Annotated,
     Any,
     AsyncGenerator,
+    Callable,
+    Iterator,
+    Literal,
     Optional,
     Union,
 )
@@ -18,17 +30,31 @@ import pydantic
 import structlog
 import uplink
 import uplink.converters
-from pandera.decorators import check_io, check_output
-from pandera.errors import SchemaError
 from pandera.model import SchemaModel
 from pandera.model_components import Field
+from pandera.schemas import DataFrameSchema
 from pandera.typing import Series, String
 
-from wraeblast import constants, errors
+from wraeblast import constants, errors, storage
 from wraeblast.filtering.elements import ItemFilter
 from wraeblast.filtering.parsers.extended import env
 
 
+try:
+    import brotli  # noqa: F401
+
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+try:
+    import orjson
+
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
 if TYPE_CHECKING:
     import uplink.commands
 
@@ -44,15 +70,58 @@ SingleInfluencedQcutItemsType = list[
 ]
 InsightsResultType = tuple[
     Union["CurrencyType", "ItemType"],
-    pd.DataFrame,
+    "NinjaOverviewResponse",
 ]
 InsightsType = Union["CurrencyType", "ItemType"]
 
-quantiles = {
-    "quartile": 4,
-    "quintile": 5,
-    "decile": 10,
-    "percentile": 100,
+#: Version of the post-processing applied by ``ItemFilterContext``, bump
+#: whenever it changes to invalidate existing context snapshots
+context_snapshot_version = 5
+
+#: Fields decoded from each line of an overview response, as dotted paths
+#: into the line. Everything else (icons, sparkline values, modifiers, the
+#: "receive" side of currency pairs) is never materialized.
+overview_fields = (
+    # CurrencyOverview
+    "currencyTypeName",
+    "chaosEquivalent",
+    "pay.id",
+    "pay.league_id",
+    "pay.pay_currency_id",
+    "pay.get_currency_id",
+    "pay.sample_time_utc",
+    "pay.count",
+    "pay.value",
+    "pay.data_point_count",
+    "pay.includes_secondary",
+    "pay.listing_count",
+    "receive.get_currency_id",
+    # ItemOverview
+    "id",
+    "name",
+    "itemClass",
+    "chaosValue",
+    "exaltedValue",
+    "count",
+    "baseType",
+    "gemLevel",
+    "gemQuality",
+    "itemLevel",
+    "levelRequired",
+    "links",
+    "mapTier",
+    "skillGemName",
+    "stackSize",
+    "variant",
+    "tradeInfo",
+    "sparkline.data",
+    # Both
+    "detailsId",
+)
+#: Decoded column names, keyed by split field path
+overview_columns = {
+    tuple(field.split(".")): inflection.underscore(field)
+    for field in overview_fields
 }
 shard_names_to_orb_names = {
     "Transmutation Shard": "Orb of Transmutation",
@@ -71,10 +140,90 @@ shard_names_to_orb_names = {
 }
 
 
-def _create_hdfstore(path: Optional[str] = None) -> pd.HDFStore:
-    if not path:
-        path = os.getenv("WRAEBLAST_CACHE", "./.wbinsights.h5")
-    return pd.HDFStore(path)
+def _create_store(url: Optional[str] = None) -> storage.InsightsStore:
+    if not url:
+        url = os.getenv("WRAEBLAST_CACHE", "./.wbinsights.h5")
+    return storage.open_store(url)
+
+
+def _get_cache_key(league: str, type_: "InsightsType") -> str:
+    return f"l_{get_league_slug(league)}/i_{type_.value}"
+
+
+def _get_legacy_cache_key(type_: "InsightsType") -> str:
+    # Overviews were cached without a league before stores were
+    # namespaced, these keys are no longer read
+    return f"i_{type_.value}"
+
+
+def _get_history_key(league: str, type_: "CurrencyType") -> str:
+    return f"l_{get_league_slug(league)}/h_{type_.value}"
+
+
+def get_league_slug(league: str) -> str:
+    return inflection.parameterize(league, separator="_")
+
+
+def get_overview_metadata(
+    store: storage.InsightsStore,
+    key: str,
+) -> Optional["OverviewMetadata"]:
+    """Get the metadata stored alongside a cached overview, if any."""
+    metadata = store.get_metadata(key)
+    if metadata is None:
+        return None
+    return OverviewMetadata.parse_raw(metadata)
+
+
+def set_overview_metadata(
+    store: storage.InsightsStore,
+    key: str,
+    metadata: "OverviewMetadata",
+) -> None:
+    """Store metadata alongside a cached overview."""
+    store.set_metadata(key, metadata.json())
+
+
+def get_data_version(
+    store: storage.InsightsStore,
+    league: str,
+    columns: Optional[collections.abc.Iterable[str]] = None,
+    compact: bool = False,
+) -> Optional[str]:
+    """Get a digest identifying the cached overviews of a league.
+
+    The digest changes whenever any overview is rewritten, or when the
+    schema or post-processing of overviews change. Returns ``None`` if
+    any overview has no metadata to derive a version from. Contexts
+    loaded with a column projection are versioned by its ``columns``,
+    and compacted contexts by ``compact``.
+
+    """
+    versions = []
+    for t in get_all_insights_types():
+        key = _get_cache_key(league, t)
+        metadata = get_overview_metadata(store, key)
+        if metadata is None:
+            return None
+        # Conditional refreshes update fetched_at without touching data
+        exclude = (
+            {"fetched_at"}
+            if metadata.etag or metadata.last_modified
+            else set()
+        )
+        versions.append((key, metadata.json(exclude=exclude)))
+    for t in CurrencyType:
+        key = _get_history_key(league, t)
+        metadata = get_overview_metadata(store, key)
+        if metadata is not None:
+            versions.append((key, metadata.json()))
+    versions.append((overview_schema_fingerprint, context_snapshot_version))
+    versions.extend(s.json() for s in quantiles.values())
+    if columns is not None:
+        versions.append(sorted(columns))
+    if compact:
+        versions.append("compact")
+    return hashlib.sha1(repr(versions).encode()).hexdigest()
 
 
 class InflectedEnumMixin(enum.Enum):
@@ -123,10 +272,111 @@ class ItemType(InflectedEnumMixin, enum.Enum):
         return inflection.pluralize(inflection.underscore(self.value))
 
 
+#: Default time-to-live of cached overviews
+default_cache_ttl = datetime.timedelta(hours=1)
+
+#: Time-to-live of cached overviews per insights type, where it differs
+#: from :data:`default_cache_ttl`
+cache_ttls: dict[InsightsType, datetime.timedelta] = {
+    CurrencyType.CURRENCY: datetime.timedelta(minutes=15),
+    CurrencyType.FRAGMENT: datetime.timedelta(minutes=15),
+    ItemType.DIVINATION_CARD: datetime.timedelta(minutes=30),
+    ItemType.SCARAB: datetime.timedelta(minutes=30),
+    ItemType.BASE_TYPE: datetime.timedelta(hours=3),
+    ItemType.HELMET_ENCHANT: datetime.timedelta(hours=6),
+    ItemType.UNIQUE_ACCESSORY: datetime.timedelta(hours=3),
+    ItemType.UNIQUE_ARMOUR: datetime.timedelta(hours=3),
+    ItemType.UNIQUE_FLASK: datetime.timedelta(hours=3),
+    ItemType.UNIQUE_JEWEL: datetime.timedelta(hours=3),
+    ItemType.UNIQUE_MAP: datetime.timedelta(hours=3),
+    ItemType.UNIQUE_WEAPON: datetime.timedelta(hours=3),
+}
+
+
+def get_cache_ttl(
+    type_: InsightsType,
+    ttls: Optional[dict[InsightsType, datetime.timedelta]] = None,
+) -> datetime.timedelta:
+    """Get the time-to-live of a cached overview.
+
+    TTLs given in ``ttls`` take precedence over :data:`cache_ttls`.
+
+    """
+    if ttls is not None and type_ in ttls:
+        return ttls[type_]
+    return cache_ttls.get(type_, default_cache_ttl)
+
+
+def get_cache_index(
+    store: storage.InsightsStore,
+    league: Optional[str] = None,
+    ttls: Optional[dict[InsightsType, datetime.timedelta]] = None,
+) -> pd.DataFrame:
+    """Get a summary of cached overviews from their stored metadata.
+
+    Only node metadata is read, not the overviews themselves.
+
+    Args:
+        store: Insights cache.
+        league (str, optional): Only include overviews of this league.
+        ttls (dict, optional): TTL overrides per insights type.
+
+    Returns:
+        pd.DataFrame: One row per cached overview, with *league*,
+        *type*, *key*, *rows*, *fetched_at*, *expires_at*, *expired*,
+        *etag* and *last_modified* columns.
+
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    records = []
+    for key in store.keys():
+        if not key.rsplit("/", 1)[-1].startswith("i_"):
+            continue
+        metadata = get_overview_metadata(store, key)
+        if metadata is None or metadata.league is None:
+            continue
+        if league is not None and metadata.league != league:
+            continue
+        type_ = get_insights_type_by_value(str(metadata.type))
+        ttl = get_cache_ttl(type_, ttls)
+        expires_at = (
+            metadata.fetched_at + ttl
+            if metadata.fetched_at is not None
+            else None
+        )
+        records.append(
+            {
+                "league": metadata.league,
+                "type": metadata.type,
+                "key": key,
+                "rows": metadata.rows,
+                "fetched_at": metadata.fetched_at,
+                "expires_at": expires_at,
+                "expired": metadata.is_expired(ttl, now=now),
+                "etag": metadata.etag,
+                "last_modified": metadata.last_modified,
+            }
+        )
+    return pd.DataFrame.from_records(
+        records,
+        columns=[
+            "league",
+            "type",
+            "key",
+            "rows",
+            "fetched_at",
+            "expires_at",
+            "expired",
+            "etag",
+            "last_modified",
+        ],
+    )
+
+
 @uplink.response_handler
 def raise_for_status(response):
     """Checks whether or not the response was successful."""
-    if 200 <= response.status_code < 300:
+    if 200 <= response.status_code < 300 or response.status_code == 304:
         return response
 
     raise errors.UnsuccessfulInsightsRequest(
@@ -152,6 +402,32 @@ def get_display_value(
         return f"{chaos_value / exalted_exchange_value:.{precision}f}ex"
 
 
+def get_display_values(
+    chaos_values: Union[pd.Series, collections.abc.Sequence[float]],
+    exalted_exchange_value: int,
+    round_down_by: int = 1,
+    precision: int = 0,
+) -> pd.Series:
+    """Vectorized :func:`get_display_value`."""
+    if not isinstance(chaos_values, pd.Series):
+        chaos_values = pd.Series(chaos_values)
+    is_chaos = chaos_values < exalted_exchange_value
+    chaos = chaos_values[is_chaos]
+    if round_down_by:
+        chaos = round_down_by * (chaos // round_down_by)
+        chaos = chaos.astype(np.int64)
+    exalted = chaos_values[~is_chaos] / exalted_exchange_value
+    display_values = pd.Series("", index=chaos_values.index, dtype=object)
+    display_values[is_chaos] = chaos.astype(str) + "c"
+    display_values[~is_chaos] = (
+        np.char.mod(f"%.{precision}f", exalted.to_numpy(dtype=float)).astype(
+            object
+        )
+        + "ex"
+    )
+    return display_values
+
+
 def get_insights_type_by_value(s: str) -> InsightsType:
     for t in get_all_insights_types():
         if t.value == s:
@@ -159,25 +435,145 @@ def get_insights_type_by_value(s: str) -> InsightsType:
     raise KeyError(s)
 
 
+def get_insights_type_by_name(s: str) -> InsightsType:
+    """Get an insights type by value (``SkillGem``) or key (``skill_gems``)."""
+    for t in get_all_insights_types():
+        if s in (t.value, t.pluralized_underscored_value):
+            return t
+    raise KeyError(s)
+
+
+def get_overview_endpoint(type_: InsightsType) -> str:
+    """Get the name of the poe.ninja endpoint serving the given type."""
+    if isinstance(type_, CurrencyType):
+        return "CurrencyOverview"
+    elif isinstance(type_, ItemType):
+        return "ItemOverview"
+    raise RuntimeError(f"invalid insights type: {type_}")
+
+
+class QuantileScheme(pydantic.BaseModel):
+    """A scheme binning the items of an overview by chaos value.
+
+    Attributes:
+        name (str): Name of the column holding each item's bin.
+        prefix (str): Prefix of quantile names and tags (e.g. "Q" for
+            "Q3", the fourth quartile).
+        bins (int): Number of bins.
+        by (str): Either "rank", for bins holding equal numbers of items
+            (i.e. quantiles), or "log", for bins of equal width in log
+            chaos value.
+
+    """
+
+    name: str
+    prefix: str
+    bins: int
+    by: Literal["rank", "log"] = "rank"
+
+    def get_bins(
+        self,
+        ranks: np.ndarray,
+        log_values: np.ndarray,
+    ) -> np.ndarray:
+        """Bin items given their ranks (from 1) and log chaos values.
+
+        Rank bins are identical to those of ``pd.qcut`` over the ranks,
+        but are computed from their count alone. Items that cannot be
+        binned get bin -1, so that bins are always integers.
+
+        """
+        if self.by == "rank":
+            values = ranks
+            # Linear interpolation of the quantiles of 1..n, as np.quantile
+            position = (len(ranks) - 1) * np.linspace(0, 1, self.bins + 1)
+            edges = 1 + position
+        else:
+            values = log_values
+            # Items without a (positive) chaos value are left unbinned
+            finite = log_values[np.isfinite(log_values)]
+            if not len(finite):
+                return np.full(len(log_values), -1, dtype=np.int64)
+            edges = np.linspace(finite.min(), finite.max(), self.bins + 1)
+        if len(edges) != 2:
+            edges = np.unique(edges)
+        ids = np.searchsorted(edges, values, side="left").astype(np.int64)
+        ids[values == edges[0]] = 1
+        ids[(ids == len(edges)) | (ids == 0)] = 0
+        return ids - 1
+
+
+#: Registered quantile schemes, keyed by name
+quantiles: dict[str, QuantileScheme] = {}
+
+
+def register_quantile_scheme(
+    name: str,
+    prefix: str,
+    bins: int,
+    by: Literal["rank", "log"] = "rank",
+) -> QuantileScheme:
+    """Register a scheme to bin overviews by.
+
+    Each scheme adds a column to transformed overviews, and its bins can
+    be used as quantiles in filter thresholds (e.g. ``V19`` for the top
+    vigintile of a scheme with prefix "V").
+
+    """
+    if prefix in {s.prefix for s in quantiles.values() if s.name != name}:
+        raise ValueError(f"quantile prefix already registered: {prefix}")
+    scheme = QuantileScheme(name=name, prefix=prefix, bins=bins, by=by)
+    quantiles[name] = scheme
+    return scheme
+
+
+register_quantile_scheme("quartile", "Q", 4)
+register_quantile_scheme("quintile", "QU", 5)
+register_quantile_scheme("decile", "D", 10)
+register_quantile_scheme("percentile", "P", 100)
+
+
+def get_quantiles(
+    chaos_values: pd.Series,
+    schemes: Optional[collections.abc.Iterable[QuantileScheme]] = None,
+) -> pd.DataFrame:
+    """Bin chaos values by every quantile scheme, ranking them once."""
+    if schemes is None:
+        schemes = quantiles.values()
+    ranks = chaos_values.rank(method="first").to_numpy()
+    log_values = np.log(chaos_values.to_numpy(dtype=float))
+    return pd.DataFrame(
+        {s.name: s.get_bins(ranks, log_values) for s in schemes},
+        index=chaos_values.index,
+    )
+
+
 def get_quantile_tuple(q: str) -> tuple[str, int]:
-    if q.startswith("D"):
-        return ("decile", int(q[1:]))
-    elif q.startswith("P"):
-        return ("percentile", int(q[1:]))
-    elif q.startswith("QU"):
-        return ("quintile", int(q[2:]))
-    elif q.startswith("Q"):
-        return ("quartile", int(q[1:]))
-    else:
-        raise RuntimeError(f"invalid quantile: {q}")
+    """Get the scheme name and bin of a quantile name (e.g. "QU4")."""
+    for scheme in sorted(
+        quantiles.values(),
+        key=lambda s: len(s.prefix),
+        reverse=True,
+    ):
+        if q.startswith(scheme.prefix) and q[len(scheme.prefix) :].isdigit():
+            return (scheme.name, int(q[len(scheme.prefix) :]))
+    raise RuntimeError(f"invalid quantile: {q}")
 
 
 async def get_economy_overview(
     league: str,
     client: "NinjaConsumer",
     type_: InsightsType,
-) -> pd.DataFrame:
-    """Request an economy overview from poe.ninja."""
+    validators: Optional["OverviewMetadata"] = None,
+) -> "NinjaOverviewResponse":
+    """Request an economy overview from poe.ninja.
+
+    If ``validators`` are given, the request is made conditional on the
+    overview having changed since it was last fetched. Unchanged
+    overviews result in a response without data. Otherwise, the
+    overview is transformed and validated for the given type.
+
+    """
     if type_ in CurrencyType:
         meth = client.get_currency_overview
     elif type_ in ItemType:
@@ -188,89 +584,610 @@ async def get_economy_overview(
         "overview.get",
         client=".".join([client.__module__, client.__class__.__name__]),
         type=type_.value,
+        conditional=validators is not None,
+    )
+    if validators is None:
+        validators = OverviewMetadata()
+    response = await meth(
+        league=league,
+        type=type_.value,
+        if_none_match=validators.etag,
+        if_modified_since=validators.last_modified,
+    )  # type: ignore
+    if response.not_modified:
+        return response
+    return NinjaOverviewResponse(
+        data=transform_ninja_df(response.data, type_=type_),
+        metadata=response.metadata.copy(
+            update={"schema_fingerprint": overview_schema_fingerprint},
+        ),
     )
-    return await meth(league=league, type=type_.value)  # type: ignore
 
 
 async def get_dataframes(
     league: str,
     types: list[InsightsType],
+    session: Optional["NinjaSession"] = None,
+    max_concurrency: int = 8,
+    validators: Optional[dict[InsightsType, "OverviewMetadata"]] = None,
 ) -> AsyncGenerator[InsightsResultType, None]:
-    """Request all economy overviews from poe.ninja."""
-    logger.info("all_insights.get", league=league)
-    session = aiohttp.ClientSession()
-    client = uplink.AiohttpClient(session=session)
-    ninja = NinjaConsumer(
-        base_url=NinjaConsumer.default_base_url,
-        client=client,
-    )
-    for t in types:
-        overview = await get_economy_overview(
-            league=league,
-            client=ninja,
-            type_=t,
-        )
-        yield (t, overview)
-    await session.close()
+    """Request economy overviews from poe.ninja concurrently.
+
+    Requests are fanned out per endpoint, with the number of in-flight
+    requests bounded by both ``max_concurrency`` and the endpoint's
+    rate limit budget declared in :attr:`NinjaConsumer.ratelimits`.
+    Overviews are yielded in the order they complete.
+
+    If ``session`` is not provided, a new :class:`NinjaSession` is
+    opened for the duration of the requests. Types with an entry in
+    ``validators`` are requested conditionally.
+
+    """
+    if validators is None:
+        validators = {}
+    if session is None:
+        async with NinjaSession() as session:
+            async for result in get_dataframes(
+                league=league,
+                types=types,
+                session=session,
+                max_concurrency=max_concurrency,
+                validators=validators,
+            ):
+                yield result
+        return
+    logger.info("all_insights.get", league=league, types=len(types))
+    ninja = session.consumer
+    semaphores = {
+        endpoint: asyncio.Semaphore(min(calls, max_concurrency))
+        for endpoint, (calls, _) in NinjaConsumer.ratelimits.items()
+    }
+
+    async def fetch(t: InsightsType) -> InsightsResultType:
+        async with semaphores[get_overview_endpoint(t)]:
+            overview = await get_economy_overview(
+                league=league,
+                client=ninja,
+                type_=t,
+                validators=validators.get(t),
+            )
+            return (t, overview)
+
+    tasks = [asyncio.ensure_future(fetch(t)) for t in types]
+    try:
+        for next_completed in asyncio.as_completed(tasks):
+            yield await next_completed
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Cancelled requests must end before the session is closed
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
 async def initialize_insights_cache(
     league: str,
-    store: Optional[pd.HDFStore] = None,
+    store: Optional[storage.InsightsStore] = None,
     no_sync: bool = False,
-) -> pd.HDFStore:
-    """Fetch and cache economy insights as needed."""
+    types: Optional[list[InsightsType]] = None,
+    session: Optional["NinjaSession"] = None,
+    refresh: bool = False,
+    ttls: Optional[dict[InsightsType, datetime.timedelta]] = None,
+) -> storage.InsightsStore:
+    """Fetch and cache economy insights as needed.
+
+    Overviews are cached per league, so a single store can serve
+    multiple leagues. If ``types`` is given, only that subset of
+    overviews is checked and synced, otherwise all insights types are.
+    Pass a ``session`` to reuse pooled connections across multiple
+    syncs.
+
+    If ``refresh`` is true, cached overviews older than their TTL (see
+    :func:`get_cache_ttl`) are re-requested using the HTTP validators
+    (``ETag`` and ``Last-Modified``) stored with them, and are only
+    decoded, transformed and rewritten if poe.ninja reports that they
+    have changed.
+
+    Overviews cached before stores were namespaced by league are not
+    read. Such stores must be synced again, so they raise an
+    :class:`~wraeblast.errors.InsightsError` if ``no_sync`` is true.
+
+    """
     if store is None:
-        store = _create_hdfstore()
+        store = _create_store()
+    if types is None:
+        types = get_all_insights_types()
     log = logger.bind(league=league)
     log.info("cache.initialize", league=league)
+    now = datetime.datetime.now(datetime.timezone.utc)
     missing_dataframes = []
-    for t in get_all_insights_types():
-        try:
-            df = store.get(f"i_{t.value}")
-            log.debug("cache.hit", type=t.value)
-        except KeyError:
+    validators = {}
+    for t in types:
+        if _get_cache_key(league, t) not in store:
             log.debug("cache.miss", type=t.value)
             missing_dataframes.append(t)
+            continue
+        log.debug("cache.hit", type=t.value)
+        if refresh:
+            metadata = get_overview_metadata(store, _get_cache_key(league, t))
+            if metadata is None:
+                metadata = OverviewMetadata()
+            if metadata.is_expired(get_cache_ttl(t, ttls), now=now):
+                log.debug("cache.expired", type=t.value)
+                validators[t] = metadata
+    legacy_types = [
+        t for t in missing_dataframes if _get_legacy_cache_key(t) in store
+    ]
+    if legacy_types:
+        log.warning(
+            "cache.legacy_layout",
+            types=[t.value for t in legacy_types],
+        )
     if missing_dataframes and no_sync:
+        if legacy_types:
+            raise errors.InsightsError(
+                "insights cache has the layout of an older version of "
+                "wraeblast, which is no longer read; sync it again (e.g. "
+                "with sync_insights) to cache overviews by league"
+            )
         raise errors.WraeblastError("insights cache is incomplete")
-    async for t, df in get_dataframes(
+    requested_types = [*missing_dataframes, *validators.keys()]
+    if not requested_types:
+        return store
+    async for t, response in get_dataframes(
         league=league,
-        types=missing_dataframes,
+        types=requested_types,
+        session=session,
+        validators=validators,
     ):
+        key = _get_cache_key(league, t)
+        if response.not_modified:
+            log.info("overview.not_modified", type=t.value)
+            set_overview_metadata(
+                store,
+                key,
+                response.metadata.merge(validators[t]),
+            )
+            continue
         log.info(
             "overview.response",
-            lines=df.shape[0],
+            lines=response.data.shape[0],
             type=t.value,
         )
-        store.put(f"i_{t.value}", df, format="table")
+        store.put(key, response.data)
+        set_overview_metadata(
+            store,
+            key,
+            response.metadata.copy(
+                update={
+                    "league": league,
+                    "type": t.value,
+                    "rows": response.data.shape[0],
+                },
+            ),
+        )
     return store
 
 
+async def sync_insights(
+    leagues: list[str],
+    store: Optional[storage.InsightsStore] = None,
+    session: Optional["NinjaSession"] = None,
+    **kwargs: Any,
+) -> storage.InsightsStore:
+    """Sync economy insights of one or more leagues into a single store.
+
+    All leagues are synced over a single :class:`NinjaSession`. Extra
+    keyword arguments are passed to :func:`initialize_insights_cache`.
+
+    """
+    if store is None:
+        store = _create_store()
+    if session is None:
+        async with NinjaSession() as session:
+            return await sync_insights(
+                leagues=leagues,
+                store=store,
+                session=session,
+                **kwargs,
+            )
+    for league in leagues:
+        await initialize_insights_cache(
+            league=league,
+            store=store,
+            session=session,
+            **kwargs,
+        )
+    return store
+
+
+#: Number of days currency history aggregates are computed over by default
+history_window = 7
+
+
+def get_currency_ids(
+    store: storage.InsightsStore,
+    league: str,
+    type_: "CurrencyType",
+) -> dict[int, str]:
+    """Get poe.ninja IDs of a league's cached currencies, with names."""
+    df = store.get(_get_cache_key(league, type_))
+    if "currency_id" not in df.columns:
+        raise KeyError("currency_id")
+    df = df[df["currency_id"].notna()]
+    return dict(zip(df["currency_id"].astype(int), df["item_name"]))
+
+
+def get_history_last_dates(
+    store: storage.InsightsStore,
+    key: str,
+) -> dict[int, pd.Timestamp]:
+    """Get the date of the latest sample of each currency in a history."""
+    if key not in store:
+        return {}
+    df = store.select(key, columns=["currency_id"]).reset_index()
+    return df.groupby("currency_id")["date"].max().to_dict()
+
+
+async def get_currency_history(
+    league: str,
+    client: "NinjaConsumer",
+    type_: "CurrencyType",
+    currency_id: int,
+) -> "NinjaCurrencyHistoryResponse":
+    """Request the daily price history of a currency from poe.ninja."""
+    logger.info(
+        "history.get",
+        type=type_.value,
+        currency_id=currency_id,
+    )
+    return await client.get_currency_history(
+        league=league,
+        type=type_.value,
+        currency_id=currency_id,
+    )  # type: ignore
+
+
+async def sync_currency_history(
+    league: str,
+    store: Optional[storage.InsightsStore] = None,
+    types: Optional[list["CurrencyType"]] = None,
+    item_names: Optional[collections.abc.Container[str]] = None,
+    session: Optional["NinjaSession"] = None,
+    max_concurrency: int = 8,
+    now: Optional[datetime.datetime] = None,
+) -> storage.InsightsStore:
+    """Incrementally sync the price history of currencies.
+
+    Histories are stored per league and currency type as date-indexed
+    tables with one row per currency and day. Only currencies without a
+    sample for the last full day are requested, and only days newer
+    than their latest stored sample are appended.
+    The current, partial day is never stored.
+
+    As the history endpoint is heavily rate limited, ``item_names`` can
+    restrict the sync to a subset of currencies. Currency IDs are taken
+    from the cached currency overviews, which are synced first as needed.
+
+    """
+    if store is None:
+        store = _create_store()
+    if types is None:
+        types = list(CurrencyType)
+    if session is None:
+        async with NinjaSession() as session:
+            return await sync_currency_history(
+                league=league,
+                store=store,
+                types=types,
+                item_names=item_names,
+                session=session,
+                max_concurrency=max_concurrency,
+                now=now,
+            )
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+    today = pd.Timestamp(now.date())
+    log = logger.bind(league=league)
+    await initialize_insights_cache(
+        league=league,
+        store=store,
+        types=list(types),
+        session=session,
+    )
+    semaphore = asyncio.Semaphore(
+        min(NinjaConsumer.ratelimits["CurrencyHistory"][0], max_concurrency)
+    )
+
+    async def fetch(
+        t: CurrencyType,
+        currency_id: int,
+    ) -> tuple[int, "NinjaCurrencyHistoryResponse"]:
+        async with semaphore:
+            return (
+                currency_id,
+                await get_currency_history(
+                    league=league,
+                    client=session.consumer,
+                    type_=t,
+                    currency_id=currency_id,
+                ),
+            )
+
+    for t in types:
+        try:
+            currency_ids = get_currency_ids(store, league, t)
+        except KeyError:
+            # Cached before currency IDs were kept, so sync it again
+            store.remove(_get_cache_key(league, t))
+            await initialize_insights_cache(
+                league=league,
+                store=store,
+                types=[t],
+                session=session,
+            )
+            currency_ids = get_currency_ids(store, league, t)
+        key = _get_history_key(league, t)
+        last_dates = get_history_last_dates(store, key)
+        yesterday = today - pd.Timedelta(days=1)
+        due = [
+            currency_id
+            for currency_id, item_name in currency_ids.items()
+            if last_dates.get(currency_id, pd.Timestamp.min) < yesterday
+            and (item_names is None or item_name in item_names)
+        ]
+        log.info("history.sync", type=t.value, due=len(due))
+        samples = []
+        tasks = [
+            asyncio.ensure_future(fetch(t, currency_id)) for currency_id in due
+        ]
+        try:
+            for next_completed in asyncio.as_completed(tasks):
+                currency_id, response = await next_completed
+                df = response.data
+                df = df[df["days_ago"] >= 1]
+                df = df.assign(
+                    date=today - pd.to_timedelta(df["days_ago"], unit="D"),
+                    currency_id=currency_id,
+                    item_name=currency_ids[currency_id],
+                )
+                last_date = last_dates.get(currency_id)
+                if last_date is not None:
+                    df = df[df["date"] > last_date]
+                samples.append(df)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        new_samples = (
+            pd.concat(samples, ignore_index=True) if samples else None
+        )
+        if new_samples is None or new_samples.empty:
+            continue
+        new_samples = new_samples[
+            [
+                "date",
+                "currency_id",
+                "item_name",
+                "chaos_value",
+                "pay_value",
+                "pay_count",
+                "receive_value",
+                "receive_count",
+            ]
+        ].sort_values(["date", "currency_id"])
+        store.append(
+            key,
+            new_samples.set_index("date"),
+            data_columns=["currency_id"],
+            min_itemsize={"item_name": 100},
+        )
+        metadata = get_overview_metadata(store, key) or OverviewMetadata()
+        set_overview_metadata(
+            store,
+            key,
+            metadata.copy(
+                update={
+                    "fetched_at": now,
+                    "league": league,
+                    "type": t.value,
+                    "rows": (metadata.rows or 0) + len(new_samples),
+                },
+            ),
+        )
+        log.info("history.append", type=t.value, rows=len(new_samples))
+    return store
+
+
+def load_currency_history(
+    store: storage.InsightsStore,
+    league: str,
+) -> Optional[pd.DataFrame]:
+    """Load all synced currency history of a league, if any."""
+    histories = [
+        store.select(key).reset_index()
+        for key in (_get_history_key(league, t) for t in CurrencyType)
+        if key in store
+    ]
+    if not histories:
+        return None
+    return pd.concat(histories, ignore_index=True)
+
+
+def get_history_aggregates(
+    history: pd.DataFrame,
+    window: int = history_window,
+) -> pd.DataFrame:
+    """Aggregate the last ``window`` days of currency history.
+
+    Returns:
+        pd.DataFrame: Indexed by item name, with the *rolling_median*
+        chaos value, the *volatility* (standard deviation of daily log
+        returns) and the number of *samples* within the window.
+
+    """
+    prices = history.pivot_table(
+        index="date",
+        columns="item_name",
+        values="chaos_value",
+        aggfunc="mean",
+    ).asfreq("D")
+    recent = prices.iloc[-window:]
+    returns = np.log(prices).diff().iloc[-window:]
+    return pd.DataFrame(
+        {
+            "rolling_median": recent.median(),
+            "volatility": returns.std(),
+            "samples": recent.count(),
+        }
+    )
+
+
+#: Columns always loaded into an ``ItemFilterContext``, in addition to
+#: quantile scheme columns and any projected columns
+context_required_columns = ("item_name", "chaos_value")
+
+
+def get_context_columns(columns: collections.abc.Iterable[str]) -> list[str]:
+    """Get the columns to load for a filter context column projection."""
+    return sorted(
+        {
+            *columns,
+            *context_required_columns,
+            *(s.name for s in quantiles.values()),
+        }
+    )
+
+
 async def initialize_filter_context(
     initialize_cache: bool = True,
     league: Optional[str] = None,
-    store: Optional[pd.HDFStore] = None,
+    store: Optional[storage.InsightsStore] = None,
     no_sync: bool = False,
+    session: Optional["NinjaSession"] = None,
+    snapshot_dir: Optional[Union[str, pathlib.Path]] = None,
+    columns: Optional[collections.abc.Iterable[str]] = None,
+    compact: bool = False,
 ) -> "ItemFilterContext":
-    """Create an ``ItemFilterContext`` from cached economy data."""
+    """Create an ``ItemFilterContext`` from cached economy data.
+
+    Overviews are read from ``store`` as the context first accesses
+    them, so the store must stay open while the context is in use.
+
+    If ``snapshot_dir`` is given, the built context is snapshotted there,
+    keyed by the league and its data version (see
+    :func:`get_data_version`), and later calls against the same data
+    load the snapshot instead of rebuilding the context. Saving a
+    snapshot loads every overview.
+
+    If ``columns`` is given, only those columns of the overviews (along
+    with the ones the context itself needs, see
+    :func:`get_context_columns`) are loaded. Overviews that need to be
+    validated are still read in full first.
+
+    If ``compact``, overviews are converted to compact dtypes once
+    post-processed (see :func:`compact_overview`).
+
+    """
     if initialize_cache:
         if league is None:
             raise RuntimeError("league must be provided if initializing cache")
         if store is None:
-            store = _create_hdfstore()
+            store = _create_store()
         cache = await initialize_insights_cache(
             league=league,
             store=store,
             no_sync=no_sync,
+            session=session,
         )
     else:
         raise RuntimeError("cache not provided")
-    economy_data = {}
-    for t in get_all_insights_types():
-        overview = cache.get(f"i_{t.value}")
-        economy_data[t.pluralized_underscored_value] = overview
-    return ItemFilterContext(data=economy_data)
+    if columns is not None:
+        columns = get_context_columns(columns)
+    snapshot_path = None
+    if snapshot_dir is not None:
+        data_version = get_data_version(
+            cache,
+            league,
+            columns=columns,
+            compact=compact,
+        )
+        if data_version is not None:
+            snapshot_path = get_context_snapshot_path(
+                snapshot_dir,
+                league,
+                data_version,
+                variant=get_context_variant(columns, compact),
+            )
+    if snapshot_path is not None and snapshot_path.exists():
+        logger.info("context.snapshot.load", path=str(snapshot_path))
+        return ItemFilterContext.load_snapshot(snapshot_path)
+
+    def load_overview(key: str) -> pd.DataFrame:
+        logger.debug("overview.load", key=key)
+        if is_overview_validated(cache, key):
+            return cache.select(key, columns=columns)
+        logger.debug("overview.validate", key=key)
+        overview = ExtendedNinjaOverviewSchema.validate(cache.get(key))
+        if columns is not None:
+            overview = overview[[c for c in columns if c in overview.columns]]
+        return overview
+
+    ctx = ItemFilterContext(
+        data=LazyOverviewMapping(
+            loaders={
+                t.pluralized_underscored_value: functools.partial(
+                    load_overview,
+                    _get_cache_key(league, t),
+                )
+                for t in get_all_insights_types()
+            }
+        ),
+        history=load_currency_history(cache, league),
+        validated=True,
+        compact=compact,
+    )
+    if snapshot_path is not None:
+        logger.info("context.snapshot.save", path=str(snapshot_path))
+        ctx.save_snapshot(snapshot_path)
+        # Only snapshots of older data versions are stale, not those of
+        # contexts loaded with other columns or compaction
+        variant = get_context_variant(columns, compact)
+        for stale_path in snapshot_path.parent.glob(
+            f"{get_league_slug(league)}-{variant}-*.pickle"
+        ):
+            if stale_path != snapshot_path:
+                stale_path.unlink(missing_ok=True)
+    return ctx
+
+
+def get_context_variant(
+    columns: Optional[collections.abc.Iterable[str]] = None,
+    compact: bool = False,
+) -> str:
+    """Get a short digest of the columns and compaction of a context."""
+    columns = sorted(columns) if columns is not None else None
+    return hashlib.sha1(repr((columns, compact)).encode()).hexdigest()[:8]
+
+
+def get_context_snapshot_path(
+    snapshot_dir: Union[str, pathlib.Path],
+    league: str,
+    data_version: str,
+    variant: Optional[str] = None,
+) -> pathlib.Path:
+    """Get the path of a context snapshot.
+
+    Snapshots are named after their ``variant`` (see
+    :func:`get_context_variant`), so that contexts of one league loaded
+    with different columns each keep their own.
+
+    """
+    if variant is None:
+        variant = get_context_variant()
+    return (
+        pathlib.Path(snapshot_dir)
+        / f"{get_league_slug(league)}-{variant}-{data_version}.pickle"
+    )
 
 
 def _parse_name_and_details_id(
@@ -290,13 +1207,218 @@ def _parse_name_and_details_id(
         return (None, tuple())
 
 
-def get_quantile_thresholds(df: pd.DataFrame) -> list[dict[str, float]]:
+def _get_influences(names: pd.Series, details_ids: pd.Series) -> pd.Series:
+    """Vectorized :func:`_parse_name_and_details_id`, joining influences.
+
+    Returns a series of "/"-separated influence names, empty where the
+    details ID has no item level or contains an unknown influence.
+
+    """
+    names = names.astype(str)
+    tokens = details_ids.astype(str).str.split("-").explode()
+    position = tokens.groupby(level=0).cumcount()
+    name_length = names.str.count(" ") + names.str.count("-") + 1
+    tokens = tokens[position.values >= name_length.loc[tokens.index].values]
+    is_first = ~tokens.index.duplicated()
+    has_item_level = pd.Series(
+        tokens[is_first].str.fullmatch(r"[+-]?\d+").values,
+        index=tokens.index[is_first],
+    )
+    influences = tokens[~is_first].str.capitalize()
+    is_valid = influences.isin([i.value for i in constants.Influence])
+    is_valid = is_valid.groupby(level=0).all()
+    valid_rows = has_item_level.index[has_item_level.values]
+    valid_rows = valid_rows.difference(is_valid.index[~is_valid.values])
+    influences = influences[influences.index.isin(valid_rows)]
+    joined = pd.Series("", index=names.index)
+    if influences.empty:
+        return joined
+    by_position = (
+        influences.to_frame("influence")
+        .set_index(
+            influences.groupby(level=0).cumcount(),
+            append=True,
+        )["influence"]
+        .unstack()
+    )
+    joined.loc[by_position.index] = by_position[0]
+    for position in by_position.columns[1:]:
+        column = by_position[position]
+        has_more = column.notna()
+        joined.loc[column.index[has_more]] += "/" + column[has_more]
+    return joined
+
+
+class QuantileIndex:
+    """Quantiles of rows, sorted by chaos value for binary search.
+
+    Args:
+        chaos_values (np.ndarray): Chaos value of each row, ascending.
+        quantiles (np.ndarray): Integer quantiles of each row, with one
+            column per key of :data:`quantiles`.
+
+    """
+
+    def __init__(self, chaos_values: np.ndarray, quantiles: np.ndarray):
+        self.chaos_values = chaos_values
+        self.quantiles = quantiles.astype(np.int64, copy=False)
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "QuantileIndex":
+        """Index a dataframe with ``chaos_value`` and quantile columns.
+
+        Rows with equal chaos values keep their order in the dataframe,
+        and missing quantiles are indexed as unbinned (-1).
+
+        """
+        chaos_values = df["chaos_value"].to_numpy(dtype=float)
+        order = np.argsort(chaos_values, kind="stable")
+        return cls(
+            chaos_values=chaos_values[order],
+            quantiles=df[list(quantiles.keys())]
+            .fillna(-1)
+            .to_numpy(dtype=np.int64)[order],
+        )
+
+    def __eq__(self, other: Any) -> bool:
+        return (
+            isinstance(other, QuantileIndex)
+            and np.array_equal(self.chaos_values, other.chaos_values)
+            and np.array_equal(self.quantiles, other.quantiles)
+        )
+
+    def __len__(self) -> int:
+        return len(self.chaos_values)
+
+    def search(
+        self,
+        min_chaos_values: Union[float, np.ndarray, pd.Series],
+        clip: bool = False,
+    ) -> np.ndarray:
+        """Find the first rows with a chaos value of at least the given.
+
+        Positions past the last row (i.e. no row is valuable enough) are
+        clipped to the last row if ``clip`` is true.
+
+        """
+        positions = np.searchsorted(
+            self.chaos_values,
+            min_chaos_values,
+            side="left",
+        )
+        if clip:
+            positions = np.minimum(positions, len(self) - 1)
+        return positions
+
+    def get(
+        self,
+        min_chaos_value: float,
+        clip: bool = False,
+    ) -> Optional[dict[str, int]]:
+        """Get the quantiles of the first row worth ``min_chaos_value``.
+
+        Quantiles are integers, alongside the row's (float) chaos value
+        under ``chaos_value``.
+
+        """
+        if not len(self):
+            return None
+        position = int(self.search(min_chaos_value, clip=clip))
+        if position >= len(self):
+            return None
+        record: dict[str, Any] = {
+            q: int(v) for q, v in zip(quantiles, self.quantiles[position])
+        }
+        record["chaos_value"] = float(self.chaos_values[position])
+        return record
+
+    def get_many(
+        self,
+        min_chaos_values: Union[np.ndarray, pd.Series],
+        clip: bool = False,
+    ) -> pd.DataFrame:
+        """Vectorized :meth:`get`, with one row per chaos value.
+
+        Quantile columns are nullable integers, so rows for values that
+        no row is worth have missing quantiles and a ``NaN`` chaos value.
+
+        """
+        index = (
+            min_chaos_values.index
+            if isinstance(min_chaos_values, pd.Series)
+            else None
+        )
+        min_chaos_values = np.asarray(min_chaos_values, dtype=float)
+        if not len(self):
+            positions = np.zeros(len(min_chaos_values), dtype=np.intp)
+        else:
+            positions = self.search(min_chaos_values, clip=clip)
+        found = positions < len(self)
+        quantile_values = np.zeros(
+            (len(min_chaos_values), len(quantiles)),
+            dtype=np.int64,
+        )
+        quantile_values[found] = self.quantiles[positions[found]]
+        chaos_values = np.full(len(min_chaos_values), np.nan)
+        chaos_values[found] = self.chaos_values[positions[found]]
+        columns: dict[str, Any] = {
+            q: pd.arrays.IntegerArray(quantile_values[:, i], ~found)
+            for i, q in enumerate(quantiles)
+        }
+        columns["chaos_value"] = chaos_values
+        return pd.DataFrame(columns, index=index)
+
+
+def get_quantile_thresholds(df: pd.DataFrame) -> QuantileIndex:
+    """Index the minimum chaos value of each group of quantiles."""
     groups = df.groupby(list(quantiles.keys()), as_index=False)
-    return groups.agg({"chaos_value": "min"}).to_dict(  # type: ignore
-        "records"
+    return QuantileIndex.from_dataframe(
+        groups.agg({"chaos_value": "min"}),  # type: ignore
     )
 
 
+#: String columns with at most this ratio of unique values to rows are
+#: converted to categoricals by :func:`compact_overview`
+compact_category_ratio = 0.5
+
+
+def get_memory_usage(df: pd.DataFrame) -> int:
+    """Get the memory used by a dataframe, in bytes."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def compact_overview(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert the columns of an overview to more compact dtypes.
+
+    Repeated strings become categoricals, quantiles become the smallest
+    integers holding them and float columns become ``float32`` when
+    every value converts exactly. Converting the result back to the
+    original dtypes gives back the original overview.
+
+    Grouping by categorical columns yields every category unless
+    ``observed=True`` is passed, so templates rendered against compact
+    overviews must pass it to ``groupby``.
+
+    """
+    dtypes = {}
+    for column in df.columns:
+        series = df[column]
+        if series.dtype == object:
+            values = series.dropna()
+            if (
+                not values.empty
+                and values.map(type).eq(str).all()
+                and values.nunique() <= compact_category_ratio * len(series)
+            ):
+                dtypes[column] = "category"
+        elif column in quantiles and pd.api.types.is_integer_dtype(series):
+            dtypes[column] = pd.to_numeric(series, downcast="integer").dtype
+        elif series.dtype == np.float64:
+            if series.astype(np.float32).astype(np.float64).equals(series):
+                dtypes[column] = np.float32
+    return df.astype(dtypes)
+
+
 class NinjaCurrencyOverviewSchema(SchemaModel):
     currency_type_name: Series[String]
     chaos_equivalent: Series[float]
@@ -362,6 +1484,7 @@ class ExtendedNinjaOverviewSchema(SchemaModel):
     decile: Series[int]
     percentile: Series[int]
     base_type: Optional[Series[String]] = Field(nullable=True)
+    currency_id: Optional[Series[float]] = Field(nullable=True)
     gem_level: Optional[Series[float]] = Field(nullable=True)
     gem_quality: Optional[Series[float]] = Field(nullable=True)
     influences: Optional[Series[String]] = Field(nullable=True)
@@ -380,19 +1503,65 @@ class PostProcessedNinjaOverviewSchema(ExtendedNinjaOverviewSchema):
     display_value: Series[String]
 
 
-@check_output(ExtendedNinjaOverviewSchema)
-def transform_ninja_df(df: pd.DataFrame) -> pd.DataFrame:
-    currency_overview_schema = NinjaCurrencyOverviewSchema.to_schema()
-    item_overview_schema = NinjaItemOverviewSchema.to_schema()
-    is_currency_overview = False
+def get_schema_fingerprint(schema: DataFrameSchema) -> str:
+    """Get a digest identifying the columns and checks of a schema."""
+    description = [
+        (
+            name,
+            str(column.dtype),
+            column.nullable,
+            column.required,
+            column.coerce,
+            [repr(check) for check in column.checks],
+        )
+        for name, column in sorted(schema.columns.items())
+    ]
+    description.append((schema.coerce, schema.strict))
+    return hashlib.sha1(repr(description).encode()).hexdigest()
+
+
+#: Fingerprint of the schema cached overviews are validated against
+overview_schema_fingerprint = get_schema_fingerprint(
+    ExtendedNinjaOverviewSchema.to_schema()
+)
+
+
+def is_overview_validated(store: storage.InsightsStore, key: str) -> bool:
+    """Check whether a cached overview was validated at ingest.
+
+    Overviews are trusted only if they were validated against the
+    current :class:`ExtendedNinjaOverviewSchema`.
+
+    """
+    metadata = get_overview_metadata(store, key)
+    return (
+        metadata is not None
+        and metadata.schema_fingerprint == overview_schema_fingerprint
+    )
+
+
+def transform_ninja_df(
+    df: pd.DataFrame,
+    type_: Optional[InsightsType] = None,
+) -> pd.DataFrame:
+    """Transform and validate a decoded poe.ninja overview.
+
+    The input is validated against the currency or item overview schema
+    depending on ``type_`` (inferred from the columns if not given), and
+    the output against :class:`ExtendedNinjaOverviewSchema`.
+
+    """
+    if type_ is None:
+        is_currency_overview = "currency_type_name" in df.columns
+    else:
+        is_currency_overview = isinstance(type_, CurrencyType)
 
     df = df.fillna(0)
 
-    try:
-        df = currency_overview_schema.validate(df)
-        is_currency_overview = True
-    except SchemaError as e:
-        df = item_overview_schema.validate(df)
+    if is_currency_overview:
+        df = NinjaCurrencyOverviewSchema.validate(df)
+    else:
+        df = NinjaItemOverviewSchema.validate(df)
 
     if is_currency_overview:
         try:
@@ -431,18 +1600,23 @@ def transform_ninja_df(df: pd.DataFrame) -> pd.DataFrame:
         if "currency_type_name" in df.columns
         else df["name"]
     )
-    if not is_currency_overview:
-        output["scourged"] = output["item_name"].map(
-            lambda name: name.startswith("Scourged")
-        )
+    if is_currency_overview:
+        # poe.ninja IDs of currencies, for requesting their history
+        currency_ids = df["pay.pay_currency_id"]
+        if "receive.get_currency_id" in df.columns:
+            currency_ids = currency_ids.mask(
+                currency_ids == 0,
+                df["receive.get_currency_id"],
+            )
+        output["currency_id"] = currency_ids.mask(currency_ids == 0)
+    else:
+        output["scourged"] = output["item_name"].str.startswith("Scourged")
     for label in ("currency_type_name", "skill_gem_name"):
         if label in df.columns:
             output["item_name"] = df[label]
 
     if "map_tier" in df.columns:
-        output["uber_blight"] = df["name"].map(
-            lambda name: name.startswith("Blight-ravaged")
-        )
+        output["uber_blight"] = df["name"].str.startswith("Blight-ravaged")
 
     if (
         "base_type" in df.columns
@@ -452,22 +1626,24 @@ def transform_ninja_df(df: pd.DataFrame) -> pd.DataFrame:
     ):
         try:
             output["cluster_jewel_enchantment"] = df["name"].map(
-                lambda name: constants.get_cluster_jewel_passive(name).value
-            )
-            output["cluster_jewel_passives_min"] = df["trade_info"].apply(
-                lambda trade_info: [
-                    ti
-                    for ti in trade_info
-                    if ti["mod"] == "enchant.stat_3086156145"
-                ][0]["min"]
+                {
+                    name: constants.get_cluster_jewel_passive(name).value
+                    for name in df["name"].unique()
+                }
             )
-            output["cluster_jewel_passives_max"] = df["trade_info"].apply(
-                lambda trade_info: [
-                    ti
-                    for ti in trade_info
-                    if ti["mod"] == "enchant.stat_3086156145"
-                ][0]["max"]
+            trade_info = df["trade_info"].explode().dropna()
+            trade_info = pd.DataFrame(
+                trade_info.tolist(),
+                index=trade_info.index,
             )
+            trade_info = trade_info[
+                trade_info["mod"] == "enchant.stat_3086156145"
+            ]
+            trade_info = trade_info[~trade_info.index.duplicated()]
+            if not df.index.isin(trade_info.index).all():
+                raise IndexError("missing cluster jewel passives")
+            output["cluster_jewel_passives_min"] = trade_info["min"]
+            output["cluster_jewel_passives_max"] = trade_info["max"]
             output["cluster_jewel_passives"] = output[
                 "cluster_jewel_passives_min"
             ]
@@ -482,26 +1658,18 @@ def transform_ninja_df(df: pd.DataFrame) -> pd.DataFrame:
         | output["item_name"].str.startswith("Divergent")
         | output["item_name"].str.startswith("Phantasmal")
     )
-    if not output[alt_filter].empty:
-        output.loc[alt_filter, "is_alt_quality"] = True
-        output.loc[alt_filter, "alt_quality"] = output["item_name"].apply(
-            lambda s: s[: s.find(" ")],
-        )
-        output.loc[alt_filter, "item_name"] = output["item_name"].apply(
-            lambda s: s[s.find(" ") + 1 :],
+    if alt_filter.any():
+        alt_names = output.loc[alt_filter, "item_name"].str.split(
+            " ",
+            n=1,
+            expand=True,
         )
+        output.loc[alt_filter, "is_alt_quality"] = True
+        output.loc[alt_filter, "alt_quality"] = alt_names[0]
+        output.loc[alt_filter, "item_name"] = alt_names[1]
 
     if "name" in df.columns and "details_id" in df.columns:
-        output["influences"] = df.apply(
-            lambda r: "/".join(
-                i.value
-                for i in _parse_name_and_details_id(
-                    str(r["name"]),
-                    str(r["details_id"]),
-                )[1]
-            ),
-            axis=1,
-        )
+        output["influences"] = _get_influences(df["name"], df["details_id"])
         output["num_influences"] = (
             df["variant"].str.count("/").fillna(0).astype(int)
             if "variant" in df.columns
@@ -536,21 +1704,10 @@ def transform_ninja_df(df: pd.DataFrame) -> pd.DataFrame:
     output["chaos_value"].replace(0, min_chaos_value, inplace=True)  # type: ignore
     output["chaos_value_log"] = np.log(output["chaos_value"])
 
-    # Pre-defined quantiles (quartiles, quintiles, percentiles)
-    for label, q in quantiles.items():
-        labels = None
-        if isinstance(q, (list, tuple)):
-            q, labels = q
-        output[label] = pd.qcut(
-            output["chaos_value"].rank(method="first", numeric_only=True),
-            q=q,
-            labels=False if labels is None else None,
-            precision=0,
-            duplicates="drop",
-        )
-        if labels is not None:
-            output[label] = output[label].map(dict(enumerate(labels)))
-    return output
+    # Registered quantiles (quartiles, quintiles, percentiles, etc.)
+    for label, bins in get_quantiles(output["chaos_value"]).items():
+        output[label] = bins
+    return ExtendedNinjaOverviewSchema.validate(output)
 
 
 def json_normalize(data: dict[Any, Any]) -> pd.DataFrame:
@@ -559,12 +1716,172 @@ def json_normalize(data: dict[Any, Any]) -> pd.DataFrame:
     return df
 
 
+def loads(body: Union[bytes, str]) -> Any:
+    """Parse JSON, with orjson if available."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def decode_overview(body: Union[bytes, str]) -> pd.DataFrame:
+    """Decode an overview response body into a dataframe.
+
+    Equivalent to :func:`json_normalize` on the response's ``lines``,
+    but only the columns in :data:`overview_columns` are built, straight
+    from the parsed lines. Columns absent from every line are omitted.
+
+    """
+    lines = loads(body)["lines"]
+    missing = object()
+    columns = {}
+    for path, column in overview_columns.items():
+        key, *subkeys = path
+        values = [line.get(key, missing) for line in lines]
+        for subkey in subkeys:
+            values = [
+                v.get(subkey, missing) if isinstance(v, dict) else missing
+                for v in values
+            ]
+        if all(v is missing for v in values):
+            continue
+        columns[column] = [None if v is missing else v for v in values]
+    return pd.DataFrame(columns)
+
+
+class OverviewMetadata(pydantic.BaseModel):
+    """HTTP validators, fetch time and provenance of an economy overview."""
+
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: Optional[datetime.datetime] = None
+    league: Optional[str] = None
+    type: Optional[str] = None
+    rows: Optional[int] = None
+    schema_fingerprint: Optional[str] = None
+
+    def is_expired(
+        self,
+        ttl: datetime.timedelta,
+        now: Optional[datetime.datetime] = None,
+    ) -> bool:
+        if self.fetched_at is None:
+            return True
+        if now is None:
+            now = datetime.datetime.now(datetime.timezone.utc)
+        return self.fetched_at + ttl <= now
+
+    def merge(self, other: "OverviewMetadata") -> "OverviewMetadata":
+        """Fill fields missing from this metadata from another."""
+        return OverviewMetadata(
+            **{
+                field: getattr(self, field) or getattr(other, field)
+                for field in self.__fields__
+            }
+        )
+
+
+class NinjaOverviewResponse(pydantic.BaseModel):
+    """An economy overview and its metadata.
+
+    ``data`` is ``None`` if the request was conditional and poe.ninja
+    responded with *304 Not Modified*. As returned by
+    :class:`NinjaConsumer`, ``data`` is decoded but not yet transformed
+    (see :func:`get_economy_overview`).
+
+    """
+
+    data: Optional[pd.DataFrame] = None
+    metadata: OverviewMetadata
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def not_modified(self) -> bool:
+        return self.data is None
+
+
+class NinjaCurrencyHistoryResponse(NinjaOverviewResponse):
+    """A decoded currency history and its metadata."""
+
+
+def decode_currency_history(body: Union[bytes, str]) -> pd.DataFrame:
+    """Decode a currency history response body into a dataframe.
+
+    Pay and receive graph points are joined by day, and the chaos value
+    of each day is the mean of the receive value and the inverse of the
+    pay value, as with ``chaosEquivalent`` in currency overviews.
+
+    """
+    data = loads(body)
+    sides = [
+        pd.DataFrame(
+            data.get(f"{side}CurrencyGraphData") or [],
+            columns=["count", "value", "daysAgo"],
+        )
+        .rename(
+            columns={
+                "count": f"{side}_count",
+                "value": f"{side}_value",
+                "daysAgo": "days_ago",
+            },
+        )
+        .set_index("days_ago")
+        for side in ("pay", "receive")
+    ]
+    df = sides[0].join(sides[1], how="outer").astype(float)
+    df["chaos_value"] = pd.concat(
+        [1 / df["pay_value"].where(df["pay_value"] > 0), df["receive_value"]],
+        axis=1,
+    ).mean(axis=1)
+    return df.reset_index()
+
+
+def convert_currency_history_response(
+    response: Any,
+) -> NinjaCurrencyHistoryResponse:
+    return NinjaCurrencyHistoryResponse(
+        data=decode_currency_history(_get_response_body(response)),
+        metadata=OverviewMetadata(
+            fetched_at=datetime.datetime.now(datetime.timezone.utc),
+        ),
+    )
+
+
+def _get_response_body(response: Any) -> Union[bytes, str]:
+    # uplink reads aiohttp responses before invoking sync converters, so
+    # the body is already buffered; this avoids decoding it to text first.
+    body = getattr(response, "_body", None)
+    if body is None:
+        body = getattr(response, "content", None)
+    if body is None:
+        body = response.text()
+    return body
+
+
+def convert_overview_response(response: Any) -> NinjaOverviewResponse:
+    metadata = OverviewMetadata(
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+        fetched_at=datetime.datetime.now(datetime.timezone.utc),
+    )
+    if response.status_code == 304:
+        return NinjaOverviewResponse(metadata=metadata)
+    return NinjaOverviewResponse(
+        data=decode_overview(_get_response_body(response)),
+        metadata=metadata,
+    )
+
+
 @uplink.install
 class NinjaDataFrameFactory(uplink.converters.Factory):
     def create_response_body_converter(self, cls, request_definition):
-        return lambda response: transform_ninja_df(
-            df=json_normalize(response.json()["lines"]),
-        )
+        if cls in (
+            "NinjaCurrencyHistoryResponse",
+            NinjaCurrencyHistoryResponse,
+        ):
+            return convert_currency_history_response
+        return convert_overview_response
 
 
 uplink_retry = uplink.retry(
@@ -592,60 +1909,386 @@ def get_dataframe():
 
 
 class NinjaConsumer(uplink.Consumer):
-    default_base_url = "https://poe.ninja/api/data/"
+    default_base_url = os.getenv(
+        "WRAEBLAST_NINJA_URL",
+        "https://poe.ninja/api/data/",
+    )
+
+    #: Rate limit budgets as ``(calls, period)``, keyed by endpoint
+    ratelimits: dict[str, tuple[int, int]] = {
+        "CurrencyOverview": (2, 150),
+        "CurrencyHistory": (2, 150),
+        "ItemOverview": (30, 150),
+    }
 
-    @uplink.ratelimit(calls=2, period=150)
+    @uplink.ratelimit(*ratelimits["CurrencyOverview"])
     @get_dataframe("CurrencyOverview")  # type: ignore
     def get_currency_overview(
         self,
         league: uplink.Query(type=str),  # type: ignore
         type: uplink.Query(type=CurrencyType),  # type: ignore
-    ) -> pd.DataFrame:
+        if_none_match: uplink.Header("If-None-Match") = None,  # type: ignore
+        if_modified_since: uplink.Header(  # type: ignore
+            "If-Modified-Since"
+        ) = None,
+    ) -> "NinjaOverviewResponse":
         ...
 
-    @uplink.ratelimit(calls=2, period=150)
+    @uplink.ratelimit(*ratelimits["CurrencyHistory"])
     @get_dataframe("CurrencyHistory")  # type: ignore
     def get_currency_history(
         self,
         league: uplink.Query(type=str),  # type: ignore
         type: uplink.Query(type=CurrencyType),  # type: ignore
         currency_id: uplink.Query("currencyId", type=int),  # type: ignore
-    ) -> pd.DataFrame:
+    ) -> "NinjaCurrencyHistoryResponse":
         ...
 
-    @uplink.ratelimit(calls=30, period=150)
+    @uplink.ratelimit(*ratelimits["ItemOverview"])
     @get_dataframe("ItemOverview")  # type: ignore
     def get_item_overview(
         self,
         league: uplink.Query(type=str),  # type: ignore
         type: uplink.Query(type=ItemType),  # type: ignore
-    ) -> pd.DataFrame:
+        if_none_match: uplink.Header("If-None-Match") = None,  # type: ignore
+        if_modified_since: uplink.Header(  # type: ignore
+            "If-Modified-Since"
+        ) = None,
+    ) -> "NinjaOverviewResponse":
         ...
 
 
-class ItemFilterContext(pydantic.BaseModel):
-    """Entrypoint for accessing economy data from poe.ninja."""
+class NinjaSession:
+    """Pooled, reusable HTTP session for requesting poe.ninja data.
+
+    Wraps a single :class:`aiohttp.ClientSession` with a tuned
+    connection pool (keep-alive and DNS caching) and compressed
+    transfer encoding, and exposes a :class:`NinjaConsumer` bound to
+    it. Sharing one session between syncs (e.g. multiple leagues, or
+    periodic refreshes in a long-running process) reuses warm
+    connections instead of performing a TLS handshake per sync.
+
+    Use as an async context manager to guarantee cleanup::
+
+        async with NinjaSession() as session:
+            await initialize_insights_cache(league, session=session)
+
+    Args:
+        base_url (str, optional): poe.ninja API base URL. Defaults to
+            :attr:`NinjaConsumer.default_base_url`.
+        limit (int, optional): Maximum number of pooled connections.
+        keepalive_timeout (float, optional): Seconds to keep idle
+            connections alive.
+        ttl_dns_cache (int, optional): Seconds to cache DNS lookups.
+        timeout (float, optional): Total timeout per request, in
+            seconds.
+
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        limit: int = 16,
+        keepalive_timeout: float = 120,
+        ttl_dns_cache: int = 600,
+        timeout: float = 60,
+    ) -> None:
+        self.base_url = base_url or NinjaConsumer.default_base_url
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._consumer: Optional[NinjaConsumer] = None
+
+    @property
+    def client_session(self) -> aiohttp.ClientSession:
+        """The underlying :class:`aiohttp.ClientSession`."""
+        if self._session is None or self.closed:
+            raise RuntimeError("session is not open")
+        return self._session
+
+    @property
+    def accept_encoding(self) -> str:
+        encodings = ["gzip", "deflate"]
+        if BROTLI_AVAILABLE:
+            encodings.append("br")
+        return ", ".join(encodings)
+
+    @property
+    def closed(self) -> bool:
+        return self._session is None or self._session.closed
+
+    @property
+    def consumer(self) -> NinjaConsumer:
+        if self._consumer is None or self.closed:
+            raise RuntimeError("session is not open")
+        return self._consumer
+
+    async def open(self) -> "NinjaSession":
+        """Open the underlying HTTP session, if not already open."""
+        if not self.closed:
+            return self
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.ttl_dns_cache,
+            use_dns_cache=True,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers={"Accept-Encoding": self.accept_encoding},
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            auto_decompress=True,
+        )
+        self._consumer = NinjaConsumer(
+            base_url=self.base_url,
+            client=uplink.AiohttpClient(session=self._session),
+        )
+        logger.debug("session.open", base_url=self.base_url)
+        return self
+
+    async def close(self) -> None:
+        """Close the underlying HTTP session and its connection pool."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.debug("session.close", base_url=self.base_url)
+        self._session = None
+        self._consumer = None
+
+    async def __aenter__(self) -> "NinjaSession":
+        return await self.open()
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
 
-    data: dict[str, pd.DataFrame]
+class LazyOverviewMapping(collections.abc.Mapping):
+    """Mapping of overview keys to DataFrames, loaded on first access.
+
+    Args:
+        loaders (dict): Functions returning each overview, keyed by
+            overview key.
+        process (callable, optional): Function applied to each loaded
+            overview, given its key, before it is cached.
+        on_access (callable, optional): Function called with the key of
+            each overview accessed, loaded or not.
+
+    """
+
+    def __init__(
+        self,
+        loaders: dict[str, Callable[[], pd.DataFrame]],
+        process: Optional[Callable[[str, pd.DataFrame], pd.DataFrame]] = None,
+        on_access: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        self._loaders = loaders
+        self._process = process
+        self._on_access = on_access
+        self._loaded: dict[str, pd.DataFrame] = {}
+
+    @property
+    def loaded(self) -> list[str]:
+        """Keys of the overviews loaded so far."""
+        return list(self._loaded)
+
+    def __getitem__(self, key: str) -> pd.DataFrame:
+        if self._on_access is not None:
+            self._on_access(key)
+        if key not in self._loaded:
+            df = self._loaders[key]()
+            if self._process is not None:
+                df = self._process(key, df)
+            self._loaded[key] = df
+        return self._loaded[key]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._loaders
+
+    def __iter__(self):
+        return iter(self._loaders)
+
+    def __len__(self) -> int:
+        return len(self._loaders)
+
+    def __repr__(self) -> str:
+        return (
+            f"<{type(self).__name__} {len(self._loaded)}/{len(self)} loaded>"
+        )
+
+
+class ItemFilterContext(pydantic.BaseModel):
+    """Entrypoint for accessing economy data from poe.ninja.
+
+    Overviews in ``data`` are validated (unless ``validated``) and
+    post-processed on first access, so renders only pay for the
+    categories they use.
+
+    """
+
+    data: Union[LazyOverviewMapping, dict[str, pd.DataFrame]]
+    #: Daily currency history (see :func:`load_currency_history`)
+    history: Optional[pd.DataFrame] = None
+    #: Whether ``data`` was already validated against
+    #: :class:`ExtendedNinjaOverviewSchema`
+    validated: bool = False
+    #: Whether to compact overviews once post-processed (see
+    #: :func:`compact_overview`)
+    compact: bool = False
     _exalted_value: int = pydantic.PrivateAttr(default=0)
-    _quantile_thresholds: dict[
-        str, list[dict[str, float]]
-    ] = pydantic.PrivateAttr(default_factory=list)
+    _quantile_thresholds: dict[str, QuantileIndex] = pydantic.PrivateAttr(
+        default_factory=dict,
+    )
+    _quantile_indexes: dict[str, QuantileIndex] = pydantic.PrivateAttr(
+        default_factory=dict,
+    )
+    _history_aggregates: dict[int, pd.DataFrame] = pydantic.PrivateAttr(
+        default_factory=dict,
+    )
+    _memory_usage: dict[str, tuple[int, int]] = pydantic.PrivateAttr(
+        default_factory=dict,
+    )
+    _fingerprints: dict[str, str] = pydantic.PrivateAttr(
+        default_factory=dict,
+    )
+    _recorders: list[set[str]] = pydantic.PrivateAttr(default_factory=list)
 
     class Config:
         arbitrary_types_allowed = True
 
     def __init__(self, **data) -> None:
         super().__init__(**data)
-        self._exalted_value = self.data["currencies"][
-            self.data["currencies"].item_name == "Exalted Orb"
-        ].iloc[0]["chaos_value"]
-        self._quantile_thresholds = {
-            k: get_quantile_thresholds(df) for k, df in self.data.items()
-        }
-        self.data = {
-            k: self._post_process(k, df) for k, df in self.data.items()
-        }
+        if isinstance(self.data, LazyOverviewMapping):
+            self.data = LazyOverviewMapping(
+                loaders=self.data._loaders,
+                process=self._load_overview,
+                on_access=self._record,
+            )
+        else:
+            self.data = LazyOverviewMapping(
+                loaders={
+                    k: (lambda df=df: df)  # type: ignore
+                    for k, df in self.data.items()
+                },
+                process=self._load_overview,
+                on_access=self._record,
+            )
+
+    @property
+    def exalted_value(self) -> float:
+        """Chaos value of an Exalted Orb."""
+        self._record("currencies")
+        if not self._exalted_value:
+            # Loading currencies sets the exalted value
+            self.data["currencies"]
+        return self._exalted_value
+
+    def load_all(self) -> None:
+        """Load every overview and the default history aggregates.
+
+        The context no longer reads from its store afterwards, so it can
+        be shared with forked processes.
+
+        """
+        for key in self.data:
+            self.data[key]
+        self.get_history_aggregates()
+
+    @contextlib.contextmanager
+    def record_dependencies(self) -> Iterator[set[str]]:
+        """Record the data read within a block.
+
+        Yields the set of overview keys read (directly, or through
+        methods such as :meth:`get_display_value`), and ``"history"`` if
+        the currency history is. Recordings may be nested.
+
+        """
+        keys: set[str] = set()
+        self._recorders.append(keys)
+        try:
+            yield keys
+        finally:
+            self._recorders.pop()
+
+    def _record(self, key: str) -> None:
+        for keys in self._recorders:
+            keys.add(key)
+
+    def get_fingerprint(self, key: str) -> str:
+        """Get a hash of an overview (or ``"history"``) as processed.
+
+        Fingerprints change whenever the data does, and are what
+        dependencies recorded with :meth:`record_dependencies` are
+        compared by. Since results cached by fingerprint depend on the
+        data, getting one records it as read.
+
+        """
+        self._record(key)
+        if key not in self._fingerprints:
+            df = self.history if key == "history" else self.data[key]
+            h = hashlib.sha1()
+            if df is not None:
+                h.update(",".join(map(str, df.columns)).encode())
+                h.update(pd.util.hash_pandas_object(df).values.tobytes())
+            self._fingerprints[key] = h.hexdigest()
+        return self._fingerprints[key]
+
+    def _load_overview(self, key: str, df: pd.DataFrame) -> pd.DataFrame:
+        if not self.validated:
+            df = ExtendedNinjaOverviewSchema.validate(df)
+        if key == "currencies":
+            self._exalted_value = df[df.item_name == "Exalted Orb"].iloc[0][
+                "chaos_value"
+            ]
+        # Schemes registered after the overviews were transformed
+        missing_schemes = [
+            s for s in quantiles.values() if s.name not in df.columns
+        ]
+        if missing_schemes:
+            df[[s.name for s in missing_schemes]] = get_quantiles(
+                df["chaos_value"],
+                schemes=missing_schemes,
+            )
+        self._quantile_thresholds[key] = get_quantile_thresholds(df)
+        df = self._post_process(key, df)
+        self._quantile_indexes[key] = QuantileIndex.from_dataframe(df)
+        if self.compact:
+            memory_before = get_memory_usage(df)
+            df = compact_overview(df)
+            self._memory_usage[key] = (memory_before, get_memory_usage(df))
+            logger.info(
+                "overview.compact",
+                key=key,
+                memory_before=memory_before,
+                memory_after=self._memory_usage[key][1],
+            )
+        return df
+
+    def get_memory_usage(self) -> pd.DataFrame:
+        """Get the memory used by each compacted overview, in bytes.
+
+        Returns a dataframe indexed by the overviews compacted so far,
+        with their memory usage ``before`` and ``after`` compaction.
+
+        """
+        return pd.DataFrame.from_dict(
+            self._memory_usage,
+            orient="index",
+            columns=["before", "after"],
+        )
+
+    def _get_quantile_thresholds(self, key: str) -> QuantileIndex:
+        self._record(key)
+        if key not in self._quantile_thresholds:
+            self.data[key]
+        return self._quantile_thresholds[key]
+
+    def _get_quantile_index(self, key: str) -> QuantileIndex:
+        self._record(key)
+        if key not in self._quantile_indexes:
+            self.data[key]
+        return self._quantile_indexes[key]
 
     def get_display_value(
         self,
@@ -655,43 +2298,180 @@ class ItemFilterContext(pydantic.BaseModel):
     ):
         return get_display_value(
             chaos_value=chaos_value,
-            exalted_exchange_value=self._exalted_value,
+            exalted_exchange_value=self.exalted_value,
             round_down_by=round_down_by,
             precision=precision,
         )
 
+    def get_display_values(
+        self,
+        chaos_values: Union[pd.Series, collections.abc.Sequence[float]],
+        round_down_by: int = 1,
+        precision: int = 0,
+    ) -> pd.Series:
+        return get_display_values(
+            chaos_values=chaos_values,
+            exalted_exchange_value=self.exalted_value,
+            round_down_by=round_down_by,
+            precision=precision,
+        )
+
+    def get_history_aggregates(
+        self,
+        window: int = history_window,
+    ) -> Optional[pd.DataFrame]:
+        """Get currency history aggregates over a window, in days.
+
+        See :func:`get_history_aggregates`. Returns ``None`` if there is
+        no history.
+
+        """
+        self._record("history")
+        if self.history is None:
+            return None
+        if window not in self._history_aggregates:
+            self._history_aggregates[window] = get_history_aggregates(
+                self.history,
+                window=window,
+            )
+        return self._history_aggregates[window]
+
+    def get_rolling_median(
+        self,
+        item_name: str,
+        window: int = history_window,
+    ) -> Optional[float]:
+        """Get the median chaos value of a currency over recent days."""
+        return self._get_history_aggregate(item_name, "rolling_median", window)
+
+    def get_volatility(
+        self,
+        item_name: str,
+        window: int = history_window,
+    ) -> Optional[float]:
+        """Get the volatility of a currency's value over recent days."""
+        return self._get_history_aggregate(item_name, "volatility", window)
+
+    def _get_history_aggregate(
+        self,
+        item_name: str,
+        column: str,
+        window: int,
+    ) -> Optional[float]:
+        aggregates = self.get_history_aggregates(window)
+        if aggregates is None or item_name not in aggregates.index:
+            return None
+        value = aggregates.at[item_name, column]
+        return None if pd.isna(value) else float(value)
+
     def get_quantiles_for_threshold(
         self,
         key: str,
         min_chaos_value: float,
-    ) -> Optional[dict[str, float]]:
-        for threshold in self._quantile_thresholds[key]:
-            if threshold["chaos_value"] >= min_chaos_value:
-                return threshold
-        return self._quantile_thresholds[key][-1]
+    ) -> Optional[dict[str, int]]:
+        """Get the lowest quantiles worth at least ``min_chaos_value``.
+
+        Falls back to the highest quantiles if none are.
+
+        """
+        return self._get_quantile_thresholds(key).get(
+            min_chaos_value,
+            clip=True,
+        )
+
+    def get_quantiles_for_thresholds(
+        self,
+        key: str,
+        min_chaos_values: Union[np.ndarray, pd.Series],
+    ) -> pd.DataFrame:
+        """Vectorized :meth:`get_quantiles_for_threshold`."""
+        return self._get_quantile_thresholds(key).get_many(
+            min_chaos_values,
+            clip=True,
+        )
+
+    def get_quantiles_for_value(
+        self,
+        key: str,
+        min_chaos_value: float,
+    ) -> Optional[dict[str, int]]:
+        """Get the quantiles of the cheapest item worth ``min_chaos_value``.
+
+        Returns ``None`` if no item is worth that much.
+
+        """
+        return self._get_quantile_index(key).get(min_chaos_value)
+
+    @classmethod
+    def load_snapshot(
+        cls,
+        path: Union[str, pathlib.Path],
+    ) -> "ItemFilterContext":
+        """Load a context saved with :meth:`save_snapshot`.
+
+        No validation or post-processing is done, so snapshots must come
+        from a trusted location.
+
+        """
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+        ctx = cls.construct(
+            history=snapshot["history"],
+            validated=True,
+        )
+        # Overviews are already processed, but reads are still recorded
+        ctx.data = LazyOverviewMapping(
+            loaders={
+                k: (lambda df=df: df)  # type: ignore
+                for k, df in snapshot["data"].items()
+            },
+            on_access=ctx._record,
+        )
+        ctx._exalted_value = snapshot["exalted_value"]
+        ctx._quantile_thresholds = snapshot["quantile_thresholds"]
+        ctx._quantile_indexes = snapshot["quantile_indexes"]
+        return ctx
+
+    def save_snapshot(self, path: Union[str, pathlib.Path]) -> None:
+        """Atomically save the post-processed context to a file.
+
+        All overviews are loaded first.
+
+        """
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        snapshot = {
+            "data": dict(self.data),
+            "history": self.history,
+            "exalted_value": self.exalted_value,
+            "quantile_thresholds": self._quantile_thresholds,
+            "quantile_indexes": self._quantile_indexes,
+        }
+        with tempfile.NamedTemporaryFile(
+            dir=path.parent,
+            prefix=f".{path.name}.",
+            delete=False,
+        ) as f:
+            try:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            except BaseException:
+                os.unlink(f.name)
+                raise
+        os.replace(f.name, path)
 
     @pydantic.validator("data")
     def data_must_contain_all_types(
-        cls, v: dict[str, pd.DataFrame]
-    ) -> dict[str, pd.DataFrame]:
+        cls, v: collections.abc.Mapping[str, pd.DataFrame]
+    ) -> collections.abc.Mapping[str, pd.DataFrame]:
         for type_ in [*CurrencyType, *ItemType]:
             if type_.pluralized_underscored_value not in v:
                 raise ValueError(f"{type_} missing from filter context")
         return v
 
-    @check_io(
-        df=ExtendedNinjaOverviewSchema.to_schema(),
-        out=PostProcessedNinjaOverviewSchema.to_schema(),
-    )
     def _post_process(self, key: str, df: pd.DataFrame) -> pd.DataFrame:
-        df["exalted_value"] = df["chaos_value"].apply(
-            lambda x: x / self._exalted_value
-        )
-        df["display_value"] = df["chaos_value"].apply(
-            lambda x: get_display_value(
-                chaos_value=x,
-                exalted_exchange_value=self._exalted_value,
-                precision=2,
-            )
+        df["exalted_value"] = df["chaos_value"] / self.exalted_value
+        df["display_value"] = self.get_display_values(
+            df["chaos_value"],
+            precision=2,
         )
         return df
@@ -0,0 +1,207 @@
+"""Continuous refreshing of insights into versioned snapshots.
+
+Each refresh writes a complete copy of the insights cache to a new,
+versioned HDF file in a data directory, then atomically points the
+directory's ``CURRENT`` file at it. Readers open whichever snapshot is
+current (see :func:`open_current_snapshot`), so they never see a
+partially written cache and never wait on the writer.
+
+"""
+import asyncio
+import datetime
+import os
+import pathlib
+import shutil
+import tempfile
+from typing import Any, Optional, Union
+
+import structlog
+import tables
+
+from wraeblast import errors, insights, storage
+
+
+logger = structlog.get_logger()
+
+#: Name of the file pointing to the current snapshot of a data directory
+CURRENT_POINTER = "CURRENT"
+SNAPSHOT_PREFIX = "insights-"
+SNAPSHOT_SUFFIX = ".h5"
+PARTIAL_SUFFIX = ".partial"
+
+
+def get_current_snapshot(
+    data_dir: Union[str, pathlib.Path],
+) -> Optional[pathlib.Path]:
+    """Get the path of the current snapshot, if any was published."""
+    data_dir = pathlib.Path(data_dir)
+    try:
+        name = (data_dir / CURRENT_POINTER).read_text().strip()
+    except FileNotFoundError:
+        return None
+    return data_dir / name
+
+
+def open_current_snapshot(
+    data_dir: Union[str, pathlib.Path],
+) -> storage.InsightsStore:
+    """Open the current snapshot of a data directory, read-only."""
+    path = get_current_snapshot(data_dir)
+    if path is None:
+        raise errors.WraeblastError(f"no insights snapshot in {data_dir}")
+    return storage.HDFInsightsStore(path, mode="r")
+
+
+def publish_snapshot(
+    data_dir: Union[str, pathlib.Path],
+    path: Union[str, pathlib.Path],
+) -> None:
+    """Atomically make a snapshot the current one."""
+    data_dir = pathlib.Path(data_dir)
+    with tempfile.NamedTemporaryFile(
+        "w",
+        dir=data_dir,
+        prefix=f".{CURRENT_POINTER}.",
+        delete=False,
+    ) as f:
+        f.write(pathlib.Path(path).name)
+    os.replace(f.name, data_dir / CURRENT_POINTER)
+    logger.info("snapshot.publish", path=str(path))
+
+
+def prune_snapshots(
+    data_dir: Union[str, pathlib.Path],
+    keep: int = 3,
+) -> list[pathlib.Path]:
+    """Remove all but the newest ``keep`` snapshots, and partial ones.
+
+    The current snapshot is never removed. Readers that already opened a
+    removed snapshot keep reading it until they close it.
+
+    Returns:
+        list[pathlib.Path]: Paths of the removed snapshots.
+
+    """
+    data_dir = pathlib.Path(data_dir)
+    current = get_current_snapshot(data_dir)
+    snapshots = sorted(
+        data_dir.glob(f"{SNAPSHOT_PREFIX}*{SNAPSHOT_SUFFIX}"),
+        reverse=True,
+    )
+    stale = [
+        path
+        for path in [
+            *snapshots[max(keep, 1) :],
+            *data_dir.glob(f"{SNAPSHOT_PREFIX}*{PARTIAL_SUFFIX}"),
+        ]
+        if path != current
+    ]
+    for path in stale:
+        logger.debug("snapshot.prune", path=str(path))
+        path.unlink(missing_ok=True)
+    return stale
+
+
+async def create_snapshot(
+    data_dir: Union[str, pathlib.Path],
+    leagues: list[str],
+    history: bool = False,
+    keep: int = 3,
+    session: Optional[insights.NinjaSession] = None,
+    **kwargs: Any,
+) -> pathlib.Path:
+    """Refresh insights into a new snapshot and publish it.
+
+    The current snapshot, if any, is copied and conditionally refreshed
+    (see :func:`insights.initialize_insights_cache`), so only expired
+    and changed overviews are downloaded. The copy is then repacked, as
+    HDF5 never reclaims the space of replaced overviews, which would
+    otherwise pile up from one snapshot to the next. Extra keyword
+    arguments are passed to :func:`insights.sync_insights`.
+
+    Returns:
+        pathlib.Path: Path of the published snapshot.
+
+    """
+    data_dir = pathlib.Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    if session is None:
+        async with insights.NinjaSession() as session:
+            return await create_snapshot(
+                data_dir=data_dir,
+                leagues=leagues,
+                history=history,
+                keep=keep,
+                session=session,
+                **kwargs,
+            )
+    version = datetime.datetime.now(datetime.timezone.utc).strftime(
+        "%Y%m%dT%H%M%S%f"
+    )
+    path = data_dir / f"{SNAPSHOT_PREFIX}{version}{SNAPSHOT_SUFFIX}"
+    partial_path = path.with_name(path.name + PARTIAL_SUFFIX)
+    current = get_current_snapshot(data_dir)
+    if current is not None and current.exists():
+        shutil.copyfile(current, partial_path)
+    log = logger.bind(path=str(path))
+    log.info("snapshot.create", base=str(current) if current else None)
+    store = storage.HDFInsightsStore(partial_path)
+    try:
+        await insights.sync_insights(
+            leagues=leagues,
+            store=store,
+            session=session,
+            refresh=True,
+            **kwargs,
+        )
+        if history:
+            for league in leagues:
+                await insights.sync_currency_history(
+                    league=league,
+                    store=store,
+                    session=session,
+                )
+    except BaseException:
+        store.close()
+        partial_path.unlink(missing_ok=True)
+        raise
+    store.close()
+    repacked_path = path.with_name(f"{path.name}.repack{PARTIAL_SUFFIX}")
+    try:
+        tables.copy_file(str(partial_path), str(repacked_path), overwrite=True)
+    finally:
+        partial_path.unlink(missing_ok=True)
+    os.replace(repacked_path, path)
+    publish_snapshot(data_dir, path)
+    prune_snapshots(data_dir, keep=keep)
+    return path
+
+
+async def run_refresher(
+    data_dir: Union[str, pathlib.Path],
+    leagues: list[str],
+    interval: float = 300,
+    **kwargs: Any,
+) -> None:
+    """Create a snapshot every ``interval`` seconds, forever.
+
+    A single session is kept open across refreshes. Failed refreshes are
+    logged and retried at the next interval, leaving the current
+    snapshot in place. Extra keyword arguments are passed to
+    :func:`create_snapshot`.
+
+    """
+    async with insights.NinjaSession() as session:
+        while True:
+            started_at = asyncio.get_event_loop().time()
+            try:
+                await create_snapshot(
+                    data_dir=data_dir,
+                    leagues=leagues,
+                    session=session,
+                    **kwargs,
+                )
+            except Exception:
+                logger.exception("snapshot.error")
+            elapsed = asyncio.get_event_loop().time() - started_at
+            await asyncio.sleep(max(interval - elapsed, 0))
@@ -0,0 +1,494 @@
+"""Recording and offline replay of poe.ninja API responses.
+
+Responses are recorded to a directory tree laid out as
+``<path>/<league slug>/<endpoint>/<type>.json`` (or
+``<path>/<league slug>/CurrencyHistory/<type>/<currency ID>.json`` for
+currency histories), containing the raw response bodies.
+:class:`NinjaReplayServer` serves a recording over HTTP with the same
+routes as the poe.ninja API, optionally simulating latency, server
+errors and rate limits, so that syncing, transforming and rendering can
+be benchmarked and tested without network access.
+
+To point wraeblast at a replay server, set ``WRAEBLAST_NINJA_URL`` (or
+:attr:`insights.NinjaConsumer.default_base_url`) to its base URL.
+
+:class:`LocalS3Server` similarly stands in for the subset of S3 used by
+:mod:`wraeblast.transfer`; set ``WRAEBLAST_S3_URL`` to its endpoint URL.
+
+"""
+import asyncio
+import collections
+import email.utils
+import hashlib
+import pathlib
+import random
+import re
+import time
+import uuid
+from typing import Any, Optional, Union
+
+import structlog
+from aiohttp import web
+
+from wraeblast import errors, insights
+
+
+logger = structlog.get_logger()
+
+
+def get_recording_path(
+    path: Union[str, pathlib.Path],
+    league: str,
+    type_: insights.InsightsType,
+    currency_id: Optional[int] = None,
+) -> pathlib.Path:
+    """Get the path of a recorded overview or currency history response."""
+    path = pathlib.Path(path) / insights.get_league_slug(league)
+    if currency_id is not None:
+        return path / "CurrencyHistory" / type_.value / f"{currency_id}.json"
+    return path / insights.get_overview_endpoint(type_) / f"{type_.value}.json"
+
+
+class RateLimiter:
+    """Fixed window rate limiter, equivalent to ``uplink.ratelimit``.
+
+    Args:
+        calls (int): Maximum number of calls allowed per period.
+        period (float): Duration of each period, in seconds.
+
+    """
+
+    def __init__(self, calls: int, period: float) -> None:
+        self.calls = calls
+        self.period = period
+        self._num_calls = 0
+        self._last_reset = time.monotonic()
+
+    @property
+    def period_remaining(self) -> float:
+        return self.period - (time.monotonic() - self._last_reset)
+
+    def check(self) -> bool:
+        """Count a call, returning whether it is within the limit."""
+        if self.period_remaining <= 0:
+            self._num_calls = 0
+            self._last_reset = time.monotonic()
+        self._num_calls += 1
+        return self._num_calls <= self.calls
+
+    async def acquire(self) -> None:
+        """Wait until a call is allowed within the limit."""
+        while not self.check():
+            await asyncio.sleep(max(self.period_remaining, 0))
+
+
+async def record_overviews(
+    league: str,
+    path: Union[str, pathlib.Path],
+    types: Optional[list[insights.InsightsType]] = None,
+    session: Optional[insights.NinjaSession] = None,
+) -> list[pathlib.Path]:
+    """Record raw economy overview responses from poe.ninja to disk.
+
+    Requests are made concurrently, within the rate limits declared in
+    :attr:`insights.NinjaConsumer.ratelimits`.
+
+    Returns:
+        list[pathlib.Path]: Paths of the recorded responses.
+
+    """
+    if types is None:
+        types = insights.get_all_insights_types()
+    if session is None:
+        async with insights.NinjaSession() as session:
+            return await record_overviews(
+                league=league,
+                path=path,
+                types=types,
+                session=session,
+            )
+    limiters = {
+        endpoint: RateLimiter(calls, period)
+        for endpoint, (calls, period) in (
+            insights.NinjaConsumer.ratelimits.items()
+        )
+    }
+
+    async def record(type_: insights.InsightsType) -> pathlib.Path:
+        endpoint = insights.get_overview_endpoint(type_)
+        await limiters[endpoint].acquire()
+        logger.info("overview.record", league=league, type=type_.value)
+        async with session.client_session.get(
+            f"{session.base_url.rstrip('/')}/{endpoint}",
+            params={"league": league, "type": type_.value},
+        ) as response:
+            if response.status != 200:
+                raise errors.UnsuccessfulInsightsRequest(
+                    f"error {response.status}: {response.url}"
+                )
+            body = await response.read()
+        dest = get_recording_path(path, league, type_)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.write_bytes(body)
+        return dest
+
+    return list(await asyncio.gather(*(record(t) for t in types)))
+
+
+def _is_not_modified(
+    request: web.Request,
+    etag: str,
+    last_modified: int,
+) -> bool:
+    # If-Modified-Since is only evaluated without If-None-Match (RFC 7232)
+    if "If-None-Match" in request.headers:
+        return request.headers["If-None-Match"] == etag
+    try:
+        since = email.utils.parsedate_to_datetime(
+            request.headers["If-Modified-Since"]
+        )
+    except (KeyError, TypeError, ValueError):
+        return False
+    return last_modified <= since.timestamp()
+
+
+class NinjaReplayServer:
+    """Local stand-in for the poe.ninja API, replaying recorded responses.
+
+    Responses carry an ``ETag`` and ``Last-Modified`` header derived
+    from the recorded file, and conditional requests are answered with
+    *304 Not Modified* where appropriate.
+
+    Use as an async context manager::
+
+        async with NinjaReplayServer("recordings") as server:
+            async with insights.NinjaSession(server.base_url) as session:
+                ...
+
+    Args:
+        path (str): Root directory of the recorded responses.
+        host (str, optional): Address to listen on.
+        port (int, optional): Port to listen on. By default, a free
+            port is picked.
+        latency (float, optional): Seconds to wait before responding.
+        jitter (float, optional): Maximum random seconds added to
+            ``latency``.
+        error_rate (float, optional): Probability of responding with
+            *503 Service Unavailable*, between 0 and 1.
+        ratelimits (dict, optional): Rate limits per endpoint, as
+            ``(calls, period)``. Requests exceeding the limit are
+            answered with *429 Too Many Requests*. Pass
+            :attr:`insights.NinjaConsumer.ratelimits` to mirror
+            poe.ninja.
+        seed (int, optional): Seed for simulated jitter and errors.
+
+    """
+
+    def __init__(
+        self,
+        path: Union[str, pathlib.Path],
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        ratelimits: Optional[dict[str, tuple[int, int]]] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.path = pathlib.Path(path)
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.limiters = {
+            endpoint: RateLimiter(calls, period)
+            for endpoint, (calls, period) in (ratelimits or {}).items()
+        }
+        #: Number of responses sent, keyed by ``(endpoint, status)``
+        self.stats: collections.Counter[
+            tuple[str, int]
+        ] = collections.Counter()
+        self._random = random.Random(seed)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/api/data/"
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/api/data/{endpoint}", self.handle_overview)
+        return app
+
+    async def handle_overview(self, request: web.Request) -> web.Response:
+        endpoint = request.match_info["endpoint"]
+        response = await self._get_response(request, endpoint)
+        self.stats[(endpoint, response.status)] += 1
+        logger.debug(
+            "replay.response",
+            endpoint=endpoint,
+            type=request.query.get("type"),
+            status=response.status,
+        )
+        return response
+
+    async def _get_response(
+        self,
+        request: web.Request,
+        endpoint: str,
+    ) -> web.Response:
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        limiter = self.limiters.get(endpoint)
+        if limiter is not None and not limiter.check():
+            return web.Response(
+                status=429,
+                headers={"Retry-After": str(int(limiter.period_remaining))},
+            )
+        if self._random.random() < self.error_rate:
+            return web.Response(status=503)
+        try:
+            type_ = insights.get_insights_type_by_value(request.query["type"])
+            if endpoint == "CurrencyHistory":
+                expected_endpoint = "CurrencyOverview"
+                currency_id = int(request.query["currencyId"])
+            else:
+                expected_endpoint = endpoint
+                currency_id = None
+            filename = get_recording_path(
+                self.path,
+                request.query["league"],
+                type_,
+                currency_id=currency_id,
+            )
+        except (KeyError, ValueError):
+            return web.Response(status=400)
+        if (
+            insights.get_overview_endpoint(type_) != expected_endpoint
+            or not filename.exists()
+        ):
+            return web.Response(status=404)
+        body = filename.read_bytes()
+        last_modified = int(filename.stat().st_mtime)
+        headers = {
+            "ETag": f'"{hashlib.sha1(body).hexdigest()}"',
+            "Last-Modified": email.utils.formatdate(
+                last_modified,
+                usegmt=True,
+            ),
+        }
+        if _is_not_modified(request, headers["ETag"], last_modified):
+            return web.Response(status=304, headers=headers)
+        return web.Response(
+            body=body,
+            content_type="application/json",
+            headers=headers,
+        )
+
+    async def start(self) -> "NinjaReplayServer":
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        logger.info("replay.start", base_url=self.base_url)
+        return self
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+            logger.info("replay.stop", base_url=self.base_url)
+
+    async def __aenter__(self) -> "NinjaReplayServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.stop()
+
+
+class LocalS3Server:
+    """In-memory stand-in for the S3 object API, for tests and benchmarks.
+
+    Supports the requests made by boto3 to transfer objects: head, get
+    (including ranged gets of parallel downloads), put, and multipart
+    uploads, with ``ETag`` conditionals. Buckets are created implicitly
+    and requests are not authenticated.
+
+    Args:
+        host (str, optional): Address to listen on.
+        port (int, optional): Port to listen on. By default, a free
+            port is picked.
+
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.host = host
+        self.port = port
+        #: Stored objects, keyed by ``(bucket, key)``, as ``(body, etag)``
+        self.objects: dict[tuple[str, str], tuple[bytes, str]] = {}
+        #: Number of responses sent, keyed by ``(method, status)``
+        self.stats: collections.Counter[
+            tuple[str, int]
+        ] = collections.Counter()
+        self._uploads: dict[str, dict[int, bytes]] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def endpoint_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=1024**3)
+        app.router.add_route("*", "/{bucket}/{key:.+}", self.handle_object)
+        return app
+
+    async def handle_object(self, request: web.Request) -> web.Response:
+        response = await self._get_response(
+            request,
+            request.match_info["bucket"],
+            request.match_info["key"],
+        )
+        self.stats[(request.method, response.status)] += 1
+        logger.debug(
+            "s3.response",
+            method=request.method,
+            path=request.path,
+            status=response.status,
+        )
+        return response
+
+    async def _get_response(
+        self,
+        request: web.Request,
+        bucket: str,
+        key: str,
+    ) -> web.Response:
+        if request.method == "PUT":
+            body = _decode_aws_chunked(request, await request.read())
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            if "uploadId" in request.query:
+                parts = self._uploads[request.query["uploadId"]]
+                parts[int(request.query["partNumber"])] = body
+            else:
+                self.objects[(bucket, key)] = (body, etag)
+            return web.Response(headers={"ETag": etag})
+        elif request.method == "POST" and "uploads" in request.query:
+            upload_id = uuid.uuid4().hex
+            self._uploads[upload_id] = {}
+            return _xml_response(
+                "InitiateMultipartUploadResult",
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+            )
+        elif request.method == "POST" and "uploadId" in request.query:
+            parts = self._uploads.pop(request.query["uploadId"])
+            body = b"".join(parts[n] for n in sorted(parts))
+            digests = b"".join(
+                hashlib.md5(parts[n]).digest() for n in sorted(parts)
+            )
+            etag = f'"{hashlib.md5(digests).hexdigest()}-{len(parts)}"'
+            self.objects[(bucket, key)] = (body, etag)
+            return _xml_response(
+                "CompleteMultipartUploadResult",
+                Bucket=bucket,
+                Key=key,
+                ETag=etag,
+            )
+        elif request.method not in ("GET", "HEAD"):
+            return web.Response(status=405)
+        try:
+            body, etag = self.objects[(bucket, key)]
+        except KeyError:
+            if request.method == "HEAD":
+                return web.Response(status=404)
+            return _xml_response("Error", status=404, Code="NoSuchKey")
+        headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+        if request.headers.get("If-Match", etag) != etag:
+            return web.Response(status=412, headers=headers)
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers=headers)
+        status = 200
+        match = re.fullmatch(
+            r"bytes=(\d+)-(\d*)",
+            request.headers.get("Range", ""),
+        )
+        if match is not None:
+            start = int(match.group(1))
+            end = int(match.group(2) or len(body) - 1)
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+            body = body[start : end + 1]
+            status = 206
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            return web.Response(status=status, headers=headers)
+        return web.Response(
+            status=status,
+            body=body,
+            headers=headers,
+            content_type="binary/octet-stream",
+        )
+
+    async def start(self) -> "LocalS3Server":
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        logger.info("s3.start", endpoint_url=self.endpoint_url)
+        return self
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+            logger.info("s3.stop", endpoint_url=self.endpoint_url)
+
+    async def __aenter__(self) -> "LocalS3Server":
+        return await self.start()
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.stop()
+
+
+def _decode_aws_chunked(request: web.Request, body: bytes) -> bytes:
+    """Decode a streamed upload body, as sent by newer botocore versions."""
+    content_sha256 = request.headers.get("x-amz-content-sha256", "")
+    content_encoding = request.headers.get("Content-Encoding", "")
+    if not (
+        content_sha256.startswith("STREAMING-")
+        or "aws-chunked" in content_encoding
+    ):
+        return body
+    decoded = bytearray()
+    position = 0
+    while True:
+        line_end = body.index(b"\r\n", position)
+        size = int(body[position:line_end].split(b";", 1)[0], 16)
+        if size == 0:
+            return bytes(decoded)
+        position = line_end + 2
+        decoded += body[position : position + size]
+        position += size + 2
+
+
+def _xml_response(
+    root: str,
+    status: int = 200,
+    **elements: str,
+) -> web.Response:
+    children = "".join(
+        f"<{name}>{value}</{name}>" for name, value in elements.items()
+    )
+    return web.Response(
+        status=status,
+        text=(
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<{root} xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f"{children}</{root}>"
+        ),
+        content_type="application/xml",
+    )
@@ -0,0 +1,651 @@
+"""Interchangeable storage backends for the insights cache.
+
+An insights store maps slash-separated keys (e.g. ``l_league/i_Map``) to
+DataFrames, each with an optional JSON metadata string stored alongside
+it. Backends are selected by URL with :func:`open_store`:
+
+* ``hdf5://<path>`` (or a plain path): a PyTables HDF5 file, compressed
+  with blosc/zstd.
+* ``parquet://<path>``: a directory of zstd-compressed Parquet files, one
+  per key, with metadata in JSON sidecar files. Requires ``pyarrow``.
+* ``sqlite://<path>``: an uncompressed SQLite database, one table per key.
+* ``memory://``: an in-process store, discarded when closed.
+
+All backends can read a subset of the columns of a DataFrame (see
+:meth:`InsightsStore.select`).
+
+"""
+import abc
+import json
+import os
+import pathlib
+import sqlite3
+import tempfile
+import time
+from typing import Any, Optional, Union
+
+import pandas as pd
+import structlog
+
+from wraeblast import errors
+
+
+try:
+    import pyarrow.parquet
+
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+logger = structlog.get_logger()
+
+
+def _normalize_key(key: str) -> str:
+    return key.strip("/")
+
+
+def _quote(identifier: str) -> str:
+    return '"{}"'.format(identifier.replace('"', '""'))
+
+
+class InsightsStore(abc.ABC):
+    """Base class of insights cache backends.
+
+    Stores are context managers, closing themselves on exit.
+
+    Args:
+        path (str, optional): Location of the store.
+        mode (str, optional): ``"a"`` to read and write, creating the
+            store as needed, or ``"r"`` to only read.
+
+    """
+
+    #: URL scheme selecting the backend in :func:`open_store`
+    scheme: str
+
+    def __init__(
+        self,
+        path: Optional[Union[str, pathlib.Path]] = None,
+        mode: str = "a",
+    ) -> None:
+        if mode not in ("a", "r"):
+            raise ValueError(f"invalid mode: {mode}")
+        self.path = pathlib.Path(path) if path is not None else None
+        self.mode = mode
+
+    @property
+    def url(self) -> str:
+        return f"{self.scheme}://{self.path or ''}"
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self.url}>"
+
+    def __contains__(self, key: str) -> bool:
+        return _normalize_key(key) in self.keys()
+
+    def __enter__(self) -> "InsightsStore":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _check_writable(self) -> None:
+        if self.mode == "r":
+            raise errors.StorageError(f"{self} is read-only")
+
+    def get(self, key: str) -> pd.DataFrame:
+        """Get the DataFrame stored at ``key``.
+
+        Raises:
+            KeyError: If nothing is stored at ``key``.
+
+        """
+        return self.select(key)
+
+    @abc.abstractmethod
+    def select(
+        self,
+        key: str,
+        columns: Optional[list[str]] = None,
+    ) -> pd.DataFrame:
+        """Get a subset of the columns of the DataFrame at ``key``.
+
+        The index is always included, and requested columns missing from
+        the DataFrame are ignored.
+
+        """
+        ...
+
+    @abc.abstractmethod
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        """Store a DataFrame at ``key``, replacing any existing one."""
+        ...
+
+    def append(
+        self,
+        key: str,
+        df: pd.DataFrame,
+        data_columns: Optional[list[str]] = None,
+        min_itemsize: Optional[dict[str, int]] = None,
+    ) -> None:
+        """Append rows to the DataFrame at ``key``, creating it as needed.
+
+        ``data_columns`` (columns worth indexing for queries) and
+        ``min_itemsize`` (minimum widths of string columns) are hints
+        used by backends that support them.
+
+        """
+        if key in self:
+            df = pd.concat([self.get(key), df])
+        self.put(key, df)
+
+    @abc.abstractmethod
+    def remove(self, key: str) -> None:
+        """Remove the DataFrame at ``key`` and its metadata."""
+        ...
+
+    @abc.abstractmethod
+    def keys(self) -> list[str]:
+        """Get all keys of the store, without leading slashes."""
+        ...
+
+    @abc.abstractmethod
+    def get_metadata(self, key: str) -> Optional[str]:
+        """Get the metadata stored alongside ``key``, if any."""
+        ...
+
+    @abc.abstractmethod
+    def set_metadata(self, key: str, metadata: str) -> None:
+        """Store metadata alongside an existing ``key``.
+
+        Raises:
+            KeyError: If nothing is stored at ``key``.
+
+        """
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+class HDFInsightsStore(InsightsStore):
+    """PyTables HDF5 backend, storing metadata in node attributes."""
+
+    scheme = "hdf5"
+    #: Compression library and level of stored tables (higher zstd levels
+    #: are several times slower to write, for no noticeable gain)
+    complib = "blosc:zstd"
+    complevel = 5
+
+    def __init__(
+        self,
+        path: Union[str, pathlib.Path],
+        mode: str = "a",
+    ) -> None:
+        super().__init__(path, mode)
+        self._store = pd.HDFStore(str(path), mode=mode)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._store
+
+    def select(
+        self,
+        key: str,
+        columns: Optional[list[str]] = None,
+    ) -> pd.DataFrame:
+        return self._store.select(key, columns=columns)
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        self._check_writable()
+        self._store.put(
+            key,
+            df,
+            format="table",
+            complib=self.complib,
+            complevel=self.complevel,
+        )
+
+    def append(
+        self,
+        key: str,
+        df: pd.DataFrame,
+        data_columns: Optional[list[str]] = None,
+        min_itemsize: Optional[dict[str, int]] = None,
+    ) -> None:
+        self._check_writable()
+        self._store.append(
+            key,
+            df,
+            format="table",
+            data_columns=data_columns,
+            min_itemsize=min_itemsize,
+            complib=self.complib,
+            complevel=self.complevel,
+        )
+
+    def remove(self, key: str) -> None:
+        self._check_writable()
+        self._store.remove(key)
+
+    def keys(self) -> list[str]:
+        return [_normalize_key(key) for key in self._store.keys()]
+
+    def get_metadata(self, key: str) -> Optional[str]:
+        try:
+            attrs = self._store.get_storer(key).attrs
+        except KeyError:
+            return None
+        return getattr(attrs, "wraeblast_metadata", None)
+
+    def set_metadata(self, key: str, metadata: str) -> None:
+        self._check_writable()
+        self._store.get_storer(key).attrs.wraeblast_metadata = metadata
+
+    def close(self) -> None:
+        self._store.close()
+
+
+class ParquetInsightsStore(InsightsStore):
+    """Directory of Parquet files, one per key.
+
+    Files are written to a temporary name and renamed into place, so
+    concurrent readers only ever see complete files.
+
+    """
+
+    scheme = "parquet"
+    #: Compression codec of stored files
+    compression = "zstd"
+
+    def __init__(
+        self,
+        path: Union[str, pathlib.Path],
+        mode: str = "a",
+    ) -> None:
+        if not PYARROW_AVAILABLE:
+            raise errors.StorageError(
+                "pyarrow is required for Parquet insights stores"
+            )
+        super().__init__(path, mode)
+        if mode != "r":
+            pathlib.Path(path).mkdir(parents=True, exist_ok=True)
+
+    def _get_path(self, key: str, suffix: str = ".parquet") -> pathlib.Path:
+        assert self.path is not None
+        return self.path / f"{_normalize_key(key)}{suffix}"
+
+    def _write_atomic(
+        self,
+        path: pathlib.Path,
+        write: Any,
+    ) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(
+            dir=path.parent,
+            prefix=f".{path.name}.",
+        )
+        os.close(fd)
+        try:
+            write(temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def __contains__(self, key: str) -> bool:
+        return self._get_path(key).exists()
+
+    def select(
+        self,
+        key: str,
+        columns: Optional[list[str]] = None,
+    ) -> pd.DataFrame:
+        path = self._get_path(key)
+        if not path.exists():
+            raise KeyError(key)
+        if columns is not None:
+            names = pyarrow.parquet.read_schema(path).names
+            columns = [column for column in columns if column in names]
+        return pd.read_parquet(path, columns=columns)
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        self._check_writable()
+        self._write_atomic(
+            self._get_path(key),
+            lambda path: df.to_parquet(
+                path,
+                engine="pyarrow",
+                compression=self.compression,
+            ),
+        )
+        self._get_path(key, ".json").unlink(missing_ok=True)
+
+    def remove(self, key: str) -> None:
+        self._check_writable()
+        if key not in self:
+            raise KeyError(key)
+        self._get_path(key).unlink()
+        self._get_path(key, ".json").unlink(missing_ok=True)
+
+    def keys(self) -> list[str]:
+        assert self.path is not None
+        return sorted(
+            path.relative_to(self.path).with_suffix("").as_posix()
+            for path in self.path.rglob("*.parquet")
+        )
+
+    def get_metadata(self, key: str) -> Optional[str]:
+        try:
+            return self._get_path(key, ".json").read_text()
+        except FileNotFoundError:
+            return None
+
+    def set_metadata(self, key: str, metadata: str) -> None:
+        self._check_writable()
+        if key not in self:
+            raise KeyError(key)
+        self._write_atomic(
+            self._get_path(key, ".json"),
+            lambda path: pathlib.Path(path).write_text(metadata),
+        )
+
+
+class SQLiteInsightsStore(InsightsStore):
+    """SQLite database, with one table per key.
+
+    Column dtypes and index names are kept in a ``wraeblast_keys``
+    table alongside metadata, and restored on read. Each write is a
+    single transaction, and the database is in WAL mode, so concurrent
+    readers neither block nor see partial writes.
+
+    """
+
+    scheme = "sqlite"
+
+    def __init__(
+        self,
+        path: Union[str, pathlib.Path],
+        mode: str = "a",
+    ) -> None:
+        super().__init__(path, mode)
+        if mode == "r":
+            self._con = sqlite3.connect(
+                f"{pathlib.Path(path).absolute().as_uri()}?mode=ro",
+                uri=True,
+            )
+            return
+        self._con = sqlite3.connect(str(path))
+        with self._con:
+            self._con.execute("PRAGMA journal_mode=WAL")
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS wraeblast_keys ("
+                "key TEXT PRIMARY KEY, dtypes TEXT, index_names TEXT, "
+                "metadata TEXT)"
+            )
+
+    def _get_entry(self, key: str) -> tuple[str, str, Optional[str]]:
+        try:
+            row = self._con.execute(
+                "SELECT dtypes, index_names, metadata FROM wraeblast_keys "
+                "WHERE key = ?",
+                (_normalize_key(key),),
+            ).fetchone()
+        except sqlite3.OperationalError:
+            # Read-only and empty
+            row = None
+        if row is None:
+            raise KeyError(key)
+        return row
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            self._get_entry(key)
+        except KeyError:
+            return False
+        return True
+
+    def select(
+        self,
+        key: str,
+        columns: Optional[list[str]] = None,
+    ) -> pd.DataFrame:
+        dtypes, index_names = (json.loads(s) for s in self._get_entry(key)[:2])
+        index_columns = [
+            name if name is not None else "index" for name in index_names
+        ]
+        if columns is not None:
+            dtypes = {
+                column: dtype
+                for column, dtype in dtypes.items()
+                if column in columns or column in index_columns
+            }
+        selected = ", ".join(_quote(column) for column in dtypes)
+        df = pd.read_sql_query(
+            f"SELECT {selected} FROM {_quote(_normalize_key(key))}",
+            self._con,
+        ).astype(dtypes)
+        if index_columns:
+            df = df.set_index(index_columns)
+            df.index.names = index_names
+        return df
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        self._check_writable()
+        key = _normalize_key(key)
+        if isinstance(df.index, pd.RangeIndex):
+            index_names = []
+            df = df.reset_index(drop=True)
+        else:
+            index_names = list(df.index.names)
+            df = df.reset_index()
+        dtypes = {column: str(dtype) for column, dtype in df.dtypes.items()}
+        values = df.astype(object).where(df.notna(), None)
+        for column, dtype in dtypes.items():
+            if dtype.startswith("datetime64"):
+                values[column] = df[column].astype(str)
+        table = _quote(key)
+        with self._con:
+            self._con.execute(f"DROP TABLE IF EXISTS {table}")
+            self._con.execute(
+                f"CREATE TABLE {table} "
+                f"({', '.join(_quote(column) for column in dtypes)})"
+            )
+            self._con.executemany(
+                f"INSERT INTO {table} VALUES "
+                f"({', '.join('?' * len(dtypes))})",
+                values.itertuples(index=False, name=None),
+            )
+            self._con.execute(
+                "INSERT INTO wraeblast_keys (key, dtypes, index_names) "
+                "VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                "dtypes = excluded.dtypes, "
+                "index_names = excluded.index_names, metadata = NULL",
+                (key, json.dumps(dtypes), json.dumps(index_names)),
+            )
+
+    def remove(self, key: str) -> None:
+        self._check_writable()
+        self._get_entry(key)
+        with self._con:
+            self._con.execute(f"DROP TABLE {_quote(_normalize_key(key))}")
+            self._con.execute(
+                "DELETE FROM wraeblast_keys WHERE key = ?",
+                (_normalize_key(key),),
+            )
+
+    def keys(self) -> list[str]:
+        try:
+            return [
+                key
+                for (key,) in self._con.execute(
+                    "SELECT key FROM wraeblast_keys ORDER BY key"
+                )
+            ]
+        except sqlite3.OperationalError:
+            return []
+
+    def get_metadata(self, key: str) -> Optional[str]:
+        try:
+            return self._get_entry(key)[2]
+        except KeyError:
+            return None
+
+    def set_metadata(self, key: str, metadata: str) -> None:
+        self._check_writable()
+        self._get_entry(key)
+        with self._con:
+            self._con.execute(
+                "UPDATE wraeblast_keys SET metadata = ? WHERE key = ?",
+                (metadata, _normalize_key(key)),
+            )
+
+    def close(self) -> None:
+        self._con.close()
+
+
+class MemoryInsightsStore(InsightsStore):
+    """In-process store, mainly for tests and benchmarks."""
+
+    scheme = "memory"
+
+    def __init__(
+        self,
+        path: Optional[Union[str, pathlib.Path]] = None,
+        mode: str = "a",
+    ) -> None:
+        super().__init__(path or None, mode)
+        self._data: dict[str, pd.DataFrame] = {}
+        self._metadata: dict[str, str] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return _normalize_key(key) in self._data
+
+    def select(
+        self,
+        key: str,
+        columns: Optional[list[str]] = None,
+    ) -> pd.DataFrame:
+        df = self._data[_normalize_key(key)]
+        if columns is not None:
+            df = df[[column for column in columns if column in df.columns]]
+        return df.copy()
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        self._check_writable()
+        self._data[_normalize_key(key)] = df.copy()
+        self._metadata.pop(_normalize_key(key), None)
+
+    def remove(self, key: str) -> None:
+        self._check_writable()
+        del self._data[_normalize_key(key)]
+        self._metadata.pop(_normalize_key(key), None)
+
+    def keys(self) -> list[str]:
+        return sorted(self._data)
+
+    def get_metadata(self, key: str) -> Optional[str]:
+        return self._metadata.get(_normalize_key(key))
+
+    def set_metadata(self, key: str, metadata: str) -> None:
+        self._check_writable()
+        if key not in self:
+            raise KeyError(key)
+        self._metadata[_normalize_key(key)] = metadata
+
+
+#: Insights store backends, keyed by URL scheme
+backends: dict[str, type[InsightsStore]] = {
+    backend.scheme: backend
+    for backend in (
+        HDFInsightsStore,
+        ParquetInsightsStore,
+        SQLiteInsightsStore,
+        MemoryInsightsStore,
+    )
+}
+
+
+def open_store(url: str, mode: str = "a") -> InsightsStore:
+    """Open an insights store by URL.
+
+    URLs are ``<scheme>://<path>``, where the scheme is one of
+    :data:`backends`. Plain paths open HDF5 stores.
+
+    """
+    for scheme, backend in backends.items():
+        prefix = f"{scheme}://"
+        if url.startswith(prefix):
+            path = url[len(prefix) :]
+            break
+    else:
+        if "://" in url:
+            raise errors.StorageError(f"unsupported insights store: {url}")
+        backend, path = HDFInsightsStore, url
+    logger.debug("store.open", backend=backend.scheme, path=path, mode=mode)
+    return backend(path, mode=mode)  # type: ignore
+
+
+def benchmark_stores(
+    frames: dict[str, pd.DataFrame],
+    urls: list[str],
+    key: Optional[str] = None,
+    repeat: int = 3,
+) -> pd.DataFrame:
+    """Time writing and reading the same data with several backends.
+
+    Each URL must point to a fresh location, which is overwritten on
+    every repetition. Reads reopen the store, so include opening costs.
+
+    Args:
+        frames (dict): DataFrames to store, keyed by store key.
+        urls (list[str]): Store URLs to benchmark.
+        key (str, optional): Key to time single-category reads with.
+            Defaults to the key of the largest DataFrame.
+        repeat (int, optional): Number of repetitions, of which the
+            fastest time is reported.
+
+    Returns:
+        pd.DataFrame: Best *write*, *read_all* and *read_one* times in
+        seconds, indexed by backend URL.
+
+    """
+    if key is None:
+        key = max(frames, key=lambda k: len(frames[k]))
+    results = {}
+    for url in urls:
+        timings: dict[str, list[float]] = {
+            "write": [],
+            "read_all": [],
+            "read_one": [],
+        }
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            store = open_store(url)
+            for k in store.keys():
+                store.remove(k)
+            for k, df in frames.items():
+                store.put(k, df)
+            if isinstance(store, MemoryInsightsStore):
+                reader_store = store
+            else:
+                store.close()
+                reader_store = None
+            timings["write"].append(time.perf_counter() - started_at)
+
+            started_at = time.perf_counter()
+            reader = reader_store or open_store(url, mode="r")
+            for k in frames:
+                reader.get(k)
+            timings["read_all"].append(time.perf_counter() - started_at)
+
+            started_at = time.perf_counter()
+            if reader_store is None:
+                reader.close()
+                reader = open_store(url, mode="r")
+            reader.get(key)
+            reader.close()
+            timings["read_one"].append(time.perf_counter() - started_at)
+        results[url] = {name: min(times) for name, times in timings.items()}
+        logger.info("store.benchmark", url=url, **results[url])
+    return pd.DataFrame.from_dict(results, orient="index")
@@ -0,0 +1,218 @@
+"""S3 transfers of insights stores, through a local content-addressed cache.
+
+Downloaded objects are cached locally, keyed by their bucket, key and
+``ETag``. Later downloads of the same object only revalidate the cached
+copy with a ``HEAD`` request, so repeated renders against an unchanged
+store never transfer it again. Uploaded stores are added to the cache
+under their new ``ETag``, so renders following a sync also hit the cache.
+
+Large objects are transferred in parts, in parallel. Set
+``WRAEBLAST_S3_URL`` to use an S3-compatible endpoint other than AWS
+(e.g. :class:`wraeblast.replay.LocalS3Server`), and ``WRAEBLAST_S3_CACHE``
+to change the cache directory.
+
+"""
+import hashlib
+import os
+import pathlib
+import shutil
+import tempfile
+import time
+from typing import TYPE_CHECKING, Optional, Union
+
+import boto3
+import boto3.s3.transfer
+import structlog
+
+from wraeblast import errors
+
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3.client import S3Client
+
+
+logger = structlog.get_logger()
+
+#: Objects larger than this many bytes are transferred in parallel parts
+multipart_threshold = 16 * 1024**2
+
+#: Size in bytes of the parts of multipart transfers
+multipart_chunksize = 16 * 1024**2
+
+#: Maximum number of parts transferred concurrently
+max_concurrency = 8
+
+#: Number of times a download is retried if the object changes meanwhile
+max_download_attempts = 3
+
+#: Other versions of an object are only pruned from the cache once unused
+#: for this many seconds, as other processes may still be reading them
+cache_grace_period = 60 * 60
+
+
+def get_cache_dir() -> pathlib.Path:
+    return pathlib.Path(
+        os.getenv(
+            "WRAEBLAST_S3_CACHE",
+            pathlib.Path.home() / ".cache" / "wraeblast" / "s3",
+        )
+    )
+
+
+def create_client() -> "S3Client":
+    return boto3.client(
+        "s3",
+        endpoint_url=os.getenv("WRAEBLAST_S3_URL") or None,
+    )
+
+
+def get_transfer_config() -> boto3.s3.transfer.TransferConfig:
+    return boto3.s3.transfer.TransferConfig(
+        multipart_threshold=multipart_threshold,
+        multipart_chunksize=multipart_chunksize,
+        max_concurrency=max_concurrency,
+    )
+
+
+def parse_s3_url(url: str) -> tuple[str, str]:
+    """Split an ``s3://<bucket>/<key>`` URL into its bucket and key."""
+    if not url.startswith("s3://") or "/" not in url[5:]:
+        raise errors.WraeblastError(f"invalid S3 URL: {url}")
+    bucket, key = url[5:].split("/", 1)
+    return bucket, key
+
+
+def get_cache_path(
+    cache_dir: Union[str, pathlib.Path],
+    bucket: str,
+    key: str,
+    etag: str,
+) -> pathlib.Path:
+    """Get the cache path of a version of an S3 object.
+
+    All cached versions of an object share a directory, so that unused
+    versions can be pruned when a new one is cached.
+
+    """
+    object_id = hashlib.sha1(f"{bucket}/{key}".encode()).hexdigest()
+    filename = etag.strip('"') + pathlib.PurePosixPath(key).suffix
+    return pathlib.Path(cache_dir) / object_id / filename
+
+
+def _head_etag(client: "S3Client", bucket: str, key: str) -> str:
+    return client.head_object(Bucket=bucket, Key=key)["ETag"]
+
+
+def _add_to_cache(
+    path: pathlib.Path,
+    cache_path: pathlib.Path,
+) -> None:
+    """Move a file into the cache, pruning unused versions of the object.
+
+    Versions are pruned once last used (i.e. cached or returned by
+    :func:`download`) more than :data:`cache_grace_period` seconds ago.
+
+    """
+    os.replace(path, cache_path)
+    expiry = time.time() - cache_grace_period
+    for stale_path in cache_path.parent.iterdir():
+        if stale_path == cache_path or stale_path.name.startswith("."):
+            continue
+        try:
+            if stale_path.stat().st_mtime >= expiry:
+                continue
+        except FileNotFoundError:
+            continue
+        logger.debug("s3.cache.prune", path=str(stale_path))
+        stale_path.unlink(missing_ok=True)
+
+
+def download(
+    url: str,
+    cache_dir: Optional[Union[str, pathlib.Path]] = None,
+    client: Optional["S3Client"] = None,
+) -> pathlib.Path:
+    """Get a local copy of an S3 object, downloading it only if needed.
+
+    The returned file is shared with other processes using the same
+    cache, and must not be modified; copy it first to write to it.
+
+    Raises:
+        botocore.exceptions.ClientError: If the object does not exist.
+
+    """
+    bucket, key = parse_s3_url(url)
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    if client is None:
+        client = create_client()
+    log = logger.bind(bucket=bucket, key=key)
+    etag = _head_etag(client, bucket, key)
+    for _ in range(max_download_attempts):
+        cache_path = get_cache_path(cache_dir, bucket, key, etag)
+        try:
+            # Mark the cached copy as used, so that it is not pruned yet
+            os.utime(cache_path)
+        except FileNotFoundError:
+            pass
+        else:
+            log.info("s3.cache.hit", etag=etag)
+            return cache_path
+        log.info("s3.download", etag=etag)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(
+            dir=cache_path.parent,
+            prefix=f".{cache_path.name}.",
+        )
+        os.close(fd)
+        try:
+            client.download_file(
+                bucket,
+                key,
+                temp_path,
+                Config=get_transfer_config(),
+            )
+            # The object may have been replaced since it was revalidated
+            downloaded_etag = _head_etag(client, bucket, key)
+            if downloaded_etag == etag:
+                _add_to_cache(pathlib.Path(temp_path), cache_path)
+                return cache_path
+        finally:
+            pathlib.Path(temp_path).unlink(missing_ok=True)
+        etag = downloaded_etag
+    raise errors.WraeblastError(f"{url} changed during every download")
+
+
+def upload(
+    path: Union[str, pathlib.Path],
+    url: str,
+    cache_dir: Optional[Union[str, pathlib.Path]] = None,
+    client: Optional["S3Client"] = None,
+) -> str:
+    """Upload a file to S3, caching it as the object's latest version.
+
+    Returns:
+        str: ``ETag`` of the uploaded object.
+
+    """
+    bucket, key = parse_s3_url(url)
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    if client is None:
+        client = create_client()
+    logger.info("s3.upload", bucket=bucket, key=key)
+    client.upload_file(str(path), bucket, key, Config=get_transfer_config())
+    etag = _head_etag(client, bucket, key)
+    cache_path = get_cache_path(cache_dir, bucket, key, etag)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(
+        dir=cache_path.parent,
+        prefix=f".{cache_path.name}.",
+    )
+    os.close(fd)
+    try:
+        shutil.copyfile(path, temp_path)
+        _add_to_cache(pathlib.Path(temp_path), cache_path)
+    finally:
+        pathlib.Path(temp_path).unlink(missing_ok=True)
+    return etag